@@ -5,8 +5,10 @@ from .cloudtrail import CloudtrailCollector
 from .flowlogs import FlowLogCollector
 import logging
 import boto3
+import botocore.session
 import time
 import traceback
+from botocore.credentials import RefreshableCredentials
 from botocore.exceptions import ClientError
 from schematics import Model
 from schematics.types import StringType, ListType, DictType, IntType
@@ -18,6 +20,8 @@ from datetime import datetime, timedelta
 import pytz
 import concurrent.futures
 import threading
+import itertools
+from collections import OrderedDict, defaultdict
 
 
 DEFAULT_BOTO3_RETRIES_COUNT = 50
@@ -30,6 +34,9 @@ DEFAULT_BOTO3_CONFIG = Config(
 
 DEFAULT_COLLECTION_INTERVAL = 60
 
+# used when STS does not return an expiration, the default duration of an assumed role
+DEFAULT_CREDENTIALS_DURATION = timedelta(hours=1)
+
 
 class InitConfig(Model):
     aws_access_key_id = StringType(required=True)
@@ -58,6 +65,10 @@ class AwsTopologyCheck(AgentCheck):
 
     INSTANCE_SCHEMA = InstanceInfo
 
+    def __init__(self, *args, **kwargs):
+        super(AwsTopologyCheck, self).__init__(*args, **kwargs)
+        self.aws_client = None
+
     @staticmethod
     def get_account_id(instance_info):
         return instance_info.role_arn.split(":")[4]
@@ -83,7 +94,10 @@ class AwsTopologyCheck(AgentCheck):
         try:
             init_config = InitConfig(self.init_config)
             init_config.validate()
-            aws_client = AwsClient(init_config)
+            # the client is kept across runs so the assumed-role sessions are reused until they almost expire
+            if self.aws_client is None:
+                self.aws_client = AwsClient(init_config)
+            aws_client = self.aws_client
             self.service_check(self.SERVICE_CHECK_CONNECT_NAME, AgentCheck.OK, tags=instance_info.tags)
         except Exception as e:
             msg = "AWS connection failed: {}".format(e)
@@ -279,26 +293,34 @@ class AgentProxy(object):
         self.agent = agent
         self.delete_ids = []
         self.components_seen = set()
-        self.parked_relations = []
+        # relations waiting for their source and/or target component, in the order they were parked
+        self.parked_relations = OrderedDict()
+        # component id -> keys of the parked relations that wait for this component
+        self.parked_relations_index = defaultdict(list)
+        self.parked_relations_keys = itertools.count()
+        self.relations_parked = 0
+        self.relations_unparked = 0
         self.role_name = role_name
         self.warnings = {}
         self.lock = threading.Lock()
         self.log = log
 
     def component(self, location, id, type, data, streams=None, checks=None):
-        self.components_seen.add(id)
         data.update(location.to_primitive())
         self.agent.component(id, type, correct_tags(capitalize_keys(data)), streams, checks)
         relations_to_send = []
         with self.lock:
-            for i in range(len(self.parked_relations) - 1, -1, -1):
-                relation = self.parked_relations[i]
-                if relation["source_id"] == id and relation["target_id"] in self.components_seen:
-                    relations_to_send.append(relation)
-                    self.parked_relations.remove(relation)
-                if relation["target_id"] == id and relation["source_id"] in self.components_seen:
-                    self.parked_relations.remove(relation)
+            self.components_seen.add(id)
+            for key in reversed(self.parked_relations_index.pop(id, [])):
+                relation = self.parked_relations.get(key)
+                # the relation was already sent when the other side was registered
+                if relation is None:
+                    continue
+                other_id = relation["target_id"] if relation["source_id"] == id else relation["source_id"]
+                if other_id in self.components_seen:
+                    del self.parked_relations[key]
                     relations_to_send.append(relation)
+            self.relations_unparked += len(relations_to_send)
         for relation in relations_to_send:
             self.agent.relation(
                 relation["source_id"], relation["target_id"], relation["type"],
@@ -306,16 +328,26 @@ class AgentProxy(object):
             )
 
     def relation(self, source_id, target_id, type, data, streams=None, checks=None):
-        if source_id in self.components_seen and target_id in self.components_seen:
-            self.agent.relation(source_id, target_id, type, data, streams, checks)
-        else:
-            self.parked_relations.append(
-                {"type": type, "source_id": source_id, "target_id": target_id,
-                 "data": data, 'streams': streams, 'checks': checks}
-            )
+        with self.lock:
+            missing_ids = {source_id, target_id} - self.components_seen
+            if missing_ids:
+                key = next(self.parked_relations_keys)
+                self.parked_relations[key] = {"type": type, "source_id": source_id, "target_id": target_id,
+                                              "data": data, 'streams': streams, 'checks': checks}
+                for missing_id in missing_ids:
+                    self.parked_relations_index[missing_id].append(key)
+                self.relations_parked += 1
+                return
+        self.agent.relation(source_id, target_id, type, data, streams, checks)
+
+    @property
+    def relations_never_resolved(self):
+        return len(self.parked_relations)
 
     def finalize_account_topology(self):
-        for relation in self.parked_relations:
+        self.log.info('Relations parked: {}, unparked: {}, never resolved: {}'.format(
+            self.relations_parked, self.relations_unparked, self.relations_never_resolved))
+        for relation in self.parked_relations.values():
             self.agent.relation(relation["source_id"], relation["target_id"], relation["type"], relation["data"])
         for warning in self.warnings:
             self.agent.warning(warning + " was encountered {} time(s).".format(self.warnings[warning]))
@@ -357,6 +389,9 @@ class AwsClient:
         self.external_id = config.external_id
         self.aws_access_key_id = config.aws_access_key_id
         self.aws_secret_access_key = config.aws_secret_access_key
+        # role ARN --> refreshable credentials and the session per region
+        self.roles = {}
+        self.lock = threading.Lock()
 
         if self.aws_secret_access_key and self.aws_access_key_id:
             self.sts_client = boto3.client(
@@ -373,6 +408,47 @@ class AwsClient:
                 raise Exception("No credentials found, the following exception was given: %s" % e)
 
     def get_session(self, role_arn, region):
+        """
+        Returns a session for the region, the assumed-role credentials are shared by all regions of the role.
+        botocore checks the credentials each time they are used and assumes the role again shortly before they
+        expire, so a long running collection never uses expired credentials.
+        """
+        with self.lock:
+            role = self.roles.get(role_arn)
+            if role is None:
+                credentials = RefreshableCredentials.create_from_metadata(
+                    metadata=self._assume_role_metadata(role_arn),
+                    refresh_using=lambda: self._assume_role_metadata(role_arn),
+                    method="assume-role",
+                )
+                role = self.roles[role_arn] = {"credentials": credentials, "sessions": {}}
+            session = role["sessions"].get(region)
+            if session is None:
+                botocore_session = botocore.session.Session()
+                botocore_session._credentials = role["credentials"]
+                session = role["sessions"][region] = boto3.Session(
+                    botocore_session=botocore_session,
+                    region_name=region if region != "global" else "us-east-1",
+                )
+            return session
+
+    def _assume_role_metadata(self, role_arn):
+        """
+        Assumes the role and returns the credentials in the format of the botocore refreshable credentials
+        """
+        credentials = self.assume_role(role_arn)
+        expiration = credentials.get("Expiration") or \
+            datetime.utcnow().replace(tzinfo=pytz.utc) + DEFAULT_CREDENTIALS_DURATION
+        if expiration.tzinfo is None:
+            expiration = expiration.replace(tzinfo=pytz.utc)
+        return {
+            "access_key": credentials["AccessKeyId"],
+            "secret_key": credentials["SecretAccessKey"],
+            "token": credentials["SessionToken"],
+            "expiry_time": expiration.isoformat(),
+        }
+
+    def assume_role(self, role_arn):
         try:
             # This should fail as it means it was able to successfully use the role without an external ID
             role = self.sts_client.assume_role(RoleArn=role_arn, RoleSessionName="sts-agent-id-test")
@@ -385,16 +461,11 @@ class AwsClient:
             if error.response["Error"]["Code"] == "AccessDenied":
                 try:
                     role = self.sts_client.assume_role(
-                        RoleArn=role_arn, RoleSessionName="sts-agent-check-%s" % region, ExternalId=self.external_id
+                        RoleArn=role_arn, RoleSessionName="sts-agent-check", ExternalId=self.external_id
                     )
                 except Exception as error:
                     raise Exception("Unable to assume role %s. Error: %s" % (role_arn, error))
             else:
                 raise error
-
-        return boto3.Session(
-            region_name=region if region != "global" else "us-east-1",
-            aws_access_key_id=role["Credentials"]["AccessKeyId"],
-            aws_secret_access_key=role["Credentials"]["SecretAccessKey"],
-            aws_session_token=role["Credentials"]["SessionToken"],
-        )
+        self.log.debug("Assumed role %s" % role_arn)
+        return role["Credentials"]
@@ -1,4 +1,6 @@
 import json
+import concurrent.futures
+from collections import deque
 import dateutil.parser
 import pytz
 from datetime import datetime
@@ -11,9 +13,29 @@ try:
 except AttributeError:  # Python 2
     JSONParseException = ValueError
 
+WHITESPACE = re.compile(r"\s*")
+
+
+def iter_json_records(txt, decoder=None):
+    """
+    Yields the JSON records that are concatenated (optionally separated by whitespace) in txt.
+    The text is decoded in place, decoding stops at the first record that is not valid JSON.
+    """
+    decoder = decoder or json.JSONDecoder()
+    end = len(txt)
+    idx = WHITESPACE.match(txt, 0).end()
+    while idx < end:
+        try:
+            obj, idx = decoder.raw_decode(txt, idx)
+        except JSONParseException:
+            return
+        yield obj
+        idx = WHITESPACE.match(txt, idx).end()
+
 
 class CloudtrailCollector(object):
     MAX_S3_DELETES = 999
+    MAX_S3_WORKERS = 5
 
     def __init__(self, bucket_name, account_id, session, agent, log):
         self.bucket_name = bucket_name
@@ -106,27 +128,49 @@ class CloudtrailCollector(object):
 
     def _process_files(self, client, bucket_name, files):
         self.log.info("Starting processing of {} S3 objects".format(len(files)))
-        for file in reversed(files):
-            self.log.info("Starting processing of object {}".format(file))
-            objects = []
-            s3_body = client.get_object(Bucket=bucket_name, Key=file).get("Body")
-            with get_stream_from_s3body(s3_body) as data:
-                decoder = json.JSONDecoder()
-                txt = data.read().decode("ascii")
-                while txt:
-                    try:
-                        obj, index = decoder.raw_decode(txt)
-                        txt = txt[index:]
-                        msg_type = obj.get("detail-type", "")
-                        detail = obj.get("detail", {})
-                        if msg_type == "EC2 Instance State-change Notification":
-                            detail["eventSource"] = "ec2.amazonaws.com"
-                            detail["eventName"] = "InstanceStateChangeNotification"
-                        if detail:
-                            objects.append(obj["detail"])
-                    except JSONParseException:
-                        txt = ""
-            self.log.info("Object {} contained {} events".format(file, len(objects)))
-            for event in reversed(objects):
-                yield event
-            self._delete_files(client, bucket_name, [{"Key": file}])
+        processed = []
+        try:
+            # objects are fetched and decoded by a bounded pool, at most MAX_S3_WORKERS objects are held in memory
+            # ahead of the consumer. Events are yielded most recent object first.
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.MAX_S3_WORKERS) as executor:
+                pending = deque()
+                keys = iter(reversed(files))
+
+                def submit_next():
+                    file = next(keys, None)
+                    if file is not None:
+                        pending.append((file, executor.submit(self._get_events_from_file, client, bucket_name, file)))
+
+                for _ in range(self.MAX_S3_WORKERS):
+                    submit_next()
+                while pending:
+                    file, future = pending.popleft()
+                    objects = future.result()
+                    submit_next()
+                    self.log.info("Object {} contained {} events".format(file, len(objects)))
+                    for event in reversed(objects):
+                        yield event
+                    processed.append({"Key": file})
+                    if len(processed) >= self.MAX_S3_DELETES:
+                        self._delete_files(client, bucket_name, processed)
+                        processed = []
+        finally:
+            # the objects of which all events were consumed are deleted, also when fetching a later object failed or
+            # the consumer stopped early, so their events are not sent again in the next run
+            self._delete_files(client, bucket_name, processed)
+
+    def _get_events_from_file(self, client, bucket_name, file):
+        self.log.info("Starting processing of object {}".format(file))
+        objects = []
+        s3_body = client.get_object(Bucket=bucket_name, Key=file).get("Body")
+        with get_stream_from_s3body(s3_body) as data:
+            txt = data.read().decode("utf-8")
+        for obj in iter_json_records(txt):
+            msg_type = obj.get("detail-type", "")
+            detail = obj.get("detail", {})
+            if msg_type == "EC2 Instance State-change Notification":
+                detail["eventSource"] = "ec2.amazonaws.com"
+                detail["eventName"] = "InstanceStateChangeNotification"
+            if detail:
+                objects.append(obj["detail"])
+        return objects
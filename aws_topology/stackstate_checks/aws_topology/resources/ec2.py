@@ -1,5 +1,7 @@
 from collections import namedtuple
+import threading
 import time
+from botocore.exceptions import ClientError
 from .utils import (
     client_array_operation,
     make_valid_data,
@@ -17,6 +19,56 @@ from schematics.types import StringType, ModelType, ListType, BooleanType
 
 InstanceData = namedtuple("InstanceData", ["instance", "instance_type"])
 
+# DescribeInstanceTypes accepts at most 100 instance types per request
+INSTANCE_TYPES_BATCH_SIZE = 100
+# Instance types are only added by AWS, the catalog of a region is fetched again once a day
+INSTANCE_TYPE_CATALOG_TTL = 24 * 60 * 60
+
+
+class InstanceTypeCatalog(object):
+    """
+    Thread safe catalog of the instance type details per region, kept across check runs.
+    The types of a region are dropped when the TTL expired, unknown types are fetched when they are first seen.
+    """
+
+    def __init__(self, ttl=INSTANCE_TYPE_CATALOG_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._regions = {}
+
+    def get_missing(self, region, instance_types):
+        """
+        Returns the instance types that are not in the catalog of the region, sorted so requests are repeatable.
+        """
+        with self._lock:
+            catalog = self._regions.get(region)
+            if catalog is None or time.time() - catalog["fetched_at"] > self.ttl:
+                catalog = self._regions[region] = {"fetched_at": time.time(), "types": {}}
+            return sorted(set(instance_types) - set(catalog["types"]))
+
+    def update(self, region, instance_types, instance_type_data):
+        """
+        Stores the details of the requested `instance_types`, types without details are stored as empty so they
+        are not requested again until the TTL expires.
+        """
+        with self._lock:
+            catalog = self._regions.setdefault(region, {"fetched_at": time.time(), "types": {}})
+            for instance_type in instance_types:
+                catalog["types"].setdefault(instance_type, {})
+            for data in instance_type_data:
+                catalog["types"][data.get("InstanceType")] = data
+
+    def get(self, region, instance_type):
+        with self._lock:
+            return self._regions.get(region, {}).get("types", {}).get(instance_type, {})
+
+
+INSTANCE_TYPE_CATALOG = InstanceTypeCatalog()
+
 
 class Tag(Model):
     Key = StringType(required=True)
@@ -95,7 +147,7 @@ class Ec2InstanceCollector(RegisteredResourceCollector):
 
     def __init__(self, location_info, client, agent):
         RegisteredResourceCollector.__init__(self, location_info, client, agent)
-        self.instance_types = {}
+        self.instance_types = INSTANCE_TYPE_CATALOG
 
     def process_all(self, filter=None):
         if not filter or "instances" in filter:
@@ -110,22 +162,38 @@ class Ec2InstanceCollector(RegisteredResourceCollector):
             self.process_vpn_gateways()
 
     @set_required_access_v2("ec2:DescribeInstanceTypes")
-    def collect_instance_type(self, instance_type):
-        # Items never change, only added, safe to hold in memory
-        if instance_type not in self.instance_types:
-            instance_type_data = self.client.describe_instance_types(InstanceTypes=[instance_type]).get(
-                "InstanceTypes", []
-            )
-            if instance_type_data:
-                self.instance_types[instance_type] = instance_type_data[0]
-        return self.instance_types.get(instance_type, {})
+    def collect_instance_types(self, instance_types):
+        region = self.location_info.Location.AwsRegion
+        missing = self.instance_types.get_missing(region, instance_types)
+        for i in range(0, len(missing), INSTANCE_TYPES_BATCH_SIZE):
+            batch = missing[i:i + INSTANCE_TYPES_BATCH_SIZE]
+            self.instance_types.update(region, batch, self.describe_instance_types(batch))
+
+    def describe_instance_types(self, instance_types):
+        """
+        One invalid instance type fails the request for all types, the types are then looked up one by one so only
+        the invalid type is without details.
+        """
+        try:
+            return self.client.describe_instance_types(InstanceTypes=instance_types).get("InstanceTypes", [])
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "InvalidInstanceType":
+                raise e
+            if len(instance_types) == 1:
+                self.agent.warning("Instance type {} is not known".format(instance_types[0]))
+                return []
+        instance_type_data = []
+        for instance_type in instance_types:
+            instance_type_data.extend(self.describe_instance_types([instance_type]))
+        return instance_type_data
 
     def collect_instance(self, instance_data):
         instance_type = instance_data.get("InstanceType", "")
-        instance_type_data = self.collect_instance_type(instance_type) or {}
+        instance_type_data = self.instance_types.get(self.location_info.Location.AwsRegion, instance_type)
         return InstanceData(instance=instance_data, instance_type=instance_type_data)
 
     def collect_instances(self, **kwargs):
+        instances = []
         for reservation in client_array_operation(
             self.client,
             "describe_instances",
@@ -144,8 +212,13 @@ class Ec2InstanceCollector(RegisteredResourceCollector):
             ],
             **kwargs
         ):
-            for instance_data in reservation.get("Instances", []):
-                yield self.collect_instance(instance_data)
+            instances.extend(reservation.get("Instances", []))
+        # look up the details of all instance types in as few requests as possible
+        self.collect_instance_types(
+            [instance["InstanceType"] for instance in instances if instance.get("InstanceType")]
+        )
+        for instance_data in instances:
+            yield self.collect_instance(instance_data)
 
     @set_required_access_v2("ec2:DescribeInstances")
     def process_instances(self, **kwargs):
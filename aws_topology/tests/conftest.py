@@ -10,6 +10,7 @@ import json
 from mock import patch
 from stackstate_checks.base.stubs import topology as top, aggregator
 from stackstate_checks.aws_topology import AwsTopologyCheck, InitConfig
+from stackstate_checks.aws_topology.resources.ec2 import INSTANCE_TYPE_CATALOG
 from stackstate_checks.base import AgentCheck
 import botocore
 from botocore.exceptions import ClientError
@@ -257,6 +258,7 @@ class BaseApiTest(unittest.TestCase):
         self.mock_object = self.patcher.start()
         top.reset()
         aggregator.reset()
+        INSTANCE_TYPE_CATALOG.clear()
         init_config = InitConfig(
             {
                 "aws_access_key_id": "some_key",
@@ -2,8 +2,10 @@
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
 import unittest
+from datetime import datetime, timedelta
 from mock import patch
 import botocore
+import pytz
 
 from stackstate_checks.aws_topology import AwsClient, InstanceInfo, InitConfig
 
@@ -85,3 +87,65 @@ class TestAWSClient(unittest.TestCase):
         assert mock_method.called_once_with(
             "AssumeRole", {"RoleArn": ROLE, "RoleSessionName": "sts-agent-check", "ExternalId": EXTERNAL_ID}
         )
+
+    def test_session_credentials_are_reused_until_they_expire(self):
+        expirations = [
+            datetime.utcnow().replace(tzinfo=pytz.utc) + timedelta(hours=1),
+            datetime.utcnow().replace(tzinfo=pytz.utc) + timedelta(hours=1),
+        ]
+
+        def results(operation_name, api_params):
+            if operation_name == "AssumeRole" and "ExternalId" in api_params:
+                return {
+                    "Credentials": {
+                        "AccessKeyId": KEY_ID,
+                        "SecretAccessKey": ACCESS_KEY,
+                        "SessionToken": TOKEN + str(len(expirations)),
+                        "Expiration": expirations.pop(0),
+                    }
+                }
+            else:
+                raise botocore.exceptions.ClientError({"Error": {"Code": "AccessDenied"}}, operation_name)
+
+        with patch("botocore.client.BaseClient._make_api_call") as mock_method:
+            mock_method.side_effect = results
+            client = AwsClient(init_config)
+            session = client.get_session(ROLE, "eu-west-1")
+            self.assertIs(client.get_session(ROLE, "eu-west-1"), session)
+            self.assertEqual(client.get_session(ROLE, "global").region_name, "us-east-1")
+            # the probe without external id and the assume role itself, the credentials are shared by the regions
+            self.assertEqual(mock_method.call_count, 2)
+
+            self.assertEqual(session.get_credentials().get_frozen_credentials().token, TOKEN + "2")
+            self.assertEqual(mock_method.call_count, 2)
+
+    def test_session_credentials_are_refreshed_when_used(self):
+        expirations = [
+            datetime.utcnow().replace(tzinfo=pytz.utc) + timedelta(minutes=1),
+            datetime.utcnow().replace(tzinfo=pytz.utc) + timedelta(hours=1),
+        ]
+
+        def results(operation_name, api_params):
+            if operation_name == "AssumeRole" and "ExternalId" in api_params:
+                return {
+                    "Credentials": {
+                        "AccessKeyId": KEY_ID,
+                        "SecretAccessKey": ACCESS_KEY,
+                        "SessionToken": TOKEN + str(len(expirations)),
+                        "Expiration": expirations.pop(0),
+                    }
+                }
+            else:
+                raise botocore.exceptions.ClientError({"Error": {"Code": "AccessDenied"}}, operation_name)
+
+        with patch("botocore.client.BaseClient._make_api_call") as mock_method:
+            mock_method.side_effect = results
+            client = AwsClient(init_config)
+            session = client.get_session(ROLE, "eu-west-1")
+            self.assertEqual(mock_method.call_count, 2)
+            # the credentials that are about to expire are refreshed when they are used, the session is kept
+            self.assertEqual(session.get_credentials().get_frozen_credentials().token, TOKEN + "1")
+            self.assertEqual(mock_method.call_count, 4)
+            self.assertIs(client.get_session(ROLE, "eu-west-1"), session)
+            self.assertEqual(session.get_credentials().get_frozen_credentials().token, TOKEN + "1")
+            self.assertEqual(mock_method.call_count, 4)
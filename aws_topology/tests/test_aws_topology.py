@@ -3,12 +3,14 @@
 # Licensed under a 3-clause BSD style license (see LICENSE)
 import pytest
 import unittest
-from mock import patch
+from mock import patch, MagicMock
 from copy import deepcopy
 from botocore.exceptions import ClientError
 from stackstate_checks.base.stubs import topology, aggregator
 from stackstate_checks.base import AgentCheck
 from stackstate_checks.aws_topology import AwsTopologyCheck, InstanceInfo, InitConfig
+from stackstate_checks.aws_topology.aws_topology import AgentProxy
+from stackstate_checks.aws_topology.utils import location_info
 from .conftest import API_RESULTS
 
 
@@ -113,3 +115,25 @@ class TestAWSTopologyCheck(unittest.TestCase):
             test_topology["components"][0]["data"]["tags"], ["integration-type:aws-v2", "integration-url:123456789012"]
         )
         self.assertGreater(len(service_checks), 0)
+
+    def test_agent_proxy_parked_relations(self):
+        agent = MagicMock()
+        proxy = AgentProxy(agent, "role", self.check.log)
+        location = location_info("123456789012", "eu-west-1")
+        proxy.relation("a", "b", "uses", {})
+        proxy.relation("b", "c", "uses", {})
+        proxy.relation("c", "c", "uses", {})
+        proxy.component(location, "a", "test", {})
+        self.assertEqual(agent.relation.call_count, 0)
+        proxy.component(location, "b", "test", {})
+        agent.relation.assert_called_once_with("a", "b", "uses", {}, None, None)
+        proxy.relation("b", "a", "uses", {})
+        self.assertEqual(agent.relation.call_count, 2)
+        self.assertEqual(proxy.relations_parked, 3)
+        self.assertEqual(proxy.relations_unparked, 1)
+        self.assertEqual(proxy.relations_never_resolved, 2)
+        proxy.component(location, "c", "test", {})
+        self.assertEqual(agent.relation.call_count, 4)
+        self.assertEqual(proxy.relations_unparked, 3)
+        self.assertEqual(proxy.relations_never_resolved, 0)
+        self.assertEqual(proxy.parked_relations_index, {})
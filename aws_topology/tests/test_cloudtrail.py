@@ -1,9 +1,13 @@
 import json
+import logging
 import os
+import time
 import unittest
+import mock
 from mock import patch
 from stackstate_checks.base.stubs import topology as top, aggregator
 from stackstate_checks.aws_topology import AwsTopologyCheck, InitConfig
+from stackstate_checks.aws_topology.cloudtrail import CloudtrailCollector
 from stackstate_checks.base import AgentCheck
 from stackstate_checks.aws_topology.resources import RegisteredResourceCollector
 import botocore.exceptions
@@ -344,3 +348,53 @@ class TestCloudtrail(unittest.TestCase):
         self.assertEqual(len(components), 2)
         self.assertEqual(components[0]["id"], "arn:aws:lambda:eu-west-1:120431062118:function:stackstate-topo-cron:1")
         self.assertEqual(components[1]["id"], "arn:aws:lambda:eu-west-1:120431062118:function:stackstate-topo-cron")
+
+
+class TestCloudtrailCollector(unittest.TestCase):
+    def setUp(self):
+        def get_object(Bucket, Key):
+            # the older objects take longer to fetch, so the workers complete out of order
+            time.sleep(0.01 * (5 - int(Key[-1])))
+            if Key in self.failing_keys:
+                raise botocore.exceptions.ClientError({"Error": {"Code": "InternalError"}}, "get_object")
+            records = [{"detail-type": "test", "detail": {"id": "{}-{}".format(Key, i)}} for i in range(2)]
+            return {"Body": "".join(json.dumps(record) for record in records)}
+
+        self.failing_keys = []
+        self.client = mock.MagicMock()
+        self.client.get_object.side_effect = get_object
+        self.collector = CloudtrailCollector("bucket", "123456789012", None, mock.MagicMock(), logging.getLogger())
+        self.files = ["file-{}".format(i) for i in range(5)]
+
+    def deleted_keys(self):
+        return [
+            [obj["Key"] for obj in call[1]["Delete"]["Objects"]] for call in self.client.delete_objects.call_args_list
+        ]
+
+    def test_process_files_newest_first(self):
+        events = list(self.collector._process_files(self.client, "bucket", self.files))
+        self.assertEqual(
+            [event["id"] for event in events],
+            ["file-{}-{}".format(i, j) for i in reversed(range(5)) for j in reversed(range(2))],
+        )
+        self.assertEqual(self.deleted_keys(), [["file-4", "file-3", "file-2", "file-1", "file-0"]])
+
+    def test_process_files_deletes_in_batches(self):
+        self.collector.MAX_S3_DELETES = 2
+        list(self.collector._process_files(self.client, "bucket", self.files))
+        self.assertEqual(self.deleted_keys(), [["file-4", "file-3"], ["file-2", "file-1"], ["file-0"]])
+
+    def test_process_files_deletes_consumed_objects_on_error(self):
+        self.failing_keys = ["file-2"]
+        events = self.collector._process_files(self.client, "bucket", self.files)
+        with self.assertRaises(botocore.exceptions.ClientError):
+            list(events)
+        self.assertEqual(self.deleted_keys(), [["file-4", "file-3"]])
+
+    def test_process_files_deletes_consumed_objects_when_stopped_early(self):
+        events = self.collector._process_files(self.client, "bucket", self.files)
+        # all events of file-4 and one of file-3 are consumed
+        for _ in range(3):
+            next(events)
+        events.close()
+        self.assertEqual(self.deleted_keys(), [["file-4"]])
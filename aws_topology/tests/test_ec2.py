@@ -1,7 +1,9 @@
 from stackstate_checks.base.stubs import topology as top, aggregator
 from .conftest import BaseApiTest, set_cloudtrail_event, set_eventbridge_event, set_filter, use_subdirectory
+import copy
 import sys
 from mock import patch
+from botocore.exceptions import ClientError
 
 
 class TestEC2(BaseApiTest):
@@ -78,6 +80,50 @@ class TestEC2(BaseApiTest):
 
         top.assert_all_checked(components, relations)
 
+    @set_filter("instances")
+    def test_process_ec2_instance_types_cached_across_runs(self):
+        self.check.run()
+        self.check.run()
+        self.assert_executed_ok()
+        calls = [
+            call[0][2] for call in self.mock_object.call_args_list if call[0][1] == "DescribeInstanceTypes"
+        ]
+        # the instance types of both instances are requested once, in a single batch
+        self.assertEqual(calls, [{"InstanceTypes": ["m4.xlarge", "m6gd.medium"]}])
+
+    @set_filter("instances")
+    def test_process_ec2_instance_types_invalid_type(self):
+        mock_boto_calls = self.mock_object.side_effect
+
+        def describe_instance_types_with_invalid_type(*args, **kwargs):
+            # c9.invalid fails any request it is part of, the other types are still looked up
+            if args[1] == "DescribeInstanceTypes" and "c9.invalid" in args[2]["InstanceTypes"]:
+                raise ClientError({"Error": {"Code": "InvalidInstanceType"}}, "DescribeInstanceTypes")
+            result = mock_boto_calls(*args, **kwargs)
+            if args[1] == "DescribeInstances":
+                result = copy.deepcopy(result)
+                invalid_instance = copy.deepcopy(result["Reservations"][0]["Instances"][0])
+                invalid_instance.update({"InstanceId": "i-00000000000000c9", "InstanceType": "c9.invalid"})
+                result["Reservations"][0]["Instances"].append(invalid_instance)
+            return result
+
+        self.mock_object.side_effect = describe_instance_types_with_invalid_type
+        self.check.run()
+        self.assertEqual(self.check.warnings, ["Instance type c9.invalid is not known was encountered 1 time(s)."])
+        components = top.get_snapshot(self.check.check_id)["components"]
+        top.assert_component(
+            components,
+            "i-1234567890123456",
+            "aws.ec2.instance",
+            checks={"InstanceId": "i-1234567890123456", "InstanceType": "m6gd.medium", "IsNitro": True},
+        )
+        calls = [
+            call[0][2]["InstanceTypes"] for call in self.mock_object.call_args_list
+            if call[0][1] == "DescribeInstanceTypes"
+        ]
+        self.assertEqual(calls, [["c9.invalid", "m4.xlarge", "m6gd.medium"], ["c9.invalid"], ["m4.xlarge"],
+                                 ["m6gd.medium"]])
+
     first_security_group_version_py3 = "56b81fa0a7cb32a2d5be815f1fb4130764f19e8ab734cec3824854d7a5a9fa84"
     first_security_group_version_py2 = "e3a3e4764fd7fd4a51fcd5812ce9a4803a412c28c6830678462301d33ce6ce75"
     first_sg_group_id = "sg-002abe0b505ad7002"
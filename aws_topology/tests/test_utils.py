@@ -11,6 +11,7 @@ from stackstate_checks.aws_topology.resources.utils import (
     get_ipurns_from_hostname,
 )
 from stackstate_checks.aws_topology.utils import correct_tags
+from stackstate_checks.aws_topology.cloudtrail import iter_json_records
 from datetime import datetime
 import unittest
 from six import string_types
@@ -151,3 +152,9 @@ class TestUtils(unittest.TestCase):
             self.assertEqual(get_ipurns_from_hostname('test1', 'vpc-123'), ['urn:vpcip:vpc-123/10.1.1.10'])
         with patch('socket.getaddrinfo', return_value=((0, 0, 0, 0, ['197.128.230.1']),)):
             self.assertEqual(get_ipurns_from_hostname('test1', 'vpc-123'), ['urn:host:/197.128.230.1'])
+
+    def test_utils_iter_json_records(self):
+        txt = '{"a": 1}{"b": 2}\n{"c": [3]}\n  {"d": '
+        self.assertEqual(list(iter_json_records(txt)), [{"a": 1}, {"b": 2}, {"c": [3]}])
+        self.assertEqual(list(iter_json_records("")), [])
+        self.assertEqual(list(iter_json_records("{}x{}")), [{}])
@@ -2,11 +2,12 @@
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
 
+import gzip
 import json
 import time
 import logging
-import sys
 import uuid
+from io import BytesIO
 from six import text_type
 from datetime import datetime, timedelta
 
@@ -15,8 +16,8 @@ import flatten_dict
 import requests
 from botocore.config import Config
 from schematics import Model
-from schematics.types import IntType, StringType, ModelType, DateTimeType
-
+from schematics.types import IntType, StringType, ModelType, DateTimeType, BooleanType
+import msgpack
 
 from stackstate_checks.base import AgentCheck, TopologyInstance, is_affirmative
 from stackstate_checks.utils.common import to_string
@@ -34,6 +35,10 @@ TRACES_API_ENDPOINT = 'http://localhost:8126/v0.3/traces'
 MAX_TRACE_HISTORY_LIMIT = 3
 # number of minutes
 MAX_TRACE_HISTORY_BATCH_SIZE = 5
+# maximum number of trace ids accepted by a single BatchGetTraces call
+MAX_TRACE_IDS_PER_BATCH = 5
+# maximum size in bytes of a single traces payload sent to the Trace Agent
+MAX_TRACES_PAYLOAD_SIZE = 1024 * 1024 * 2
 
 
 class State(Model):
@@ -47,6 +52,9 @@ class Instance(Model):
     role_arn = StringType()
     max_trace_history_limit = IntType(default=MAX_TRACE_HISTORY_LIMIT)
     max_trace_history_batch_size = IntType(default=MAX_TRACE_HISTORY_BATCH_SIZE)
+    max_traces_payload_size = IntType(default=MAX_TRACES_PAYLOAD_SIZE)
+    traces_payload_encoding = StringType(default='json', choices=['json', 'msgpack'])
+    traces_payload_gzip = BooleanType(default=False)
     state = ModelType(State)
 
 
@@ -65,6 +73,7 @@ class AwsCheck(AgentCheck):
         self.account_id = self.instance.get('role_arn', 'unknown-instance')
         self.tags = None
         self.arns = {}
+        self.traces_session = None
 
     def get_instance_key(self, instance):
         return TopologyInstance(self.INSTANCE_TYPE, self.account_id)
@@ -116,8 +125,8 @@ class AwsCheck(AgentCheck):
         """
         start_time, end_time = self.get_start_end_time_trace(instance)
         xray_traces_batch = self.fetch_batch_traces(aws_client, start_time, end_time)
-        traces = self.process_batch_traces(xray_traces_batch)
-        self.send_batch_traces(traces)
+        traces = self.iter_batch_traces(xray_traces_batch)
+        self.send_batch_traces(traces, instance)
         instance.state.last_processed_timestamp = end_time
 
     def process_batch_traces(self, xray_traces_batch):
@@ -128,27 +137,37 @@ class AwsCheck(AgentCheck):
         @return
         Returns the list of formatted traces in Span format required by Trace API
         """
-        traces = []
+        traces = list(self.iter_batch_traces(xray_traces_batch))
+        self.log.debug('Collected total %s traces.', len(traces))
+        return traces
+
+    def iter_batch_traces(self, xray_traces_batch):
+        """
+        Converts the incoming batch traces one trace at a time
+        @param
+        xray_traces_batch: Iterable of xray traces batch from AWS API
+        @return
+        Yields the formatted traces in Span format required by Trace API
+        """
         for xray_traces in xray_traces_batch:
             for xray_trace in xray_traces['Traces']:
                 trace = []
                 for segment in xray_trace['Segments']:
                     segment_documents = [json.loads(segment['Document'])]
                     trace.extend(self._generate_spans(segment_documents))
-                traces.append(trace)
                 self.log.debug('Converted %s x-ray segments to traces.', len(trace))
-        self.log.debug('Collected total %s traces.', len(traces))
-        return traces
+                yield trace
 
     def fetch_batch_traces(self, aws_client, start_time, end_time):
         """
-        Fetch the batch of traces from AWS with start and end time
+        Fetch the batch of traces from AWS with start and end time, the trace ids are requested
+        MAX_TRACE_IDS_PER_BATCH at a time
         @param
         aws_client: AWS Client
         start_time: StartTime parameter for API to collect trace from
         end_time: EndTime parameter for API to collect trace to
         @return
-        Returns the list of traces from AWS
+        Yields the batches of traces from AWS
         """
         self.log.debug("Collecting traces from {} to {}".format(start_time, end_time))
         xray_client = aws_client.get_boto3_client('xray')
@@ -156,11 +175,22 @@ class AwsCheck(AgentCheck):
             'StartTime': start_time,
             'EndTime': end_time
         }
-        traces = []
+        trace_ids = []
         for page in xray_client.get_paginator('get_trace_summaries').paginate(**operation_params):
             for trace_summary in page['TraceSummaries']:
-                traces.append(xray_client.batch_get_traces(TraceIds=[trace_summary['Id']]))
-        return traces
+                trace_ids.append(trace_summary['Id'])
+                if len(trace_ids) == MAX_TRACE_IDS_PER_BATCH:
+                    for traces in self._batch_get_traces(xray_client, trace_ids):
+                        yield traces
+                    trace_ids = []
+        if trace_ids:
+            for traces in self._batch_get_traces(xray_client, trace_ids):
+                yield traces
+
+    @staticmethod
+    def _batch_get_traces(xray_client, trace_ids):
+        for page in xray_client.get_paginator('batch_get_traces').paginate(TraceIds=trace_ids):
+            yield page
 
     @staticmethod
     def _current_time():
@@ -370,18 +400,55 @@ class AwsCheck(AgentCheck):
 
         return arn
 
-    def send_batch_traces(self, traces):
+    def send_batch_traces(self, traces, instance=None):
         """
-        Sends traces payload to Traces Agent.
+        Sends traces payload to Traces Agent, in payloads of at most max_traces_payload_size bytes.
+        The payloads are only sent once all traces are fetched and encoded. When fetching the traces fails, none of
+        them are sent and the next check run, that fetches the same time window again, doesn't send them twice.
         @param
-        traces: the payload to be sent to TraceAPI
+        traces: iterable of traces to be sent to TraceAPI
+        instance: Instance schema of this check, holds the payload size and encoding
+        """
+        max_size = instance.max_traces_payload_size if instance else MAX_TRACES_PAYLOAD_SIZE
+        encoding = instance.traces_payload_encoding if instance else 'json'
+        use_gzip = instance.traces_payload_gzip if instance else False
+
+        payloads = []
+        encoded_traces = []
+        size = 0
+        for trace in traces:
+            encoded_trace = msgpack.packb(trace) if encoding == 'msgpack' else json.dumps(trace).encode('utf-8')
+            if encoded_traces and size + len(encoded_trace) > max_size:
+                payloads.append((encoded_traces, size))
+                encoded_traces = []
+                size = 0
+            encoded_traces.append(encoded_trace)
+            size += len(encoded_trace)
+        if encoded_traces:
+            payloads.append((encoded_traces, size))
+        for encoded_traces, size in payloads:
+            self._send_traces_payload(encoded_traces, size, encoding, use_gzip)
+
+    def _send_traces_payload(self, encoded_traces, size, encoding, use_gzip):
+        """
+        Sends the already encoded traces as a single array payload over a persistent session.
         """
-        headers = {'Content-Type': 'application/json'}
-        if traces:
-            start = time.time()
-            self.log.info("Size of traces data to be sent is {} bytes".format(sys.getsizeof(traces)))
-            requests.put(TRACES_API_ENDPOINT, data=json.dumps(traces), headers=headers)
-            self.log.info("Time took to send the data is: {}s".format(time.time()-start))
+        if encoding == 'msgpack':
+            headers = {'Content-Type': 'application/msgpack'}
+            payload = msgpack.Packer().pack_array_header(len(encoded_traces)) + b''.join(encoded_traces)
+        else:
+            headers = {'Content-Type': 'application/json'}
+            payload = b'[' + b','.join(encoded_traces) + b']'
+        if use_gzip:
+            headers['Content-Encoding'] = 'gzip'
+            payload = gzip_compress(payload)
+        if self.traces_session is None:
+            self.traces_session = requests.Session()
+        start = time.time()
+        self.log.info("Size of {} traces data to be sent is {} bytes ({} bytes encoded)"
+                      .format(len(encoded_traces), size, len(payload)))
+        self.traces_session.put(TRACES_API_ENDPOINT, data=payload, headers=headers)
+        self.log.info("Time took to send the data is: {}s".format(time.time()-start))
 
 
 class AwsClient:
@@ -443,6 +510,16 @@ def flatten_segment(segment):
     return flat_segment
 
 
+def gzip_compress(data):
+    """
+    Compress data with gzip, gzip.compress is not available on Python 2
+    """
+    out = BytesIO()
+    with gzip.GzipFile(fileobj=out, mode='wb') as f:
+        f.write(data)
+    return out.getvalue()
+
+
 def process_http_error(span, segment):
     """
     Process the span on different error code
@@ -2,15 +2,20 @@
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
 from datetime import timedelta, datetime
+import gzip
+import io
+import json
 import os
 
 import jsonpickle
 import mock
+import msgpack
+import pytest
 from mock import patch
 
 from stackstate_checks.aws_xray import AwsCheck
 from stackstate_checks.aws_xray.aws_xray import MAX_TRACE_HISTORY_LIMIT, MAX_TRACE_HISTORY_BATCH_SIZE, \
-    Instance, State
+    MAX_TRACE_IDS_PER_BATCH, Instance, State
 
 
 AWS_REGION = 'eu-west-1'
@@ -54,7 +59,7 @@ def test_process_batch_traces(instance):
 
 
 @patch('stackstate_checks.aws_xray.aws_xray.AwsClient', MockAwsClient)
-@patch('requests.put', mock.MagicMock(status_code=202, text="ok"))
+@patch('requests.Session.put', mock.MagicMock(status_code=202, text="ok"))
 def test_check_run_normal_start(aws_check, aggregator):
     """
     Test to check if we process in the proper batch size
@@ -80,7 +85,7 @@ def test_check_run_normal_start(aws_check, aggregator):
 
 
 @patch('stackstate_checks.aws_xray.aws_xray.AwsClient', MockAwsClient)
-@patch('requests.put', mock.MagicMock(status_code=202, text="ok"))
+@patch('requests.Session.put', mock.MagicMock(status_code=202, text="ok"))
 def test_check_run_already_lagging_behind(aws_check, aggregator):
     """
     Test to check if we fetch from state process in the proper batch size if lagging behind
@@ -111,7 +116,7 @@ def test_check_run_already_lagging_behind(aws_check, aggregator):
 
 
 @patch('stackstate_checks.aws_xray.aws_xray.AwsClient', MockAwsClient)
-@patch('requests.put', mock.MagicMock(status_code=202, text="ok"))
+@patch('requests.Session.put', mock.MagicMock(status_code=202, text="ok"))
 def test_check_run_lagging_behind_more_than_10hrs(aws_check, aggregator):
     """
     Test to check if we reset the state and fetch from utc - 3 in the proper batch size if lagging behind
@@ -269,6 +274,84 @@ def test_error_trace():
     assert spans[3]["error"]
 
 
+def test_fetch_batch_traces_groups_trace_ids():
+    """
+    Test to check if the trace ids are requested in batches of MAX_TRACE_IDS_PER_BATCH
+    """
+    check = AwsCheck('test', {}, {})
+    trace_ids = ['trace-{}'.format(i) for i in range(12)]
+    xray_client = mock.MagicMock()
+    paginators = {
+        'get_trace_summaries': mock.MagicMock(),
+        'batch_get_traces': mock.MagicMock()
+    }
+    paginators['get_trace_summaries'].paginate.return_value = [
+        {'TraceSummaries': [{'Id': trace_id} for trace_id in trace_ids[:7]]},
+        {'TraceSummaries': [{'Id': trace_id} for trace_id in trace_ids[7:]]}
+    ]
+    paginators['batch_get_traces'].paginate.side_effect = lambda TraceIds: [{'Traces': list(TraceIds)}]
+    xray_client.get_paginator.side_effect = lambda name: paginators[name]
+    aws_client = mock.MagicMock()
+    aws_client.get_boto3_client.return_value = xray_client
+
+    batches = list(check.fetch_batch_traces(aws_client, None, None))
+    assert [batch['Traces'] for batch in batches] == [trace_ids[0:5], trace_ids[5:10], trace_ids[10:]]
+    assert all(len(batch['Traces']) <= MAX_TRACE_IDS_PER_BATCH for batch in batches)
+
+
+@patch('requests.Session.put')
+def test_send_batch_traces_in_size_capped_chunks(mock_put, instance):
+    """
+    Test to check if the traces are sent in payloads no larger than max_traces_payload_size
+    """
+    instance['max_traces_payload_size'] = 300
+    instance = Instance(instance)
+    check = AwsCheck('test', {}, {}, [instance])
+    traces = check.iter_batch_traces(get_xray_traces())
+    check.send_batch_traces(([span['span_id'] for span in trace] for trace in traces), instance)
+    payloads = [json.loads(call[1]['data']) for call in mock_put.call_args_list]
+    assert len(payloads) == 3
+    assert [len(trace) for payload in payloads for trace in payload] == [25, 25, 5]
+
+
+@patch('requests.Session.put')
+def test_send_batch_traces_gzip_msgpack(mock_put, instance):
+    """
+    Test to check if the traces payload can be sent msgpack encoded and gzip compressed
+    """
+    instance['traces_payload_encoding'] = 'msgpack'
+    instance['traces_payload_gzip'] = True
+    instance = Instance(instance)
+    check = AwsCheck('test', {}, {}, [instance])
+    traces = check.process_batch_traces(get_xray_traces())
+    check.send_batch_traces(traces, instance)
+    assert mock_put.call_count == 1
+    kwargs = mock_put.call_args[1]
+    assert kwargs['headers'] == {'Content-Type': 'application/msgpack', 'Content-Encoding': 'gzip'}
+    payload = gzip.GzipFile(fileobj=io.BytesIO(kwargs['data'])).read()
+    assert msgpack.unpackb(payload) == json.loads(json.dumps(traces))
+
+
+@patch('requests.Session.put')
+def test_send_batch_traces_after_fetch(mock_put, instance):
+    """
+    Test to check if no traces are sent when fetching the traces fails partway
+    """
+    instance['max_traces_payload_size'] = 300
+    instance = Instance(instance)
+    check = AwsCheck('test', {}, {}, [instance])
+
+    def failing_fetch():
+        for traces in get_xray_traces():
+            yield traces
+        raise Exception('fetching the traces failed')
+
+    traces = check.iter_batch_traces(failing_fetch())
+    with pytest.raises(Exception, match='fetching the traces failed'):
+        check.send_batch_traces(([span['span_id'] for span in trace] for trace in traces), instance)
+    assert mock_put.call_count == 0
+
+
 def get_file(file_name):
     """
     Return content from the file name
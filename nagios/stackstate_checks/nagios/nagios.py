@@ -2,12 +2,14 @@
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
 import logging
+import os
 import re
 from collections import namedtuple
 
 from pynag import Model
+from pynag.Parsers.config_parser import Config
 
-from stackstate_checks.base.utils.tailfile import TailFile
+from stackstate_checks.base.utils.tailfile import PersistentTailFile
 from stackstate_checks.checks import AgentCheck, TopologyInstance
 
 EVENT_FIELDS = {
@@ -79,6 +81,8 @@ class NagiosCheck(AgentCheck):
         self.log.setLevel(logging.DEBUG)
         self.account_id = None
         self.nagios_tails = {}
+        # nagios.cfg path -> (mtime and size of the configuration files, host names)
+        self.nagios_hosts_cache = {}
         check_freq = init_config.get("check_freq", 15)
         if instances is not None:
             for instance in instances:
@@ -165,8 +169,14 @@ class NagiosCheck(AgentCheck):
             # Bad configuration: This instance does not contain any necessary configuration
             if not instance_key or instance_key not in self.nagios_tails:
                 raise Exception('No Nagios configuration file specified')
+            # resume every tailer at the offset saved in the check state, so no lines are lost on an agent restart
+            state = instance.get(self.STATE_FIELD_NAME) or {}
+            offsets = state.get('tail_offsets', {})
             for tailer in self.nagios_tails[instance_key]:
-                tailer.check()
+                tailer.check(offsets.get(tailer.log_path))
+                offsets[tailer.log_path] = tailer.tail.offset
+            state['tail_offsets'] = offsets
+            instance[self.STATE_FIELD_NAME] = state
             i_key = {"type": self.INSTANCE_TYPE, "conf_path": instance.get("nagios_conf"), "url": self.hostname}
             self.get_topology(i_key)
 
@@ -180,25 +190,59 @@ class NagiosCheck(AgentCheck):
         nagios_cfg_path = instance_key['conf_path']
         self.log.debug("Start nagios topology gathering for file: {}.".format(nagios_cfg_path))
 
-        # set nagios.cfg path for pynag
-        Model.cfg_file = nagios_cfg_path
-
-        # Get all hosts
-        all_hosts = Model.Host.objects.all
-        for host in all_hosts:
-            self.log.debug("Topology, processing host: {}".format(host))
-            if host.host_name is None:
-                continue
-            id = host.host_name
+        host_names = self.get_host_names(nagios_cfg_path)
+        for host_name in host_names:
+            id = host_name
             self.log.debug("Nagios host object: {}".format(id))
             type = "nagios-host"
             data = {
-                "name": host.host_name.strip(),
+                "name": host_name.strip(),
                 "labels": ["nagios-server:" + instance_key.get("url")]
             }
             self.component(id, type, data)
         self.log.debug("Done nagios topology gathering for file: {} "
-                       "(processed {} hosts)".format(Model.cfg_file, len(all_hosts)))
+                       "(processed {} hosts)".format(nagios_cfg_path, len(host_names)))
+
+    def get_host_names(self, nagios_cfg_path):
+        """
+        Returns the names of the hosts in the Nagios object configuration. The configuration is only parsed again
+        when the mtime or size of nagios.cfg or one of its object configuration files changed since the last parse.
+        """
+        config_signature = self.get_config_signature(nagios_cfg_path)
+        cached = self.nagios_hosts_cache.get(nagios_cfg_path)
+        if cached is not None and cached[0] == config_signature:
+            self.log.debug("Nagios configuration {} is unchanged, using the cached hosts.".format(nagios_cfg_path))
+            return cached[1]
+
+        # set nagios.cfg path for pynag, without a config pynag parses all object configuration files again
+        Model.cfg_file = nagios_cfg_path
+        Model.config = None
+
+        # Get all hosts
+        host_names = []
+        for host in Model.Host.objects.all:
+            self.log.debug("Topology, processing host: {}".format(host))
+            if host.host_name is not None:
+                host_names.append(host.host_name)
+        self.nagios_hosts_cache[nagios_cfg_path] = (config_signature, host_names)
+        return host_names
+
+    @staticmethod
+    def get_config_signature(nagios_cfg_path):
+        """
+        Returns the mtime and size of nagios.cfg and of the object configuration files (cfg_file and cfg_dir) it
+        includes. Only nagios.cfg itself is parsed to find these files.
+        """
+        config = Config(cfg_file=nagios_cfg_path)
+        config.parse_maincfg()
+        signature = []
+        for filename in [nagios_cfg_path] + sorted(config.get_cfg_files()):
+            try:
+                stat = os.stat(filename)
+                signature.append((filename, stat.st_mtime, stat.st_size))
+            except OSError:
+                signature.append((filename, None, None))
+        return signature
 
     def parse_nagios_config(self, filename):
         output = {}
@@ -240,7 +284,6 @@ class NagiosTailer(object):
         """
         self.log_path = log_path
         self.log = logger
-        self.gen = None
         self.tail = None
         self.hostname = hostname
         self._event = event_func
@@ -251,19 +294,32 @@ class NagiosTailer(object):
         if file_template is not None:
             self.compile_file_template(file_template)
 
-        self.tail = TailFile(self.log, self.log_path, self._parse_line)
-        self.gen = self.tail.tail(line_by_line=False, move_end=True)
-        next(self.gen)
+        self.tail = PersistentTailFile(self.log, self.log_path, self._parse_line)
+        self._restored = False
+        try:
+            self.tail.seek_end()
+        except (IOError, OSError) as e:
+            self.log.warning("Can't open %s file: %s" % (self.log_path, e))
+
+    def check(self, offset=None):
+        """
+        Parse the lines appended to the file since the last check.
 
-    def check(self):
+        :param offset: dict, offset of the file saved in the check state, used on the first check to resume reading
+                       where the previous agent run stopped
+        """
         self._line_parsed = 0
         # read until the end of file
         try:
+            if not self._restored:
+                self._restored = True
+                if offset:
+                    self.tail.restore(offset)
             self.log.debug("Start nagios check for file %s" % (self.log_path))
-            next(self.gen)
+            self.tail.tail()
             self.log.debug("Done nagios check for file %s (parsed %s line(s))" %
                            (self.log_path, self._line_parsed))
-        except StopIteration as e:
+        except Exception as e:
             self.log.exception(e)
             self.log.warning("Can't tail %s file" % (self.log_path))
 
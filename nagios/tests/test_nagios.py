@@ -1,11 +1,13 @@
 # (C) StackState 2020
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
+import os
 import tempfile
 import time
 
 import mock
 import pytest
+from pynag.Parsers.config_parser import Config
 from pynag.Utils import misc
 
 from stackstate_checks.base import ensure_string
@@ -95,7 +97,8 @@ class TestEventLogTailer:
         """
         Make sure the Tailer continues to parse Nagios as the file grows
         """
-        test_data = open(NAGIOS_TEST_LOG).read()
+        # the tailer only parses complete lines, the fixture does not end with a newline
+        test_data = open(NAGIOS_TEST_LOG).read() + '\n'
         events = []
         ITERATIONS = 10
         log_file = tempfile.NamedTemporaryFile(mode="a+b")
@@ -118,6 +121,36 @@ class TestEventLogTailer:
         log_file.close()
         assert len(aggregator.events) == ITERATIONS * 505
 
+    def test_resume_from_state(self, aggregator):
+        """
+        Lines written while the agent was not running are parsed when the check resumes from the saved offset
+        """
+        test_data = open(NAGIOS_TEST_LOG).read() + '\n'
+        log_file = tempfile.NamedTemporaryFile(mode="a+b")
+        log_file.write(test_data.encode('utf-8'))
+        log_file.flush()
+
+        config, nagios_cfg = get_config('\n'.join(["log_file={0}".format(log_file.name)]), events=True)
+        instance = config['instances'][0]
+
+        nagios = NagiosCheck(CHECK_NAME, {}, {}, instances=config['instances'])
+        nagios.get_topology = mocked_topology
+        nagios.check(instance)
+        assert len(aggregator.events) == 0
+        offset = instance['state']['tail_offsets'][log_file.name]
+        assert offset['position'] == len(test_data.encode('utf-8'))
+
+        # the agent restarts, the new check starts at the end of the file unless it resumes from the state
+        log_file.write(test_data.encode('utf-8'))
+        log_file.flush()
+        nagios = NagiosCheck(CHECK_NAME, {}, {}, instances=config['instances'])
+        nagios.get_topology = mocked_topology
+        nagios.check(instance)
+
+        log_file.close()
+        assert len(aggregator.events) == 505
+        assert instance['state']['tail_offsets'][log_file.name]['position'] == 2 * len(test_data.encode('utf-8'))
+
     def test_create_event(self):
         """
         Tags should have proper format otherwise 'Nagios Service Check.groovy' won't get health state correctly
@@ -592,6 +625,29 @@ class TestNagiosTopology:
         # topology should return 3 components, 2 from cfg and 1 default
         assert len(snapshot.get('components')) == 3
 
+    def test_get_host_names_parses_changed_config_only(self, dummy_instance):
+        """
+        The Nagios object configuration is only parsed again when one of the configuration files changed
+        """
+        NagiosCheck.parse_nagios_config = mock.MagicMock()
+        NagiosCheck.parse_nagios_config.return_value = {"key": "value"}
+        nagios = NagiosCheck(CHECK_NAME, {}, {}, instances=[dummy_instance])
+
+        environment = misc.FakeNagiosEnvironment()
+        environment.create_minimal_environment()
+        environment.update_model()
+        environment.import_config(NAGIOS_TEST_HOST_CFG)
+
+        with mock.patch.object(Config, 'parse', autospec=True, side_effect=Config.parse) as parse:
+            assert len(nagios.get_host_names(environment.cfg_file)) == 3
+            assert len(nagios.get_host_names(environment.cfg_file)) == 3
+            assert parse.call_count == 1
+
+            with open(os.path.join(environment.objects_dir, "extra_host.cfg"), "w") as f:
+                f.write("define host{\n    host_name    prod-api-3\n}\n")
+            assert "prod-api-3" in nagios.get_host_names(environment.cfg_file)
+            assert parse.call_count == 2
+
 
 def get_config(nagios_conf, events=False, service_perf=False, host_perf=False):
     """
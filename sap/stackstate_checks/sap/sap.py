@@ -2,11 +2,16 @@
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
 import logging
+import threading
 import time
 
 from stackstate_checks.base import ConfigurationError, AgentCheck, TopologyInstance
+from stackstate_checks.base.checks.libs.thread_pool import Pool
 from .proxy import SapProxy
 
+# Maximum number of host instances that are queried at the same time
+DEFAULT_MAX_WORKERS = 4
+
 
 class SapCheck(AgentCheck):
     INSTANCE_TYPE = "sap"
@@ -21,6 +26,10 @@ class SapCheck(AgentCheck):
         self.tags = None
         self.domain = None
         self.stackstate_environment = None
+        self.max_workers = DEFAULT_MAX_WORKERS
+        # SapProxy per host control, the WSDL is only downloaded and parsed once for all host instances and runs
+        self.proxies = {}
+        self.proxies_lock = threading.Lock()
 
         # `zeep` logs lots of stuff related to wsdl parsing on DEBUG level so we avoid that
         zeep_logger = logging.getLogger("zeep")
@@ -62,6 +71,7 @@ class SapCheck(AgentCheck):
         self.domain = instance.get("domain", None)
         self.stackstate_environment = instance.get("environment", None)
         self.tags = instance.get("tags", [])
+        self.max_workers = max(1, int(instance.get("max_workers", DEFAULT_MAX_WORKERS)))
 
         return self.host, self.url, self.user, self.password, self.tags
 
@@ -77,7 +87,13 @@ class SapCheck(AgentCheck):
             # for HTTPS protocol, 1129 is the port of the HostControl
             host_port = "1129"
         host_control_url = "{0}:{1}/SAPHostControl".format(self.url, host_port)
-        return SapProxy(host_control_url, self.user, self.password, self.verify, self.cert, self.keyfile)
+        key = (host_control_url, self.user, self.password, self.verify, self.cert, self.keyfile)
+        with self.proxies_lock:
+            proxy = self.proxies.get(key)
+            if proxy is None:
+                proxy = SapProxy(host_control_url, self.user, self.password, self.verify, self.cert, self.keyfile)
+                self.proxies[key] = proxy
+        return proxy
 
     def _collect_hosts(self):
         try:
@@ -150,6 +166,9 @@ class SapCheck(AgentCheck):
             return instances
         except Exception as e:
             self.log.exception(str(e))
+            # build the proxies again on the next run, the WSDL of the host control may have changed
+            with self.proxies_lock:
+                self.proxies.clear()
 
             # publish event if we could NOT connect to the SAP host control
             self.event({
@@ -165,43 +184,55 @@ class SapCheck(AgentCheck):
             })
 
     def _collect_instance_processes_and_metrics(self, host_instances):
-        for instance_id, instance_type in list(host_instances.items()):
-            try:
-                host_instance_proxy = self._get_proxy(instance_id)
+        host_instances = list(host_instances.items())
+        if not host_instances:
+            return
+        # the host instances are queried concurrently, with at most max_workers SOAP calls in flight
+        pool = Pool(min(self.max_workers, len(host_instances)), name="sap")
+        try:
+            pool.map(self._collect_host_instance, host_instances)
+        finally:
+            pool.terminate()
+            pool.join()
 
-                self._collect_processes(instance_id, host_instance_proxy)
+    def _collect_host_instance(self, host_instance):
+        instance_id, instance_type = host_instance
+        try:
+            host_instance_proxy = self._get_proxy(instance_id)
 
-                self._collect_memory_metric(instance_id, host_instance_proxy)
+            self._collect_processes(instance_id, host_instance_proxy)
 
-                self._collect_worker_metrics(instance_id, instance_type, host_instance_proxy)
+            self._collect_memory_metric(instance_id, host_instance_proxy)
 
-                # publish event if we connected successfully to the SAP host instance
-                self.event({
-                    "timestamp": int(time.time()),
-                    "source_type_name": "SAP:host instance",
-                    "msg_title": "Host instance '{0}' status update.".format(instance_id),
-                    "msg_text": "Host instance '{0}' status update.".format(instance_id),
-                    "host": self.host,
-                    "tags": [
-                        "status:sap-host-instance-success",
-                        "instance_id:{0}".format(instance_id)
-                    ]
-                })
-            except Exception as e:
-                self.log.exception(str(e))
+            self._collect_worker_metrics(instance_id, instance_type, host_instance_proxy)
 
-                # publish event if we could NOT connect to the SAP host instance
-                self.event({
-                    "timestamp": int(time.time()),
-                    "source_type_name": "SAP:host instance",
-                    "msg_title": "Host instance '{0}' status update.".format(instance_id),
-                    "msg_text": str(e),
-                    "host": self.host,
-                    "tags": [
-                        "status:sap-host-instance-error",
-                        "instance_id:{0}".format(instance_id)
-                    ]
-                })
+            # publish event if we connected successfully to the SAP host instance
+            self.event({
+                "timestamp": int(time.time()),
+                "source_type_name": "SAP:host instance",
+                "msg_title": "Host instance '{0}' status update.".format(instance_id),
+                "msg_text": "Host instance '{0}' status update.".format(instance_id),
+                "host": self.host,
+                "tags": [
+                    "status:sap-host-instance-success",
+                    "instance_id:{0}".format(instance_id)
+                ]
+            })
+        except Exception as e:
+            self.log.exception(str(e))
+
+            # publish event if we could NOT connect to the SAP host instance
+            self.event({
+                "timestamp": int(time.time()),
+                "source_type_name": "SAP:host instance",
+                "msg_title": "Host instance '{0}' status update.".format(instance_id),
+                "msg_text": str(e),
+                "host": self.host,
+                "tags": [
+                    "status:sap-host-instance-error",
+                    "instance_id:{0}".format(instance_id)
+                ]
+            })
 
     def _collect_processes(self, instance_id, host_instance_proxy):
         processes = host_instance_proxy.get_sap_instance_processes(instance_id)
@@ -595,6 +595,57 @@ def test_collect_only_hosts_create_service_https(aggregator, https_instance):
         aggregator.all_metrics_asserted()
 
 
+def test_proxy_is_cached(instance):
+    host_control_url = "http://localhost:1128/SAPHostControl"
+    with requests_mock.mock() as m:
+        m.get(host_control_url + "/?wsdl", text=_read_test_file("wsdl/SAPHostAgent.wsdl"))
+
+        sap_check = SapCheck(CHECK_NAME, {}, instances=[instance])
+        sap_check._get_config(instance)
+        proxy = sap_check._get_proxy()
+
+        assert sap_check._get_proxy("00") is proxy
+        assert sap_check._get_proxy("01") is proxy
+        assert len([r for r in m.request_history if r.url.endswith("?wsdl")]) == 1
+
+
+def test_collect_host_instances_concurrently(aggregator, instance):
+    # TODO this is needed because the topology retains data across tests
+    topology.reset()
+
+    def get_cim_object(request, context):
+        if "WorkProcess" in request.text:
+            return _read_test_file("samples/ABAPGetWPTable.xml")
+        if "Parameter" in request.text:
+            return _read_test_file("samples/ParameterValue.xml")
+        return _read_test_file("samples/GetProcessList.xml")
+
+    instance["max_workers"] = 2
+    host_control_url = "http://localhost:1128/SAPHostControl"
+    with requests_mock.mock() as m:
+        m.get(host_control_url + "/?wsdl", text=_read_test_file("wsdl/SAPHostAgent.wsdl"))
+        m.post(host_control_url + ".cgi", text=get_cim_object)
+
+        sap_check = SapCheck(CHECK_NAME, {}, instances=[instance])
+        sap_check._get_config(instance)
+        sap_check._collect_instance_processes_and_metrics({"00": "ABAP Instance", "01": "Central Services Instance",
+                                                           "67": "Solution Manager Diagnostic Agent"})
+
+        for instance_id in ["00", "01", "67"]:
+            aggregator.assert_event(
+                msg_text="Host instance '{0}' status update.".format(instance_id),
+                tags=[
+                    "status:sap-host-instance-success",
+                    "instance_id:{0}".format(instance_id)
+                ]
+            )
+            aggregator.assert_metric(name="phys_memsize", value=32767, tags=["instance_id:" + instance_id])
+        aggregator.assert_metric(name="DIA_workers_free", value=10, tags=["instance_id:00"])
+        aggregator.assert_metric(name="BTC_workers_free", value=3, tags=["instance_id:00"])
+        aggregator.all_metrics_asserted()
+        assert len([r for r in m.request_history if r.url.endswith("?wsdl")]) == 1
+
+
 def _read_test_file(filename):
     with open("./tests/" + filename, "r") as f:
         return f.read()
@@ -4,16 +4,25 @@ from requests_ntlm import HttpNtlmAuth
 import time
 import re
 import json
-from stackstate_checks.base import AgentCheck, ConfigurationError, TopologyInstance
+import threading
+from stackstate_checks.base import AgentCheck, ConfigurationError, TopologyInstance, to_string
+from stackstate_checks.base.checks.libs.thread_pool import Pool
 import subprocess
 import os.path
 import traceback
 import chardet
 
+# Maximum number of SCOM objects that are requested at the same time
+DEFAULT_MAX_WORKERS = 5
+# Maximum number of monitoring objects in the criteria of one alert query
+ALERTS_BATCH_SIZE = 200
+
 
 class SCOM(AgentCheck):
     INSTANCE_TYPE = 'scom'
     requests_counter = 0
+    requests_threshold = 5000
+    max_workers = DEFAULT_MAX_WORKERS
 
     def get_instance_key(self, instance):
         if 'hostip' not in instance:
@@ -29,23 +38,32 @@ class SCOM(AgentCheck):
                                 json=request_credentials)
         return str(response.status_code)
 
-    def send_alerts(self, session, component_id, domain, username, password, scom_ip):
-        if self.requests_counter > self.requests_threshold:
-            session.close()
-            return
-        data = {
-            "criteria": "(MonitoringObjectId = '" + component_id + "')",
-            "displayColumns":
-                [
-                    "id", "name", "monitoringobjectdisplayname", "description", "resolutionstate", "timeadded",
-                    "monitoringobjectpath"
-                ]
-        }
-        response = (session.post(scom_ip + '/OperationsManager/data/alert',
-                                 auth=HttpNtlmAuth(domain + '\\' + username, password), verify=False, json=data)).json()
-        self.requests_counter += 1
-        self.log.debug("Number of requets: " + str(self.requests_counter))
-        events_data_tree = response.get("rows", [])
+    def send_alerts(self, session, component_ids, domain, username, password, scom_ip):
+        """
+        Retrieves the alerts of all components with one criteria based query per ALERTS_BATCH_SIZE components
+        """
+        for start in range(0, len(component_ids), ALERTS_BATCH_SIZE):
+            if self.requests_counter > self.requests_threshold:
+                session.close()
+                return
+            criteria = " OR ".join("MonitoringObjectId = '%s'" % component_id
+                                   for component_id in component_ids[start:start + ALERTS_BATCH_SIZE])
+            data = {
+                "criteria": "(" + criteria + ")",
+                "displayColumns":
+                    [
+                        "id", "name", "monitoringobjectid", "monitoringobjectdisplayname", "description",
+                        "resolutionstate", "timeadded", "monitoringobjectpath"
+                    ]
+            }
+            response = (session.post(scom_ip + '/OperationsManager/data/alert',
+                                     auth=HttpNtlmAuth(domain + '\\' + username, password), verify=False,
+                                     json=data)).json()
+            self.requests_counter += 1
+            self.log.debug("Number of requets: " + str(self.requests_counter))
+            self.send_alert_events(response.get("rows", []))
+
+    def send_alert_events(self, events_data_tree):
         for event in events_data_tree:
             self.event({
                 "timestamp": int(time.time()),
@@ -54,7 +72,7 @@ class SCOM(AgentCheck):
                 "source_type_name": "Alert",
                 "host": event.get("monitoringobjectdisplayname"),
                 "tags": [
-                    "id:%s" % component_id,
+                    "id:%s" % event.get("monitoringobjectid"),
                     "server:%s" % event.get("monitoringobjectpath"),
                     "resolution_state:%s" % event.get("resolutionstate"),
                     "time_added:%s" % event.get("timeadded")
@@ -78,25 +96,88 @@ class SCOM(AgentCheck):
         else:
             return str(healthIconUrl.split("/")[-1])
 
-    def get_component_data_and_relations(self, session, component_id, domain, username, password, scom_ip, types_dict):
+    @staticmethod
+    def create_worker_session(session):
+        worker_session = Session()
+        worker_session.headers.update(session.headers)
+        worker_session.cookies.update(session.cookies)
+        return worker_session
+
+    def get_component_data(self, session, component_id, domain, username, password, scom_ip):
+        return (session.get(scom_ip + '/OperationsManager/data/objectInformation/' + component_id, verify=False,
+                            auth=HttpNtlmAuth(domain + '\\' + username, password))).json()
+
+    def get_component_data_and_relations(self, session, component_ids, domain, username, password, scom_ip,
+                                         types_dict):
+        """
+        Breadth-first traversal of the related objects of component_ids. Every object is requested only once, also
+        when it is related to several objects, and the objects of one level are requested concurrently.
+        :return: the ids of the collected components
+        """
+        visited = set()
+        level = []
+        for component_id in component_ids:
+            if component_id not in visited:
+                visited.add(component_id)
+                level.append(component_id)
+        collected = []
+        # requests.Session is not thread safe and NTLM authenticates the connection, every worker thread uses its
+        # own session with the cookies of the authenticated session
+        worker = threading.local()
+        worker_sessions = []
+        worker_sessions_lock = threading.Lock()
+
+        def get_worker_component_data(cid):
+            worker_session = getattr(worker, 'session', None)
+            if worker_session is None:
+                worker_session = worker.session = self.create_worker_session(session)
+                with worker_sessions_lock:
+                    worker_sessions.append(worker_session)
+            return self.get_component_data(worker_session, cid, domain, username, password, scom_ip)
+
+        pool = Pool(self.max_workers, name="scom")
+        try:
+            while level and self.requests_counter <= self.requests_threshold:
+                # never request more objects than the remaining number of requests
+                level = level[:self.requests_threshold - self.requests_counter + 1]
+                responses = pool.map(get_worker_component_data, level)
+                self.requests_counter += len(level)
+                self.log.debug("Number of requets: " + str(self.requests_counter))
+                next_level = []
+                for component_id, response in zip(level, responses):
+                    relations = self.process_component_data(component_id, response, types_dict)
+                    collected.append(component_id)
+                    for relation in relations:
+                        related_id = relation.get("id")
+                        self.relation("%s" % component_id, "%s" % related_id, "is_connected_to", {})
+                        if related_id not in visited:
+                            visited.add(related_id)
+                            next_level.append(related_id)
+                level = next_level
+        finally:
+            pool.terminate()
+            pool.join()
+            for worker_session in worker_sessions:
+                worker_session.close()
         if self.requests_counter > self.requests_threshold:
             session.close()
-            return
-        response = (session.get(scom_ip + '/OperationsManager/data/objectInformation/' + component_id, verify=False,
-                                auth=HttpNtlmAuth(domain + '\\' + username, password))).json()
-        self.requests_counter += 1
-        self.log.debug("Number of requets: " + str(self.requests_counter))
+        return collected
+
+    def process_component_data(self, component_id, response, types_dict):
+        """
+        Creates the component and health event of a SCOM object
+        :return: the related objects
+        """
         properties = response.get("monitoringObjectProperties", [])
         relations = response.get("relatedObjects", [])
         properties_list = dict()
-        relations_list = []
         for detail in properties:
             properties_list.update({"%s" % detail.get("name"): "%s" % detail.get("value")})
         name = response["displayName"]
         properties_list.update({"id": "%s" % component_id, "name": "%s" % name})
         health = self.get_health_state(response["healthIconUrl"])
         type = "%s" % types_dict.get(component_id)
-        self.component("%s" % component_id, type.encode('utf-8'), properties_list)
+        self.component("%s" % component_id, to_string(type), properties_list)
         self.event({
             "timestamp": int(time.time()),
             "msg_title": "Health Status",
@@ -108,12 +189,7 @@ class SCOM(AgentCheck):
                 "id:%s" % component_id
             ]
         })
-        self.send_alerts(session, component_id, domain, username, password, scom_ip)
-        if relations:
-            for relation in relations:
-                self.relation("%s" % component_id, "%s" % relation.get("id"), "is_connected_to", {})
-                self.get_component_data_and_relations(session, relation.get("id"), domain, username, password, scom_ip,
-                                                      types_dict)
+        return relations or []
 
     def scom_api_check(self, criteria, auth_method, domain, username, password, scom_ip):
         session = Session()
@@ -132,10 +208,10 @@ class SCOM(AgentCheck):
         if component_ids_response.get("errorMessage"):
             self.log.error("Invalid criteria :" + str(component_ids_response.get("errorMessage")))
         else:
-            component_ids = component_ids_response.get("scopeDatas", [])
-            for component in component_ids:
-                self.get_component_data_and_relations(session, component.get("id"), domain, username, password, scom_ip,
-                                                      types_dict)
+            component_ids = [component.get("id") for component in component_ids_response.get("scopeDatas", [])]
+            collected = self.get_component_data_and_relations(session, component_ids, domain, username, password,
+                                                              scom_ip, types_dict)
+            self.send_alerts(session, collected, domain, username, password, scom_ip)
         session.close()
 
     def excute_powershell_cmd(self, scom_server, cmd, ps1):
@@ -225,6 +301,7 @@ class SCOM(AgentCheck):
         auth_method = str(instance.get('auth_mode'))
         integration_mode = str(instance.get('integration_mode', 'api'))
         self.requests_threshold = instance.get('max_number_of_requests', 5000)
+        self.max_workers = int(instance.get('max_workers', DEFAULT_MAX_WORKERS))
         criteria = instance.get('criteria')
         # read configuration file/yaml configuration
         try:
@@ -1,6 +1,11 @@
 # (C) StackState 2020
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
+import threading
+
+import mock
+from requests import Session
+
 from stackstate_checks.scom import SCOM
 
 
@@ -9,3 +14,80 @@ def test_check(aggregator, instance):
     check.check(instance)
 
     aggregator.assert_all_metrics_covered()
+
+
+# A relates to B and C, which both relate to D
+OBJECT_GRAPH = {
+    "A": ["B", "C"],
+    "B": ["D"],
+    "C": ["D"],
+    "D": [],
+}
+
+
+def scom_check(max_number_of_requests=None):
+    check = SCOM('scom', {}, [{'hostip': 'http://scom'}])
+    if max_number_of_requests is not None:
+        check.requests_threshold = max_number_of_requests
+    requested = []
+    requested_lock = threading.Lock()
+
+    def get_component_data(session, component_id, domain, username, password, scom_ip):
+        with requested_lock:
+            requested.append((component_id, session))
+        return {
+            "displayName": component_id,
+            "healthIconUrl": "StatusOkComplete",
+            "monitoringObjectProperties": [],
+            "relatedObjects": [{"id": related_id} for related_id in OBJECT_GRAPH[component_id]],
+        }
+
+    check.get_component_data = get_component_data
+    return check, requested
+
+
+def test_component_data_and_relations_diamond(topology):
+    check, requested = scom_check()
+    session = Session()
+    session.cookies.set("SCOMSessionId", "session-id")
+    collected = check.get_component_data_and_relations(session, ["A", "B"], "domain", "user", "pass",
+                                                       "http://scom", {})
+    # every object is requested once, level by level
+    assert sorted(component_id for component_id, _ in requested) == ["A", "B", "C", "D"]
+    assert collected == ["A", "B", "C", "D"]
+    assert check.requests_counter == 4
+    relations = topology.get_snapshot(check.check_id)['relations']
+    assert sorted((r['source_id'], r['target_id']) for r in relations) == \
+        [("A", "B"), ("A", "C"), ("B", "D"), ("C", "D")]
+    # the workers use their own session with the cookies of the authenticated session
+    for _, worker_session in requested:
+        assert worker_session is not session
+        assert worker_session.cookies.get("SCOMSessionId") == "session-id"
+
+
+def test_component_data_and_relations_request_cap(topology):
+    check, requested = scom_check(max_number_of_requests=1)
+    session = mock.MagicMock()
+    session.headers = {}
+    session.cookies = {}
+    collected = check.get_component_data_and_relations(session, ["A"], "domain", "user", "pass", "http://scom", {})
+    # A and one of its related objects fill the remaining requests, D is not requested
+    assert len(requested) == 2
+    assert collected == [component_id for component_id, _ in requested]
+    assert "D" not in collected
+    session.close.assert_called_once_with()
+
+
+def test_send_alerts_batches(aggregator):
+    check, _ = scom_check()
+    session = mock.MagicMock()
+    session.post.return_value.json.return_value = {"rows": [{"name": "alert", "description": "text"}]}
+    component_ids = ["id-%d" % i for i in range(450)]
+    check.send_alerts(session, component_ids, "domain", "user", "pass", "http://scom")
+
+    criteria = [call[1]["json"]["criteria"] for call in session.post.call_args_list]
+    assert len(criteria) == 3
+    assert criteria[0].count("MonitoringObjectId") == 200
+    assert criteria[2] == "(" + " OR ".join("MonitoringObjectId = 'id-%d'" % i for i in range(400, 450)) + ")"
+    assert check.requests_counter == 3
+    assert len(aggregator.events) == 3
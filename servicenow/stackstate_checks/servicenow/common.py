@@ -11,6 +11,10 @@ CMDB_CI_DEFAULT_FIELD = 'cmdb_ci'
 CR_PLANNED_RESEND_SCHEDULE_IN_HOURS_DEFAULT = 1
 CR_PLANNED_START_DATE_DEFAULT_FIELD = 'start_date'
 CR_PLANNED_END_DATE_DEFAULT_FIELD = 'end_date'
+CMDB_FULL_SNAPSHOT_INTERVAL_IN_HOURS_DEFAULT = 24
+CMDB_SYS_UPDATED_ON_FORMAT = '%Y-%m-%d %H:%M:%S'
+# operator of an encoded query that combines the results of the queries before and after it
+NEW_QUERY = '^NQ'
 
 # keys for which `display_value` has to be used
 DEFAULT_COMPONENT_DISPLAY_VALUE_LIST = [
@@ -4,7 +4,8 @@ from schematics.types import StringType, DateTimeType, ModelType, DictType, List
 from stackstate_checks.servicenow.common import DEFAULT_COMPONENT_DISPLAY_VALUE_LIST, \
     DEFAULT_RELATION_DISPLAY_VALUE_LIST, BATCH_DEFAULT_SIZE, BATCH_MAX_SIZE, TIMEOUT, VERIFY_HTTPS, \
     CRS_BOOTSTRAP_DAYS_DEFAULT, CRS_DEFAULT_PROCESS_LIMIT, CMDB_CI_DEFAULT_FIELD, \
-    CR_PLANNED_RESEND_SCHEDULE_IN_HOURS_DEFAULT, CR_PLANNED_START_DATE_DEFAULT_FIELD, CR_PLANNED_END_DATE_DEFAULT_FIELD
+    CR_PLANNED_RESEND_SCHEDULE_IN_HOURS_DEFAULT, CR_PLANNED_START_DATE_DEFAULT_FIELD, \
+    CR_PLANNED_END_DATE_DEFAULT_FIELD, CMDB_FULL_SNAPSHOT_INTERVAL_IN_HOURS_DEFAULT
 
 
 class WrapperStringType(Model):
@@ -65,6 +66,8 @@ class State(Model):
     latest_sys_updated_on = DateTimeType(required=True)
     change_requests = DictType(StringType, default={})
     sent_planned_crs_cache = ListType(StringType, default=[])
+    cmdb_latest_sys_updated_on = DateTimeType()
+    cmdb_last_full_snapshot = DateTimeType()
 
 
 class InstanceInfo(Model):
@@ -89,4 +92,6 @@ class InstanceInfo(Model):
     planned_change_request_resend_schedule = IntType(default=CR_PLANNED_RESEND_SCHEDULE_IN_HOURS_DEFAULT)
     custom_planned_start_date_field = StringType(default=CR_PLANNED_START_DATE_DEFAULT_FIELD)
     custom_planned_end_date_field = StringType(default=CR_PLANNED_END_DATE_DEFAULT_FIELD)
+    cmdb_incremental_sync = BooleanType(default=False)
+    cmdb_full_snapshot_interval = IntType(default=CMDB_FULL_SNAPSHOT_INTERVAL_IN_HOURS_DEFAULT, min_value=1)
     state = ModelType(State)
@@ -8,7 +8,7 @@ from requests import Session
 
 from stackstate_checks.servicenow import State, InstanceInfo
 from stackstate_checks.servicenow.common import API_SNOW_TABLE_CMDB_CI, API_SNOW_TABLE_CMDB_REL_CI, \
-    API_SNOW_TABLE_CHANGE_REQUEST
+    API_SNOW_TABLE_CHANGE_REQUEST, CMDB_SYS_UPDATED_ON_FORMAT, NEW_QUERY
 from stackstate_checks.servicenow.models import ChangeRequest, ConfigurationItem, CIRelation
 
 try:
@@ -27,6 +27,10 @@ class ServicenowCheck(AgentCheck):
     SERVICE_CHECK_NAME = "servicenow.cmdb.topology_information"
     INSTANCE_SCHEMA = InstanceInfo
 
+    def __init__(self, *args, **kwargs):
+        super(ServicenowCheck, self).__init__(*args, **kwargs)
+        self.session = None
+
     def get_instance_key(self, instance_info):
         return StackPackInstance(self.INSTANCE_TYPE, str(instance_info.url))
 
@@ -42,12 +46,26 @@ class ServicenowCheck(AgentCheck):
                     }
                 )
 
-            self.start_snapshot()
-            self._process_components(instance_info)
-            self._process_relations(instance_info)
+            full_snapshot = self._is_full_snapshot_due(instance_info)
+            updated_since = None if full_snapshot else instance_info.state.cmdb_latest_sys_updated_on
+            run_started_on = datetime.datetime.now()
+            if full_snapshot:
+                self.start_snapshot()
+            else:
+                self.log.info('Collecting CIs and relations updated since %s.', updated_since)
+            components_updated_on = self._process_components(instance_info, updated_since)
+            relations_updated_on = self._process_relations(instance_info, updated_since)
             self._process_change_requests(instance_info)
             self._process_planned_change_requests(instance_info)
-            self.stop_snapshot()
+            if full_snapshot:
+                self.stop_snapshot()
+                instance_info.state.cmdb_last_full_snapshot = run_started_on
+            # the watermark only moves once the CIs and relations are all processed, a failed run is retried
+            # from the previous watermark
+            for sys_updated_on in (components_updated_on, relations_updated_on):
+                instance_info.state.cmdb_latest_sys_updated_on = self._latest(
+                    instance_info.state.cmdb_latest_sys_updated_on, sys_updated_on
+                )
             msg = "ServiceNow CMDB instance detected at %s " % instance_info.url
             tags = ["url:%s" % instance_info.url]
             self.service_check(self.SERVICE_CHECK_NAME, AgentCheck.OK, tags=tags, message=msg)
@@ -58,6 +76,34 @@ class ServicenowCheck(AgentCheck):
                 self.SERVICE_CHECK_NAME, AgentCheck.CRITICAL, message=msg, tags=instance_info.instance_tags
             )
 
+    def _is_full_snapshot_due(self, instance_info):
+        """
+        With cmdb_incremental_sync every run only collects the CIs and relations updated since the last run, a full
+        snapshot that also removes the deleted CIs and relations is taken every cmdb_full_snapshot_interval hours.
+        :return: True when all CIs and relations have to be collected in a snapshot
+        """
+        if not instance_info.cmdb_incremental_sync:
+            return True
+        state = instance_info.state
+        if not state.cmdb_latest_sys_updated_on or not state.cmdb_last_full_snapshot:
+            return True
+        next_full_snapshot = state.cmdb_last_full_snapshot + datetime.timedelta(
+            hours=instance_info.cmdb_full_snapshot_interval
+        )
+        return datetime.datetime.now() >= next_full_snapshot
+
+    def _get_sys_updated_on_filter_query(self, updated_since):
+        """
+        Return the sysparm_query for elements updated since the watermark of the previous run. Elements updated in the
+        same second as the watermark are collected again, these are only sent twice instead of being missed.
+        :param updated_since: datetime of the watermark or None for all elements
+        :return: sysparm_query for url or ""
+        """
+        if not updated_since:
+            return ""
+        reformatted_date = updated_since.strftime("'%Y-%m-%d', '%H:%M:%S'")
+        return 'sys_updated_on>=javascript:gs.dateGenerate(%s)' % reformatted_date
+
     def _get_sys_class_component_filter_query(self, sys_class_filter):
         """
         Return the sys_parm_query on the basis of sys_class_name filters from configuration
@@ -108,7 +154,7 @@ class ServicenowCheck(AgentCheck):
 
         return result
 
-    def _batch_collect_components(self, instance_info, offset):
+    def _batch_collect_components(self, instance_info, last_sys_id, updated_since=None):
         """
         collect components from ServiceNow CMDB's cmdb_ci table
         (API Doc- https://developer.servicenow.com/app.do#!/rest_api_doc?v=london&id=r_TableAPI-GET)
@@ -121,45 +167,73 @@ class ServicenowCheck(AgentCheck):
         sys_class_filter_query = self._get_sys_class_component_filter_query(instance_info.include_resource_types)
         params = self._params_append_to_sysparm_query(add_to_query=sys_class_filter_query)
         params = self._params_append_to_sysparm_query(add_to_query=instance_info.cmdb_ci_sysparm_query, params=params)
-        params = self._prepare_json_batch_params(params, offset, instance_info.batch_size)
+        params = self._params_append_to_sysparm_query(add_to_query=self._get_sys_updated_on_filter_query(updated_since),
+                                                      params=params)
+        params = self._prepare_json_batch_params(params, last_sys_id, instance_info.batch_size)
         return self._get_json(url, instance_info.timeout, params, auth, instance_info.verify_https, cert)
 
-    def _batch_collect(self, collect_function, instance_info):
+    def _batch_collect(self, collect_function, instance_info, updated_since=None):
         """
-        batch processing of components or relations fetched from CMDB
-        :return: collected components
+        batch processing of components or relations fetched from CMDB, batches are requested by keyset pagination
+        on sys_id and the next batch is only requested when all elements of the current batch are processed.
+        :return: generator of collected elements
         """
-        offset = 0
+        last_sys_id = None
         batch_number = 0
         completed = False
-        collection = []
 
         while not completed:
-            elements = collect_function(instance_info, offset)
+            elements = collect_function(instance_info, last_sys_id, updated_since)
             if "result" in elements and isinstance(elements["result"], list):
                 number_of_elements_in_current_batch = len(elements.get("result"))
             else:
                 raise CheckException('Method %s has no result' % collect_function)
             completed = number_of_elements_in_current_batch < instance_info.batch_size
-            collection.extend(elements['result'])
             batch_number += 1
-            offset += instance_info.batch_size
             self.log.info(
                 '%s processed batch no. %d with %d items.',
                 collect_function.__name__, batch_number, number_of_elements_in_current_batch
             )
+            for element in elements['result']:
+                yield element
+            if not completed:
+                last_sys_id = self._get_sys_id(elements['result'][-1])
+                if not last_sys_id:
+                    raise CheckException('Method %s returned an element without sys_id' % collect_function)
+
+    @staticmethod
+    def _get_sys_id(element):
+        sys_id = element.get('sys_id')
+        if isinstance(sys_id, dict):
+            sys_id = sys_id.get('value')
+        return sys_id
 
-        return collection
+    @staticmethod
+    def _get_sys_updated_on(element):
+        sys_updated_on = element.get('sys_updated_on')
+        if isinstance(sys_updated_on, dict):
+            sys_updated_on = sys_updated_on.get('value')
+        try:
+            return datetime.datetime.strptime(sys_updated_on, CMDB_SYS_UPDATED_ON_FORMAT)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _latest(latest_sys_updated_on, sys_updated_on):
+        if sys_updated_on and (not latest_sys_updated_on or sys_updated_on > latest_sys_updated_on):
+            return sys_updated_on
+        return latest_sys_updated_on
 
-    def _process_components(self, instance_info):
+    def _process_components(self, instance_info, updated_since=None):
         """
         Gets SNOW components name, external_id and other identifiers
         :param instance_info:
-        :return: None
+        :param updated_since: only process the components updated since this datetime, None for all components
+        :return: the latest sys_updated_on of the processed components
         """
-        collected_components = self._batch_collect(self._batch_collect_components, instance_info)
-
-        for component in collected_components:
+        latest_sys_updated_on = None
+        for component in self._batch_collect(self._batch_collect_components, instance_info, updated_since):
+            latest_sys_updated_on = self._latest(latest_sys_updated_on, self._get_sys_updated_on(component))
             try:
                 config_item = ConfigurationItem(component, strict=False)
                 config_item.validate()
@@ -191,8 +265,9 @@ class ServicenowCheck(AgentCheck):
             data.update({"identifiers": identifiers, "tags": tags})
 
             self.component(external_id, comp_type, data)
+        return latest_sys_updated_on
 
-    def _batch_collect_relations(self, instance_info, offset):
+    def _batch_collect_relations(self, instance_info, last_sys_id, updated_since=None):
         """
         collect relations between components from cmdb_rel_ci and publish these in batches.
         """
@@ -203,15 +278,19 @@ class ServicenowCheck(AgentCheck):
         params = self._params_append_to_sysparm_query(add_to_query=sys_class_filter_query)
         params = self._params_append_to_sysparm_query(add_to_query=instance_info.cmdb_rel_ci_sysparm_query,
                                                       params=params)
-        params = self._prepare_json_batch_params(params, offset, instance_info.batch_size)
+        params = self._params_append_to_sysparm_query(add_to_query=self._get_sys_updated_on_filter_query(updated_since),
+                                                      params=params)
+        params = self._prepare_json_batch_params(params, last_sys_id, instance_info.batch_size)
         return self._get_json(url, instance_info.timeout, params, auth, instance_info.verify_https, cert)
 
-    def _process_relations(self, instance_info):
+    def _process_relations(self, instance_info, updated_since=None):
         """
         process relations
+        :return: the latest sys_updated_on of the processed relations
         """
-        collected_relations = self._batch_collect(self._batch_collect_relations, instance_info)
-        for relation in collected_relations:
+        latest_sys_updated_on = None
+        for relation in self._batch_collect(self._batch_collect_relations, instance_info, updated_since):
+            latest_sys_updated_on = self._latest(latest_sys_updated_on, self._get_sys_updated_on(relation))
             try:
                 ci_relation = CIRelation(relation, strict=False)
                 ci_relation.validate()
@@ -235,6 +314,7 @@ class ServicenowCheck(AgentCheck):
             data.update({"tags": tags})
 
             self.relation(parent_sys_id, child_sys_id, relation_type, data)
+        return latest_sys_updated_on
 
     def _collect_change_requests_updates(self, instance_info):
         """
@@ -435,50 +515,69 @@ class ServicenowCheck(AgentCheck):
             params.update({'sysparm_query': sysparm_query})
         return params
 
-    def _prepare_json_batch_params(self, params, offset, batch_size):
-        params = self._params_append_to_sysparm_query("ORDERBYsys_created_on", params)
+    def _prepare_json_batch_params(self, params, last_sys_id, batch_size):
+        """
+        Keyset pagination: the elements are ordered by sys_id and a batch starts after the last sys_id of the
+        previous batch, so ServiceNow doesn't need to skip over all previous batches like with sysparm_offset.
+        The sys_id condition is added to every sub-query of a query combined with ^NQ.
+        """
+        if last_sys_id:
+            sys_id_query = "sys_id>%s" % last_sys_id
+            sysparm_query = params.get('sysparm_query', '')
+            if sysparm_query:
+                params['sysparm_query'] = NEW_QUERY.join(
+                    "%s^%s" % (query, sys_id_query) if query else sys_id_query
+                    for query in sysparm_query.split(NEW_QUERY)
+                )
+            else:
+                params = self._params_append_to_sysparm_query(sys_id_query, params)
+        params = self._params_append_to_sysparm_query("ORDERBYsys_id", params)
         params.update(
             {
                 'sysparm_display_value': 'all',
-                'sysparm_offset': offset,
                 'sysparm_limit': batch_size
             }
         )
         return params
 
+    def _get_session(self):
+        """
+        All requests to ServiceNow go over one session that keeps the connection alive between the batches
+        """
+        if self.session is None:
+            self.session = Session()
+        return self.session
+
     def _get_json(self, url, timeout, params, auth=None, verify=True, cert=None):
         execution_time_exceeded_error_message = 'Transaction cancelled: maximum execution time exceeded'
 
-        with Session() as session:
-            session.verify = verify
-            if cert:
-                session.cert = cert
-            response = session.get(url, params=params, auth=auth, timeout=timeout)
+        response = self._get_session().get(url, params=params, auth=auth, timeout=timeout, verify=verify,
+                                           cert=cert if cert and cert[0] else None)
 
-            if response.status_code != 200:
-                raise CheckException('Got status: %d when hitting %s' % (response.status_code, response.url))
+        if response.status_code != 200:
+            raise CheckException('Got status: %d when hitting %s' % (response.status_code, response.url))
 
-            try:
-                response_json = json.loads(response.text.encode('utf-8'))
-            except UnicodeEncodeError as e:
-                raise CheckException('Encoding error: "%s" in response from url %s' % (e, response.url))
-            except json_parse_exception as e:
-                # Fix for ServiceNow bug: Sometimes there is a response with status 200 and malformed json with
-                # error message 'Transaction cancelled: maximum execution time exceeded'.
-                # We send right error message because ParserError is just side effect error.
-                if execution_time_exceeded_error_message in response.text:
-                    error_msg = 'ServiceNow Error "%s" in response from url %s' % (
-                        execution_time_exceeded_error_message, response.url
-                    )
-                else:
-                    error_msg = 'Json parse error: "%s" in response from url %s' % (e, response.url)
-                raise CheckException(error_msg)
-
-            if response_json.get('error'):
-                raise CheckException('ServiceNow error: "%s" in response from url %s' %
-                                     (response_json['error'].get('message'), response.url))
-
-            if response_json.get('result'):
-                self.log.debug('Got %d results in response', len(response_json['result']))
+        try:
+            response_json = json.loads(response.text.encode('utf-8'))
+        except UnicodeEncodeError as e:
+            raise CheckException('Encoding error: "%s" in response from url %s' % (e, response.url))
+        except json_parse_exception as e:
+            # Fix for ServiceNow bug: Sometimes there is a response with status 200 and malformed json with
+            # error message 'Transaction cancelled: maximum execution time exceeded'.
+            # We send right error message because ParserError is just side effect error.
+            if execution_time_exceeded_error_message in response.text:
+                error_msg = 'ServiceNow Error "%s" in response from url %s' % (
+                    execution_time_exceeded_error_message, response.url
+                )
+            else:
+                error_msg = 'Json parse error: "%s" in response from url %s' % (e, response.url)
+            raise CheckException(error_msg)
+
+        if response_json.get('error'):
+            raise CheckException('ServiceNow error: "%s" in response from url %s' %
+                                 (response_json['error'].get('message'), response.url))
+
+        if response_json.get('result'):
+            self.log.debug('Got %d results in response', len(response_json['result']))
 
         return response_json
@@ -4,6 +4,7 @@
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
 
+import datetime
 import json
 import os
 import unittest
@@ -12,6 +13,7 @@ from copy import copy
 import mock
 import pytest
 import requests
+from freezegun import freeze_time
 from six import PY3
 
 from stackstate_checks.base import AgentIntegrationTestUtil, AgentCheck, TopologyInstance
@@ -280,6 +282,24 @@ instance_info = InstanceInfo(
 )
 
 
+mock_collect_updated_components = {
+    'result': [
+        {
+            'name': {'display_value': 'lnux100', 'value': 'lnux100'},
+            'sys_class_name': {'display_value': 'Linux Server', 'value': 'cmdb_ci_linux_server'},
+            'sys_id': {'value': '3a9ef9d1c0a8016400a5a2d1a7cbe7a9'},
+            'sys_updated_on': {'display_value': '2021-05-10 14:00:00', 'value': '2021-05-10 12:00:00'}
+        },
+        {
+            'name': {'display_value': 'lnux101', 'value': 'lnux101'},
+            'sys_class_name': {'display_value': 'Linux Server', 'value': 'cmdb_ci_linux_server'},
+            'sys_id': {'value': '3a9ef9d1c0a8016400a5a2d1a7cbe7b1'},
+            'sys_updated_on': {'display_value': '2021-05-09 14:00:00', 'value': '2021-05-09 12:00:00'}
+        }
+    ]
+}
+
+
 def mock_get_json(url, timeout, params, auth=None, verify=True, cert=None):
     """Mock method that returns params generated for use in _get_json_batch"""
     return params
@@ -304,7 +324,8 @@ class TestServicenow(unittest.TestCase):
         Testing Servicenow check.
         """
         self.check._collect_relation_types = mock_collect_process
-        self.check._batch_collect = mock_collect_process
+        self.check._batch_collect_components = mock_collect_process
+        self.check._batch_collect_relations = mock_collect_process
 
         self.check.run()
 
@@ -344,7 +365,6 @@ class TestServicenow(unittest.TestCase):
         self.check._batch_collect_components = mock.MagicMock()
         self.check._batch_collect_components.return_value = mock_collect_components
         self.check._batch_collect_components.__name__ = 'mock_batch_collect_components'
-        self.check._batch_collect(self.check._batch_collect_components, instance_info)
         self.check._process_components(instance_info)
 
         topo_instances = topology.get_snapshot(self.check.check_id)
@@ -553,6 +573,9 @@ class TestServicenow(unittest.TestCase):
         self.check._process_components(new_inst_conf)
         topology_instance = topology.get_snapshot(self.check.check_id)
         self.assertEqual(len(topology_instance['components']), 6)
+        # the next batch starts after the sys_id of the last element of the previous batch
+        self.assertEqual([call[0][1] for call in self.check._batch_collect_components.call_args_list],
+                         [None, '01a9ec0d3790200044e0bfc8bcbe5dc3'])
 
     def test_mandatory_instance_values(self):
         """
@@ -592,32 +615,31 @@ class TestServicenow(unittest.TestCase):
         """
         Test json batch params
         """
-        offset = 10
         batch_size = 200
-        params = self.check._prepare_json_batch_params(params={}, offset=offset, batch_size=batch_size)
-        self.assertEqual(offset, params.get('sysparm_offset'))
+        params = self.check._prepare_json_batch_params(params={}, last_sys_id=None, batch_size=batch_size)
+        self.assertNotIn('sysparm_offset', params)
         self.assertEqual(batch_size, params.get('sysparm_limit'))
-        self.assertEqual('ORDERBYsys_created_on', params.get('sysparm_query'))
+        self.assertEqual('ORDERBYsys_id', params.get('sysparm_query'))
 
     def test_json_batch_adding_param(self):
         """
         Test batch path construction adding to sysparm_query
         """
-        offset = 10
         batch_size = 200
         params = self.check._prepare_json_batch_params(params={'sysparm_query': 'company.nameSTARTSWITHaxa'},
-                                                       offset=offset,
+                                                       last_sys_id='00a96c0d3790200044e0bfc8bcbe5db4',
                                                        batch_size=batch_size)
-        self.assertEqual(offset, params.get('sysparm_offset'))
+        self.assertNotIn('sysparm_offset', params)
         self.assertEqual(batch_size, params.get('sysparm_limit'))
-        self.assertEqual('company.nameSTARTSWITHaxa^ORDERBYsys_created_on', params.get('sysparm_query'))
+        self.assertEqual('company.nameSTARTSWITHaxa^sys_id>00a96c0d3790200044e0bfc8bcbe5db4^ORDERBYsys_id',
+                         params.get('sysparm_query'))
 
     def test_collect_components_returns_no_result(self):
         """Test if collect component returns no result or its not list"""
         self.check._batch_collect_components = mock.MagicMock()
         self.check._batch_collect_components.return_value = {}
         self.assertRaises(
-            CheckException, self.check._batch_collect, self.check._batch_collect_components, instance_info
+            CheckException, list, self.check._batch_collect(self.check._batch_collect_components, instance_info)
         )
 
     def test_collect_components_returns_empty_result(self):
@@ -625,7 +647,7 @@ class TestServicenow(unittest.TestCase):
         self.check._batch_collect_components = mock.MagicMock()
         self.check._batch_collect_components.return_value = mock_empty_result
         self.check._batch_collect_components.__name__ = 'mock_batch_collect_components'
-        self.check._batch_collect(self.check._batch_collect_components, instance_info)
+        self.check._process_components(instance_info)
 
         # no snapshot is created
         self.assertRaises(KeyError, topology.get_snapshot, self.check.check_id)
@@ -682,6 +704,33 @@ class TestServicenow(unittest.TestCase):
         result = json.loads(check.run())
         self.assertEqual('{"batch_size": ["Int value should be less than or equal to 10000."]}', result[0]['message'])
 
+    def test_batch_collect_new_query(self):
+        """
+        Test every sub-query of a query combined with ^NQ only requests the elements after the previous batch
+        """
+        requested_params = []
+        batches = [
+            {'result': [{'sys_id': {'value': 'sys_id_1'}}, {'sys_id': {'value': 'sys_id_2'}}]},
+            {'result': [{'sys_id': {'value': 'sys_id_3'}}]},
+        ]
+
+        def get_json(url, timeout, params, auth=None, verify=True, cert=None):
+            requested_params.append(dict(params))
+            return batches[len(requested_params) - 1]
+
+        self.check._get_json = get_json
+        instance_info['cmdb_ci_sysparm_query'] = "company.nameSTARTSWITHaxa^NQcompany.nameSTARTSWITHabc"
+        instance_info['include_resource_types'] = []
+        instance_info.batch_size = 2
+        elements = list(self.check._batch_collect(self.check._batch_collect_components, instance_info))
+
+        self.assertEqual([self.check._get_sys_id(element) for element in elements],
+                         ['sys_id_1', 'sys_id_2', 'sys_id_3'])
+        self.assertEqual([params['sysparm_query'] for params in requested_params], [
+            "company.nameSTARTSWITHaxa^NQcompany.nameSTARTSWITHabc^ORDERBYsys_id",
+            "company.nameSTARTSWITHaxa^sys_id>sys_id_2^NQcompany.nameSTARTSWITHabc^sys_id>sys_id_2^ORDERBYsys_id",
+        ])
+
     @mock.patch('requests.Session.get')
     def test_get_json_timeout(self, mock_request_get):
         """
@@ -749,7 +798,6 @@ class TestServicenow(unittest.TestCase):
         self.check._batch_collect_components = mock.MagicMock()
         self.check._batch_collect_components.return_value = collect_components_with_fqdn_umlaut
         self.check._batch_collect_components.__name__ = 'mock_batch_collect_components'
-        self.check._batch_collect(self.check._batch_collect_components, instance_info)
         self.check._process_components(instance_info)
         topo_instances = topology.get_snapshot(self.check.check_id)
         self.assertEqual(
@@ -766,11 +814,11 @@ class TestServicenow(unittest.TestCase):
         instance_info['cmdb_ci_sysparm_query'] = "company.nameSTARTSWITHaxa"
         instance_info['include_resource_types'] = ['cmdb_ci_netgear']
         instance_info.batch_size = 100
-        params = self.check._batch_collect_components(instance_info, 0)
-        self.assertEqual(params.get("sysparm_offset"), 0)
+        params = self.check._batch_collect_components(instance_info, None)
+        self.assertNotIn("sysparm_offset", params)
         self.assertEqual(params.get('sysparm_limit'), 100)
         self.assertEqual(params.get('sysparm_query'), "sys_class_nameINcmdb_ci_netgear^company.nameSTARTSWITHaxa"
-                                                      "^ORDERBYsys_created_on")
+                                                      "^ORDERBYsys_id")
 
     def test_batch_collect_relations_sys_filter_with_query_filter(self):
         """
@@ -782,12 +830,12 @@ class TestServicenow(unittest.TestCase):
                                                      "ORchild.company.nameSTARTSWITHaxa"
         instance_info['include_resource_types'] = ['cmdb_ci_netgear']
         instance_info.batch_size = 100
-        params = self.check._batch_collect_relations(instance_info, 0)
-        self.assertEqual(params.get("sysparm_offset"), 0)
+        params = self.check._batch_collect_relations(instance_info, None)
+        self.assertNotIn("sysparm_offset", params)
         self.assertEqual(params.get('sysparm_limit'), 100)
         self.assertEqual(params.get('sysparm_query'), "parent.sys_class_nameINcmdb_ci_netgear^child.sys_class_nameIN"
                                                       "cmdb_ci_netgear^parent.company.nameSTARTSWITHaxa"
-                                                      "^ORchild.company.nameSTARTSWITHaxa^ORDERBYsys_created_on")
+                                                      "^ORchild.company.nameSTARTSWITHaxa^ORDERBYsys_id")
 
     def test_collect_change_requests_sys_filter_with_query_filter(self):
         """
@@ -804,6 +852,67 @@ class TestServicenow(unittest.TestCase):
         self.assertEqual(params.get('sysparm_query'), "sys_updated_on>javascript:gs.dateGenerate('2017-06-29', "
                                                       "'11:03:27')^company.nameSTARTSWITHaxa")
 
+    def test_batch_collect_sys_updated_on_filter(self):
+        """
+        Test the components and relations batches only contain the elements updated since the watermark
+        """
+        self.check._get_json = mock_get_json
+        instance_info['cmdb_ci_sysparm_query'] = None
+        instance_info['cmdb_rel_ci_sysparm_query'] = None
+        instance_info['include_resource_types'] = []
+        updated_since = datetime.datetime(2021, 5, 10, 12, 0, 0)
+        params = self.check._batch_collect_components(instance_info, None, updated_since)
+        self.assertEqual(params.get('sysparm_query'), "sys_updated_on>=javascript:gs.dateGenerate('2021-05-10', "
+                                                      "'12:00:00')^ORDERBYsys_id")
+        params = self.check._batch_collect_relations(instance_info, '3a9ef9d1c0a8016400a5a2d1a7cbe7a9', updated_since)
+        self.assertEqual(params.get('sysparm_query'), "sys_updated_on>=javascript:gs.dateGenerate('2021-05-10', "
+                                                      "'12:00:00')^sys_id>3a9ef9d1c0a8016400a5a2d1a7cbe7a9"
+                                                      "^ORDERBYsys_id")
+
+    def test_incremental_sync(self):
+        """
+        Test the runs between the full snapshots only collect the CIs and relations updated since the previous run
+        """
+        instance = copy(self.instance)
+        instance['cmdb_incremental_sync'] = True
+        instance['cmdb_full_snapshot_interval'] = 12
+        check = ServicenowCheck('servicenow', {}, {}, [instance])
+        check._get_json = mock.MagicMock(return_value={'result': []})
+        check._batch_collect_components = mock.MagicMock(return_value=mock_collect_updated_components)
+        check._batch_collect_components.__name__ = 'mock_batch_collect_components'
+        check._batch_collect_relations = mock.MagicMock(return_value={'result': []})
+        check._batch_collect_relations.__name__ = 'mock_batch_collect_relations'
+
+        def run_check(now):
+            topology.reset()
+            with freeze_time(now):
+                check.run()
+            return topology.get_snapshot(check.check_id)
+
+        try:
+            # the first run collects all CIs in a snapshot
+            topo_instance = run_check('2021-05-10 13:00:00')
+            self.assertEqual(topo_instance['start_snapshot'], True)
+            self.assertEqual(topo_instance['stop_snapshot'], True)
+            self.assertEqual(len(topo_instance['components']), 2)
+            self.assertIsNone(check._batch_collect_components.call_args[0][2])
+
+            # the next run only collects the CIs updated since the latest sys_updated_on without a snapshot
+            topo_instance = run_check('2021-05-10 14:00:00')
+            self.assertEqual(topo_instance['start_snapshot'], False)
+            self.assertEqual(topo_instance['stop_snapshot'], False)
+            self.assertEqual(len(topo_instance['components']), 2)
+            self.assertEqual(check._batch_collect_components.call_args[0][2], datetime.datetime(2021, 5, 10, 12))
+            self.assertEqual(check._batch_collect_relations.call_args[0][2], datetime.datetime(2021, 5, 10, 12))
+
+            # the full snapshot removes the deleted CIs once the interval has passed
+            topo_instance = run_check('2021-05-11 01:00:00')
+            self.assertEqual(topo_instance['start_snapshot'], True)
+            self.assertEqual(topo_instance['stop_snapshot'], True)
+            self.assertIsNone(check._batch_collect_components.call_args[0][2])
+        finally:
+            check.commit_state(None)
+
     def _get_url_auth(self):
         url = "{}/api/now/table/cmdb_ci".format(self.instance.get('url'))
         auth = (self.instance.get('user'), self.instance.get('password'))
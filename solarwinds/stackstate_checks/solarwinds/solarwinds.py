@@ -93,9 +93,16 @@ class SolarWindsCheck(AgentCheck):
         # Add Interface objects to the Node objects where applicable
         # Also create a new list of connections (relations) between interfaces
         nodes = []
+        # Index the nodes and interfaces by id and the query results by interface id, so every lookup is constant
+        # time instead of a scan over all nodes or query results
+        nodes_by_id = {}
+        interfaces_by_id = {}
+        npm_data_by_interface_id = {}
+        for npm_node in npm_data:
+            npm_data_by_interface_id.setdefault(npm_node.get("InterfaceID"), npm_node)
         for npm_node in npm_data:
             # Is this NodeID present in the list of nodes?
-            found_node = next((sub for sub in nodes if sub.node_id == npm_node.get("NodeID")), None)
+            found_node = nodes_by_id.get(npm_node.get("NodeID"))
             if not found_node:
                 # New node, create it and add it to the list
                 nodes.append(
@@ -110,12 +117,13 @@ class SolarWindsCheck(AgentCheck):
                     )
                 )
                 found_node = nodes[-1]
+                nodes_by_id[found_node.node_id] = found_node
             # Is there an interface for this node?
             interface_id = npm_node.get("InterfaceID")
             if interface_id:
                 # Is this interface present in the list of interfaces on this node?
                 # For new nodes, this would not be necessary
-                found_interface = next((sub for sub in found_node.interfaces if sub.interface_id == interface_id), None)
+                found_interface = interfaces_by_id.get((found_node.node_id, interface_id))
                 if not found_interface:
                     # New interface, create it and add it to the list
                     found_node.append_interface(
@@ -127,11 +135,12 @@ class SolarWindsCheck(AgentCheck):
                         self.base_url + npm_node.get("InterfaceDetailsUrl"),
                     )
                     found_interface = found_node.interfaces[-1]
+                    interfaces_by_id[(found_node.node_id, interface_id)] = found_interface
                 # Is there a connection to this interface?
                 dest_interface_id = npm_node.get("DestInterfaceID")
                 if dest_interface_id:
                     # Is the destination node (of this interface) present in the solarwinds data?
-                    found_dest_node = next((sub for sub in npm_data if sub["InterfaceID"] == dest_interface_id), None)
+                    found_dest_node = npm_data_by_interface_id.get(dest_interface_id)
                     if found_dest_node:
                         dest_node_name = found_dest_node.get("Caption")
                         dest_interface_name = found_dest_node.get("IfName")
@@ -168,6 +177,7 @@ class SolarWindsCheck(AgentCheck):
 
     def add_udt_topology(self, udt_topology_data, npm_topology):
         self.log.info("Add UDT topology information to NPM topology data")
+        topology_index = NpmTopologyIndex(npm_topology)
         for udt_connection in udt_topology_data:
             src_node_name = OrionComponent.strip_domain(udt_connection.get("ConnectedTo"))
             src_interface_name = udt_connection.get("PortNumber")
@@ -178,12 +188,10 @@ class SolarWindsCheck(AgentCheck):
                 dest_node_name = dest_ip_address
 
             # Find the source node to connect from
-            found_src_node = next((sub for sub in npm_topology if sub.caption == src_node_name), None)
+            found_src_node = topology_index.nodes_by_caption.get(src_node_name)
             if found_src_node:
                 # Find the interface to connect from
-                found_src_interface = next(
-                    (sub for sub in found_src_node.interfaces if sub.interface_name == src_interface_name), None
-                )
+                found_src_interface = topology_index.get_interface_by_name(found_src_node, src_interface_name)
                 if found_src_interface:
                     # If there already is a connection that came from NPM,
                     # there is a chance of creating a duplicate here
@@ -191,12 +199,10 @@ class SolarWindsCheck(AgentCheck):
                     found_src_interface.append_connection(dest_node_name, "", dest_mac_address)
 
             # Are there matching destination nodes for this connection?
-            found_dest_node = next((sub for sub in npm_topology if sub.ip_address == dest_ip_address), None)
+            found_dest_node = topology_index.nodes_by_ip_address.get(dest_ip_address)
             if found_dest_node:
                 # Does this node have a matching interface to connect to?
-                found_dest_interface = next(
-                    (sub for sub in found_dest_node.interfaces if sub.mac_address == dest_mac_address), None
-                )
+                found_dest_interface = topology_index.get_interface_by_mac_address(found_dest_node, dest_mac_address)
                 if not found_dest_interface:
                     # No matching interface on existing node, create one
                     found_dest_node.append_interface(
@@ -207,6 +213,7 @@ class SolarWindsCheck(AgentCheck):
                         found_dest_node.domain,
                         None
                     )
+                    topology_index.add_interface(found_dest_node, found_dest_node.interfaces[-1])
             else:
                 # No matching node found, create one and add it to the list
                 npm_topology.append(
@@ -229,6 +236,7 @@ class SolarWindsCheck(AgentCheck):
                     found_src_node.domain,
                     None
                 )
+                topology_index.add_node(npm_topology[-1])
 
     def register_components(self, npm_topology):
         self.log.info("Register SolarWinds Orion components (nodes & interfaces)")
@@ -365,6 +373,38 @@ class SolarWindsCheck(AgentCheck):
             )
 
 
+class NpmTopologyIndex:
+    """
+    Lookup of the nodes by caption and IP address and of their interfaces by name and MAC address. For every key the
+    first node or interface is kept, the same one a scan over the nodes or interfaces would find.
+    """
+
+    def __init__(self, nodes):
+        self.nodes_by_caption = {}
+        self.nodes_by_ip_address = {}
+        self._interfaces_by_name = {}
+        self._interfaces_by_mac_address = {}
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, node):
+        self.nodes_by_caption.setdefault(node.caption, node)
+        self.nodes_by_ip_address.setdefault(node.ip_address, node)
+        for interface in node.interfaces:
+            self.add_interface(node, interface)
+
+    def add_interface(self, node, interface):
+        # Nodes created for UDT endpoints share node id -1, so the interfaces are indexed per node object
+        self._interfaces_by_name.setdefault((id(node), interface.interface_name), interface)
+        self._interfaces_by_mac_address.setdefault((id(node), interface.mac_address), interface)
+
+    def get_interface_by_name(self, node, interface_name):
+        return self._interfaces_by_name.get((id(node), interface_name))
+
+    def get_interface_by_mac_address(self, node, mac_address):
+        return self._interfaces_by_mac_address.get((id(node), mac_address))
+
+
 class OrionComponent:
     environment = "Production"
     component_registered = False
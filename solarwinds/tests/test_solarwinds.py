@@ -3,6 +3,7 @@
 # Licensed under a 3-clause BSD style license (see LICENSE)
 import json
 from stackstate_checks.base.utils.common import read_file, load_json_from_file
+from stackstate_checks.solarwinds.solarwinds import Node, NpmTopologyIndex
 
 npm_topology = None
 udt_topology_data = None
@@ -71,3 +72,21 @@ def test_add_udt_topology(solarwinds_check):
     serialized_npm_topology = json.loads(json.dumps(npm_topology, indent=4, default=lambda o: o.__dict__))
     expected_npm_and_udt_topology = json.loads(read_file("npm_and_udt_topology_dumps.json", "samples"))
     assert serialized_npm_topology == expected_npm_and_udt_topology
+
+
+def test_npm_topology_index():
+    first_node = Node(1, "switch1", "10.0.0.1", "Up", "Alkmaar", "Network", "/node/1")
+    first_node.append_interface(11, "Gi0/1", "00AA00AA00AA", "Up", "Alkmaar", "/interface/11")
+    first_node.append_interface(12, "Gi0/1", "00BB00BB00BB", "Up", "Alkmaar", "/interface/12")
+    second_node = Node(2, "switch1", "10.0.0.1", "Up", "Alkmaar", "Network", "/node/2")
+    topology_index = NpmTopologyIndex([first_node, second_node])
+    # the first node and interface are found, like a scan over the topology would
+    assert topology_index.nodes_by_caption.get("switch1") is first_node
+    assert topology_index.nodes_by_ip_address.get("10.0.0.1") is first_node
+    assert topology_index.get_interface_by_name(first_node, "Gi0/1") is first_node.interfaces[0]
+    assert topology_index.get_interface_by_mac_address(first_node, "00BB00BB00BB") is first_node.interfaces[1]
+    assert topology_index.get_interface_by_name(second_node, "Gi0/1") is None
+
+    second_node.append_interface(-1, "Int", "00CC00CC00CC", "Up", "Alkmaar", None)
+    topology_index.add_interface(second_node, second_node.interfaces[-1])
+    assert topology_index.get_interface_by_mac_address(second_node, "00CC00CC00CC") is second_node.interfaces[-1]
@@ -1,32 +1,79 @@
 # (C) Datadog, Inc. 2018
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
+import importlib
+import sys
+
 from .__about__ import __version__
-from .checks import AgentCheck, TopologyInstance, StackPackInstance, AgentIntegrationInstance
-from .checks.openmetrics import OpenMetricsBaseCheck
 
-from .config import is_affirmative
-from .errors import ConfigurationError
-from .utils.common import ensure_string, ensure_unicode, to_string
-from .utils.identifiers import Identifiers
-from .utils.telemetry import MetricStream, MetricHealthChecks, EventStream, EventHealthChecks, HealthState,\
-    ServiceCheckStream, ServiceCheckHealthChecks, TopologyEventContext, SourceLink, Event
-from .utils.health_api import Health, HealthStream, HealthStreamUrn, HealthType
-from .utils.agent_integration_test_util import AgentIntegrationTestUtil
-from .utils.persistent_state import StateDescriptor, StateManager, StateNotPersistedException, \
-    StateCorruptedException, StateReadException
+# The public attributes of this package are only imported when they are first accessed, so a check does not pay for
+# the import of subsystems it does not use, e.g. the kubernetes client or the OpenMetrics mixins.
+# name --> (module, attribute)
+_LAZY_ATTRIBUTES = {
+    'AgentCheck': ('.checks', 'AgentCheck'),
+    'TopologyInstance': ('.checks', 'TopologyInstance'),
+    'StackPackInstance': ('.checks', 'StackPackInstance'),
+    'AgentIntegrationInstance': ('.checks', 'AgentIntegrationInstance'),
+    'OpenMetricsBaseCheck': ('.checks.openmetrics', 'OpenMetricsBaseCheck'),
+    'is_affirmative': ('.config', 'is_affirmative'),
+    'ConfigurationError': ('.errors', 'ConfigurationError'),
+    'ensure_string': ('.utils.common', 'ensure_string'),
+    'ensure_unicode': ('.utils.common', 'ensure_unicode'),
+    'to_string': ('.utils.common', 'to_string'),
+    'Identifiers': ('.utils.identifiers', 'Identifiers'),
+    'MetricStream': ('.utils.telemetry', 'MetricStream'),
+    'MetricHealthChecks': ('.utils.telemetry', 'MetricHealthChecks'),
+    'EventStream': ('.utils.telemetry', 'EventStream'),
+    'EventHealthChecks': ('.utils.telemetry', 'EventHealthChecks'),
+    'HealthState': ('.utils.telemetry', 'HealthState'),
+    'ServiceCheckStream': ('.utils.telemetry', 'ServiceCheckStream'),
+    'ServiceCheckHealthChecks': ('.utils.telemetry', 'ServiceCheckHealthChecks'),
+    'TopologyEventContext': ('.utils.telemetry', 'TopologyEventContext'),
+    'SourceLink': ('.utils.telemetry', 'SourceLink'),
+    'Event': ('.utils.telemetry', 'Event'),
+    'Health': ('.utils.health_api', 'Health'),
+    'HealthStream': ('.utils.health_api', 'HealthStream'),
+    'HealthStreamUrn': ('.utils.health_api', 'HealthStreamUrn'),
+    'HealthType': ('.utils.health_api', 'HealthType'),
+    'AgentIntegrationTestUtil': ('.utils.agent_integration_test_util', 'AgentIntegrationTestUtil'),
+    'StateDescriptor': ('.utils.persistent_state', 'StateDescriptor'),
+    'StateManager': ('.utils.persistent_state', 'StateManager'),
+    'StateNotPersistedException': ('.utils.persistent_state', 'StateNotPersistedException'),
+    'StateCorruptedException': ('.utils.persistent_state', 'StateCorruptedException'),
+    'StateReadException': ('.utils.persistent_state', 'StateReadException'),
+    # Windows-only
+    'PDHBaseCheck': ('.checks.win', 'PDHBaseCheck'),
+    # Kubernetes dep will not always be installed
+    'KubeLeaderElectionBaseCheck': ('.checks.kube_leader', 'KubeLeaderElectionBaseCheck'),
+}
+
+# attributes that are None when their dependencies are not installed
+_OPTIONAL_ATTRIBUTES = {'PDHBaseCheck', 'KubeLeaderElectionBaseCheck'}
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    module_name, attribute = _LAZY_ATTRIBUTES[name]
+    try:
+        value = getattr(importlib.import_module(module_name, __name__), attribute)
+    except ImportError:
+        if name not in _OPTIONAL_ATTRIBUTES:
+            raise
+        value = None
+    # later accesses find the attribute without calling __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
 
-# Windows-only
-try:
-    from .checks.win import PDHBaseCheck
-except ImportError:
-    PDHBaseCheck = None
 
-# Kubernetes dep will not always be installed
-try:
-    from .checks.kube_leader import KubeLeaderElectionBaseCheck
-except ImportError:
-    KubeLeaderElectionBaseCheck = None
+# module level __getattr__ is only supported from Python 3.7, import everything up front on older versions
+if sys.version_info < (3, 7):
+    for _name in _LAZY_ATTRIBUTES:
+        __getattr__(_name)
 
 __all__ = [
     '__version__',
@@ -61,10 +61,13 @@ from ..utils.common import ensure_string, ensure_unicode, to_string
 from ..utils.proxy import config_proxy_skip
 from ..utils.limiter import Limiter
 from ..utils.identifiers import Identifiers
+from ..utils.component_mapping import ComponentMappingResolver, split_on_commas_and_spaces
 from ..utils.telemetry import EventStream, MetricStream, ServiceCheckStream, \
     ServiceCheckHealthChecks, Event
 from ..utils.health_api import Health, HealthStream, HealthStreamUrn, HealthCheckData, HealthApi
-from ..utils.persistent_state import StateDescriptor, StateManager
+from ..utils.persistent_state import CopyOnWriteDict, StateDescriptor, StateManager
+from ..utils.run_metrics import RunMetrics, instrumented, timed as _timed
+from ..utils.run_profiler import RunProfiler
 from deprecated.sphinx import deprecated
 
 if datadog_agent.get_config('disable_unsafe_yaml'):
@@ -79,6 +82,30 @@ ONE_PER_CONTEXT_METRIC_TYPES = [
     aggregator.MONOTONIC_COUNT,
 ]
 
+# Value types that need no encoding and are valid struct values, lists of only these types are not traversed
+_CLEAN_TYPES = frozenset((str, float, bool) + integer_types)
+_STRUCT_VALUE_TYPES = string_types + integer_types + (float, bool, dict, list)
+
+_DICT_CONTEXT = "key '{0}' of dict"
+_LIST_CONTEXT = "index '{0}' of list"
+_SET_CONTEXT = "element of set"
+
+
+def _format_sanitize_context(context, key):
+    return context.format(key) if context is not None else context
+
+
+def _format_struct_path(name, path):
+    """
+    Formats the location of a value found by _sanitize as `name.key[index]`
+    """
+    parts = []
+    while path is not None:
+        path, key = path
+        if key is not None:
+            parts.append("[{}]".format(key) if isinstance(key, integer_types) else ".{}".format(key))
+    return name + "".join(reversed(parts))
+
 
 class _TopologyInstanceBase(object):
     """
@@ -186,6 +213,11 @@ class AgentCheckBase(object):
     """
     STATE_FIELD_NAME = 'state'
 
+    """
+    STATE_COMPRESSION allows checks that keep a large state to store it gzip compressed, defaults to `False`
+    """
+    STATE_COMPRESSION = False
+
     def __init__(self, *args, **kwargs):
         self.check_id = ''
         self.metrics = defaultdict(list)
@@ -226,7 +258,7 @@ class AgentCheckBase(object):
             self.log.warn("Using stub topology api")
         if using_stub_telemetry:
             self.log.warn("Using stub telemetry api")
-        self.state_manager = StateManager(self.log)
+        self.state_manager = StateManager(self.log, compress=self.STATE_COMPRESSION)
         self._deprecations = {}
         # Set proxy settings
         self.proxies = self._get_requests_proxy()
@@ -240,11 +272,24 @@ class AgentCheckBase(object):
         # Will be initialized as part of the check, to allow for proper error reporting there if initialization fails
         self.health = None
 
+        # Phase timings and emitted counts of the current run, only set when `collect_run_metrics` is enabled
+        self.run_metrics = None
+
+        # cProfile and/or tracemalloc capture of the next `profile_runs` runs, configured when the first run starts
+        self.run_profiler = None
+        self._run_profiler_configured = False
+
+        # Validated instance schema and component mapping resolver, computed once per run and reused until
+        # `self.instance` is replaced
+        self._instance_schema = None
+        self._instance_schema_source = None
+        self._component_mapping_resolver = None
+
     def _init_health_api(self):
         if self.health is not None:
             return
 
-        stream_spec = self.get_health_stream(self._get_instance_schema(self.instance))
+        stream_spec = self.get_health_stream(self._get_validated_instance())
         if stream_spec:
             # collection_interval should always be set by the agent
             collection_interval = self.instance['collection_interval']
@@ -260,7 +305,21 @@ class AgentCheckBase(object):
             self.health = HealthApi(self, stream_spec, expiry_seconds, repeat_interval_seconds)
 
     def _check_run_base(self, default_result):
+        run_metrics = None
+        profiled = False
         try:
+            if self._run_metrics_enabled():
+                run_metrics = RunMetrics()
+            self.run_metrics = run_metrics
+
+            if not self._run_profiler_configured:
+                self._run_profiler_configured = True
+                self.run_profiler = RunProfiler.from_options(self._get_run_option, self.name, self.log)
+            profiled = self.run_profiler is not None and self.run_profiler.start()
+
+            # validate the instance once for this run, it is reused by every topology and service check call
+            self._reset_instance_caches()
+
             # start auto snapshot if with_snapshots is set to True
             if self._get_instance_key().with_snapshots:
                 topology.submit_start_snapshot(self, self.check_id, self._get_instance_key_dict())
@@ -274,18 +333,25 @@ class AgentCheckBase(object):
             # create a copy of the check instance, get state if any and add it to the instance object for the check
             instance = self.instances[0]
             check_instance = copy.deepcopy(instance)
-            # if this instance has some state then set it to state
-            current_state = copy.deepcopy(self.state_manager.get_state(self._get_state_descriptor()))
+            # if this instance has some state then set it to state, the parts of the state the check reads are copied
+            # when they are read so the stored state only changes when the check run completes
+            state_descriptor = self._get_state_descriptor()
+            current_state = self.state_manager.get_state(state_descriptor)
             if current_state:
-                check_instance[self.STATE_FIELD_NAME] = current_state
+                check_instance[self.STATE_FIELD_NAME] = CopyOnWriteDict(current_state)
 
             check_instance = self._get_instance_schema(check_instance)
             self.check(check_instance)
 
-            # set the state from the check instance
+            # set the state from the check instance, unless the check left the state untouched
             # call self._get_state_descriptor method to get the instance key if it is update in the check run
             # example: aws-xray
-            self.state_manager.set_state(self._get_state_descriptor(), check_instance.get(self.STATE_FIELD_NAME))
+            state = check_instance.get(self.STATE_FIELD_NAME)
+            if isinstance(state, CopyOnWriteDict):
+                if state.modified or self._get_state_descriptor().instance_key != state_descriptor.instance_key:
+                    self.state_manager.set_state(self._get_state_descriptor(), state.to_dict())
+            else:
+                self.state_manager.set_state(self._get_state_descriptor(), state)
 
             # stop auto snapshot if with_snapshots is set to True
             if self._get_instance_key().with_snapshots:
@@ -302,9 +368,54 @@ class AgentCheckBase(object):
         finally:
             if self.metric_limiter:
                 self.metric_limiter.reset()
+            if profiled:
+                self.run_profiler.stop()
+            if run_metrics is not None:
+                self.run_metrics = None
+                self._submit_run_metrics(run_metrics)
 
         return result
 
+    def _get_run_option(self, name, default=None):
+        """
+        Returns the option `name` of the instance, or of the init_config when the instance does not set it
+        """
+        instance = self.instance if isinstance(self.instance, dict) else {}
+        init_config = self.init_config if isinstance(self.init_config, dict) else {}
+        return instance.get(name, init_config.get(name, default))
+
+    def _run_metrics_enabled(self):
+        """
+        The run metrics are opt-in with `collect_run_metrics` in the instance or the init_config
+        """
+        return is_affirmative(self._get_run_option('collect_run_metrics', False))
+
+    def _submit_run_metrics(self, run_metrics):
+        """
+        Submits the sts.check.* metrics of a run, tagged with the check name and the integration instance.
+        They bypass the metric limit, so they are reported for checks that reached it as well.
+        """
+        try:
+            tags = ['check:{}'.format(self.name)] + self._get_instance_key().tags()
+            for name, value, extra_tags in run_metrics.to_metrics():
+                aggregator.submit_metric(self, self.check_id, aggregator.GAUGE, name, value, tags + extra_tags, '')
+        except Exception as e:
+            self.log.warning("Could not submit the run metrics of check {}: {}".format(self.name, e))
+
+    def _count_emitted(self, counter):
+        """
+        Increments `counter` of the run metrics, when enabled, for data that passed validation and the limits
+        """
+        if self.run_metrics is not None:
+            self.run_metrics.increment(counter)
+
+    def timed(self, phase):
+        """
+        timed returns a context manager that adds the wall time of its block to `phase`, e.g. `http` or `parsing`,
+        of the run metrics. It does nothing when `collect_run_metrics` is not enabled.
+        """
+        return _timed(self, phase)
+
     def commit_state(self, state, flush=True):
         """
         commit_state can be used to immediately set (and optionally flush) state in the agent, instead of first
@@ -420,6 +531,30 @@ class AgentCheckBase(object):
             check_instance.validate()
         return check_instance
 
+    def _get_validated_instance(self):
+        """
+        Returns the instance cast into the INSTANCE_SCHEMA. The validation result is memoized and only recomputed when
+        `self.instance` is replaced or at the start of the next run.
+        """
+        if self._instance_schema is None or self._instance_schema_source is not self.instance:
+            self._instance_schema = self._get_instance_schema(self.instance)
+            self._instance_schema_source = self.instance
+        return self._instance_schema
+
+    def _get_component_mapping_resolver(self):
+        """
+        Returns the resolver for the stackstate-* tags and instance config, compiled once per run from the instance.
+        """
+        resolver = self._component_mapping_resolver
+        if resolver is None or resolver.instance is not self.instance:
+            resolver = self._component_mapping_resolver = ComponentMappingResolver(self.instance)
+        return resolver
+
+    def _reset_instance_caches(self):
+        self._instance_schema = None
+        self._instance_schema_source = None
+        self._component_mapping_resolver = None
+
     def get_instance_key(self, instance):
         """
         Integration checks can override this based on their needs.
@@ -430,7 +565,7 @@ class AgentCheckBase(object):
         return NoIntegrationInstance()
 
     def _get_instance_key(self):
-        check_instance = self._get_instance_schema(self.instance)
+        check_instance = self._get_validated_instance()
 
         value = self.get_instance_key(check_instance)
         if value is None:
@@ -521,25 +656,32 @@ class AgentCheckBase(object):
         metric_name = self.METRIC_REPLACEMENT.sub(br'_', metric_name)
         return self.DOT_UNDERSCORE_CLEANUP.sub(br'.', metric_name).strip(b'_')
 
+    @instrumented('topology', 'components', count=lambda component: 1 if component else 0)
     def component(self, id, type, data, streams=None, checks=None):
         integration_instance = self._get_instance_key()
         try:
-            fixed_data = self._sanitize(data)
+            fixed_data = self._sanitize(data, struct_name="data")
             fixed_streams = self._sanitize(streams)
             fixed_checks = self._sanitize(checks)
         except (UnicodeError, TypeError):
             return
-        data = self._map_component_data(id, type, integration_instance, fixed_data, fixed_streams, fixed_checks)
+        data = self._map_component_data(id, type, integration_instance, fixed_data, fixed_streams, fixed_checks,
+                                        validated=True)
         topology.submit_component(self, self.check_id, self._get_instance_key_dict(), id, type, data)
         return {"id": id, "type": type, "data": data}
 
     def _map_component_data(self, id, type, integration_instance, data, streams=None, checks=None,
-                            add_instance_tags=True):
+                            add_instance_tags=True, validated=False):
+        """
+        `validated` indicates that data already went through _sanitize with struct validation, the mapped data is
+        then only validated again when streams or checks were added to it.
+        """
         AgentCheckBase._check_is_string("id", id)
         AgentCheckBase._check_is_string("type", type)
         if data is None:
             data = {}
-        self._check_struct("data", data)
+        if not validated:
+            self._check_struct("data", data)
         data = self._map_streams_and_checks(data, streams, checks)
         data = self._map_identifier_mappings(type, data)
         data = self._map_stackstate_tags_and_instance_config(data)
@@ -547,129 +689,112 @@ class AgentCheckBase(object):
         if add_instance_tags:
             # add topology instance for view filtering
             data['tags'] = sorted(list(set(data.get('tags', []) + integration_instance.tags())))
-        self._check_struct("data", data)
+        if not validated or streams or checks:
+            self._check_struct("data", data)
         return data
 
+    @instrumented('topology', 'relations', count=lambda relation: 1 if relation else 0)
     def relation(self, source, target, type, data, streams=None, checks=None):
         try:
-            fixed_data = self._sanitize(data)
+            fixed_data = self._sanitize(data, struct_name="data")
             fixed_streams = self._sanitize(streams)
             fixed_checks = self._sanitize(checks)
         except (UnicodeError, TypeError):
             return
-        data = self._map_relation_data(source, target, type, fixed_data, fixed_streams, fixed_checks)
+        data = self._map_relation_data(source, target, type, fixed_data, fixed_streams, fixed_checks, validated=True)
         topology.submit_relation(self, self.check_id, self._get_instance_key_dict(), source, target, type, data)
         return {"source_id": source, "target_id": target, "type": type, "data": data}
 
+    @instrumented('topology', 'components', count=len)
+    def components(self, components):
+        """
+        Submits a batch of components, the instance key is resolved and the components are validated once for the
+        whole batch.
+        `components` a list of dictionaries with the `id`, `type` and `data` of the component and optionally its
+        `streams` and `checks`, the same arguments as component().
+        Components of which the data can not be sanitized are skipped, as in component().
+        The batch is submitted in a single call when the topology binding provides `submit_components`. The binding
+        of the agent does not provide it (yet), there each component is still submitted with `submit_component`.
+        """
+        integration_instance = self._get_instance_key()
+        batch = []
+        for element in components:
+            try:
+                fixed_data = self._sanitize(element.get("data"), struct_name="data")
+                fixed_streams = self._sanitize(element.get("streams"))
+                fixed_checks = self._sanitize(element.get("checks"))
+            except (UnicodeError, TypeError):
+                continue
+            data = self._map_component_data(element.get("id"), element.get("type"), integration_instance,
+                                            fixed_data, fixed_streams, fixed_checks, validated=True)
+            batch.append({"id": element["id"], "type": element["type"], "data": data})
+        if batch:
+            instance_key = integration_instance.to_dict()
+            if hasattr(topology, "submit_components"):
+                topology.submit_components(self, self.check_id, instance_key, batch)
+            else:
+                for c in batch:
+                    topology.submit_component(self, self.check_id, instance_key, c["id"], c["type"], c["data"])
+        return batch
+
+    @instrumented('topology', 'relations', count=len)
+    def relations(self, relations):
+        """
+        Submits a batch of relations, the instance key is resolved and the relations are validated once for the
+        whole batch.
+        `relations` a list of dictionaries with the `source_id`, `target_id`, `type` and `data` of the relation and
+        optionally its `streams` and `checks`, the same arguments as relation().
+        Relations of which the data can not be sanitized are skipped, as in relation().
+        The batch is submitted in a single call when the topology binding provides `submit_relations`. The binding
+        of the agent does not provide it (yet), there each relation is still submitted with `submit_relation`.
+        """
+        batch = []
+        for element in relations:
+            try:
+                fixed_data = self._sanitize(element.get("data"), struct_name="data")
+                fixed_streams = self._sanitize(element.get("streams"))
+                fixed_checks = self._sanitize(element.get("checks"))
+            except (UnicodeError, TypeError):
+                continue
+            data = self._map_relation_data(element.get("source_id"), element.get("target_id"), element.get("type"),
+                                           fixed_data, fixed_streams, fixed_checks, validated=True)
+            batch.append({"source_id": element["source_id"], "target_id": element["target_id"],
+                          "type": element["type"], "data": data})
+        if batch:
+            instance_key = self._get_instance_key_dict()
+            if hasattr(topology, "submit_relations"):
+                topology.submit_relations(self, self.check_id, instance_key, batch)
+            else:
+                for r in batch:
+                    topology.submit_relation(self, self.check_id, instance_key, r["source_id"], r["target_id"],
+                                             r["type"], r["data"])
+        return batch
+
+    @instrumented('topology')
     def delete(self, identifier):
         AgentCheckBase._check_is_string("identifier", identifier)
         topology.submit_delete(self, self.check_id, self._get_instance_key_dict(), identifier)
         return identifier
 
     def _map_stackstate_tags_and_instance_config(self, data):
-        # Extract or create the tags and identifier objects
-        tags = data.get('tags', [])
-        identifiers = data.get("identifiers", [])
-
-        # Find the stackstate-identifiers within tags
-        identifier_tag = next((tag for tag in tags if ("stackstate-identifiers:" in tag)), None)
-
-        # We attempt to split and map out the identifiers specified in the identifier_tag
-        # ** Does not support config **
-        if isinstance(identifier_tag, str):
-            identifier_tag_content = identifier_tag.split('stackstate-identifiers:')[1]
-            if len(identifier_tag_content) > 0:
-                # Remove the tag if valid identifiers was found
-                tags.remove(identifier_tag)
-
-                # Split the list on comma or spaces based values
-                result = self.split_on_commas_and_spaces(identifier_tag_content)
-                identifiers = identifiers + result
-
-        # Detect single identifiers and set the identifiers object
-        single_identifier_tag = self._map_config_and_tags(data, 'stackstate-identifier', 'identifier', False, True)
-        if isinstance(single_identifier_tag, str):
-            identifiers = identifiers + [single_identifier_tag]
-
-        # Only apply identifiers if we found any
-        if len(identifiers) > 0:
-            data["identifiers"] = identifiers
-
-        # Attempt to map stackstate-*** tags and configs
-        data = self._map_config_and_tags(data, 'stackstate-layer', 'layer')
-        data = self._map_config_and_tags(data, 'stackstate-environment', 'environments', True)
-        data = self._map_config_and_tags(data, 'stackstate-domain', 'domain')
-
-        return data
+        return self._get_component_mapping_resolver().apply(data)
 
     # Regex function used to split a string on commas and/or spaces
     @staticmethod
     def split_on_commas_and_spaces(content):
-        if isinstance(content, str):
-            """
-                We are testing the following with the regex block below
-                - Match all spaces if any at the start followed by a must have comma then followed again by a possible
-                    single or multiple spaces
-                - Second possibility is a single or multiple space only without a comma
-                The resulting regex will work on a complex line like the following example:
-                    Input: a, b, c,d,e f g h, i , j ,k   ,l  ,  m
-                    Result: ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm']
-            """
-            content_list = re.split('(?:\\s+)?,(?:\\s+)?|\\s+', content)
-
-            # Clean out all empty string ''
-            clean_identifier_list = list(filter(lambda item: len(item) > 0, content_list))
-            return clean_identifier_list
-        else:
-            return []
-
-    # Generic mapping function for tags or config
-    # Attempt to find if the target exists on a tag or config and map that to the origin value
-    # There's a optional default value if required
-    # Value override order: tags < config.yaml
-    def _map_config_and_tags(self, data, target, origin, return_array=False, return_direct_value=False, default=None):
-        # Get the first instance and create a deep copy
-        instance = self.instances[0] if self.instances is not None and len(self.instances) else {}
-        check_instance = copy.deepcopy(instance)
-
-        # Extract or create the tags
-        tags = data.get('tags', [])
-
-        # Attempt to find the tag and map its value to a object inside data
-        find_tag = next((tag for tag in tags if (target + ':' in tag)), None)
-        if isinstance(find_tag, str) and find_tag.index(":") > 0:
-            result = [find_tag.split(target + ':')[1]] if return_array is True else find_tag.split(target + ':')[1]
-            # Remove the tag from tags if found
-            tags.remove(find_tag)
-            if return_direct_value is True:
-                return result
-            data[origin] = result
-
-        elif target in check_instance and isinstance(check_instance[target], str):
-            result = [check_instance[target]] if return_array is True else check_instance[target]
-            if return_direct_value is True:
-                return result
-            data[origin] = result
-
-        elif default is not None and isinstance(default, str):
-            result = [default] if return_array is True else default
-            if return_direct_value is True:
-                return result
-            data[origin] = result
-
-        if return_direct_value is True and return_array is True:
-            return []
-        return data
+        return split_on_commas_and_spaces(content)
 
-    def _map_relation_data(self, source, target, type, data, streams=None, checks=None):
+    def _map_relation_data(self, source, target, type, data, streams=None, checks=None, validated=False):
         AgentCheckBase._check_is_string("source", source)
         AgentCheckBase._check_is_string("target", target)
         AgentCheckBase._check_is_string("type", type)
-        self._check_struct("data", data)
+        if not validated or data is None:
+            self._check_struct("data", data)
         if data is None:
             data = {}
         data = self._map_streams_and_checks(data, streams, checks)
-        self._check_struct("data", data)
+        if not validated or streams or checks:
+            self._check_struct("data", data)
         return data
 
     def get_mapping_field_key(self, dictionary, keys, default=None):
@@ -680,16 +805,14 @@ class AgentCheckBase(object):
         if "identifier_mappings" not in self.instance:
             self.log.debug("No identifier_mappings section found in configuration. Skipping..")
             return data
-        if type in self.instance["identifier_mappings"]:
-            type_mapping = self.instance["identifier_mappings"].get(type)
-            field_value = self.get_mapping_field_key(data, type_mapping.get("field"))
-            if not field_value:
-                self.log.warning("The %s field is not found in data section." % (type_mapping.get("field")))
-                return data
+        identifier, missing_field = self._get_component_mapping_resolver().resolve_identifier_mapping(type, data)
+        if missing_field:
+            self.log.warning("The %s field is not found in data section." % missing_field)
+        if identifier:
             identifiers = data.get("identifiers", [])
-            identifiers.append('%s%s' % (type_mapping.get("prefix"), field_value))
+            identifiers.append(identifier)
             data["identifiers"] = identifiers
-            return data
+        return data
 
     def _map_streams_and_checks(self, data, streams, checks):
         if streams:
@@ -870,32 +993,41 @@ class AgentCheckBase(object):
     def _submit_raw_metrics_data(self, name, value, tags=None, hostname=None, device_name=None, timestamp=None):
         pass
 
+    @instrumented('metrics')
     def raw(self, name, value, tags=None, hostname=None, device_name=None, timestamp=None):
         self._submit_raw_metrics_data(name, value, tags, hostname, device_name, timestamp)
 
+    @instrumented('metrics')
     def gauge(self, name, value, tags=None, hostname=None, device_name=None):
         self._submit_metric(aggregator.GAUGE, name, value, tags=tags, hostname=hostname, device_name=device_name)
 
+    @instrumented('metrics')
     def count(self, name, value, tags=None, hostname=None, device_name=None):
         self._submit_metric(aggregator.COUNT, name, value, tags=tags, hostname=hostname, device_name=device_name)
 
+    @instrumented('metrics')
     def monotonic_count(self, name, value, tags=None, hostname=None, device_name=None):
         self._submit_metric(aggregator.MONOTONIC_COUNT, name, value, tags=tags, hostname=hostname,
                             device_name=device_name)
 
+    @instrumented('metrics')
     def rate(self, name, value, tags=None, hostname=None, device_name=None):
         self._submit_metric(aggregator.RATE, name, value, tags=tags, hostname=hostname, device_name=device_name)
 
+    @instrumented('metrics')
     def histogram(self, name, value, tags=None, hostname=None, device_name=None):
         self._submit_metric(aggregator.HISTOGRAM, name, value, tags=tags, hostname=hostname, device_name=device_name)
 
+    @instrumented('metrics')
     def historate(self, name, value, tags=None, hostname=None, device_name=None):
         self._submit_metric(aggregator.HISTORATE, name, value, tags=tags, hostname=hostname, device_name=device_name)
 
+    @instrumented('metrics')
     def increment(self, name, value=1, tags=None, hostname=None, device_name=None):
         self._log_deprecation('increment')
         self._submit_metric(aggregator.COUNTER, name, value, tags=tags, hostname=hostname, device_name=device_name)
 
+    @instrumented('metrics')
     def decrement(self, name, value=-1, tags=None, hostname=None, device_name=None):
         self._log_deprecation('increment')
         self._submit_metric(aggregator.COUNTER, name, value, tags=tags, hostname=hostname, device_name=device_name)
@@ -935,38 +1067,81 @@ class AgentCheckBase(object):
         return proxies if proxies else no_proxy_settings
 
     # TODO collect all errors instead of the first one
-    def _sanitize(self, field, context=None):
+    def _sanitize(self, field, context=None, struct_name=None):
         """
-        Fixes encoding and strips empty elements.
+        Fixes encoding and strips empty elements in a single iterative pass over the field. Lists that only contain
+        values which need no encoding are copied without visiting their elements.
         :param field: Field can be of the following types: str, dict, list, set
         :param context: Context for error message.
+        :param struct_name: If set the field is also validated to be a dictionary (or None) with only string, int,
+        float, bool, dictionary or list values, see _check_struct. Argument name used in the ValueError.
         :return:
         """
+        # the first invalid struct value as (path, value); raised after the traversal, so that encoding and type
+        # errors take precedence as they did when the structure was validated after sanitizing.
+        struct_error = [] if struct_name is not None else None
+        pending = []
+        result = self._sanitize_value(field, pending, struct_error, None, None, context)
+        while pending:
+            target, source, path = pending.pop()
+            if isinstance(target, dict):
+                for key, value in iteritems(source):
+                    if self._is_not_empty(value):
+                        target[key] = self._sanitize_value(value, pending, struct_error, path, key, _DICT_CONTEXT)
+            else:
+                for index, element in enumerate(source):
+                    target.append(self._sanitize_value(element, pending, struct_error, path, index, _LIST_CONTEXT))
+
+        if struct_name is not None:
+            if result is not None and not isinstance(result, dict):
+                AgentCheckBase._raise_unexpected_type(struct_name, result, "dictionary or None value")
+            if struct_error:
+                path, value = struct_error[0]
+                AgentCheckBase._raise_unexpected_type(_format_struct_path(struct_name, path), value,
+                                                      "string, int, dictionary, list or None value")
+        return result
+
+    def _sanitize_value(self, field, pending, struct_error, parent, key, context):
+        """
+        Sanitizes a single value for _sanitize. Dictionaries and lists are returned empty and are filled in when
+        _sanitize processes them from `pending`. `parent` and `key` locate the value for error messages, these are
+        only formatted when an error occurs.
+        """
         if isinstance(field, text_type):
             try:
-                fixed_value = to_string(field)
+                return to_string(field)
             except UnicodeError as e:
-                self.log.warning("Error while encoding unicode to string: '{0}', at {1}".format(field, context))
+                self.log.warning("Error while encoding unicode to string: '{0}', at {1}".format(
+                    field, _format_sanitize_context(context, key)))
                 raise e
-            return fixed_value
         elif isinstance(field, dict):
             self._ensure_string_only_keys(field)
-            field = {k: v for k, v in iteritems(field) if self._is_not_empty(v)}
-            for key, value in list(iteritems(field)):
-                field[key] = self._sanitize(value, "key '{0}' of dict".format(key))
+            fixed_dict = {}
+            pending.append((fixed_dict, field, (parent, key)))
+            return fixed_dict
         elif isinstance(field, list):
-            self._ensure_homogeneous_list(field)
-            field = [element for element in field if self._is_not_empty(element)]
-            for i, element in enumerate(field):
-                field[i] = self._sanitize(element, "index '{0}' of list".format(i))
+            type_set = self._ensure_homogeneous_list(field)
+            if type_set <= _CLEAN_TYPES:
+                # primitive-only list, the elements need no encoding and are valid struct values
+                if str in type_set:
+                    return [element for element in field if element]
+                return list(field)
+            fixed_list = []
+            pending.append((fixed_list, [element for element in field if self._is_not_empty(element)],
+                            (parent, key)))
+            return fixed_list
         elif isinstance(field, set):
-            # we convert a set to a list so we can update it in place
-            # and then at the end we turn the list back to a set
-            encoding_list = [element for element in list(field) if self._is_not_empty(element)]
+            # sets can only hold hashable values, so the elements are sanitized in place
+            encoding_list = [element for element in field if self._is_not_empty(element)]
             self._ensure_homogeneous_list(encoding_list)
-            for i, element in enumerate(encoding_list):
-                encoding_list[i] = self._sanitize(element, "element of set")
-            field = set(encoding_list)
+            fixed_set = set(self._sanitize_value(element, pending, None, None, None, _SET_CONTEXT)
+                            for element in encoding_list)
+            if struct_error is not None and not struct_error:
+                struct_error.append(((parent, key), fixed_set))
+            return fixed_set
+        elif struct_error is not None and not struct_error and field is not None and \
+                not isinstance(field, _STRUCT_VALUE_TYPES):
+            struct_error.append(((parent, key), field))
         return field
 
     def _is_not_empty(self, field):
@@ -1016,11 +1191,12 @@ class AgentCheckBase(object):
         # below will not trigger and the list is considered homogeneous. If a different combination exists (str, int)
         # then it fails as expected.
         if type_set == {str, text_type}:
-            return
+            return type_set
 
         if len(type_set) > 1:
             raise TypeError("List: {0}, is not homogeneous, it contains the following types: {1}"
                             .format(list, type_set))
+        return type_set
 
     def get_check_state_path(self):
         """
@@ -1120,6 +1296,7 @@ class __AgentCheckPy3(AgentCheckBase):
             self.warning(err_msg)
             return
 
+        self._count_emitted('metrics')
         aggregator.submit_metric(self, self.check_id, mtype, ensure_unicode(name), value, tags, hostname)
 
     def _submit_raw_metrics_data(self, name, value, tags=None, hostname=None, device_name=None, timestamp=None):
@@ -1132,6 +1309,7 @@ class __AgentCheckPy3(AgentCheckBase):
         if hostname is None:
             hostname = ''
 
+        self._count_emitted('metrics')
         telemetry.submit_raw_metrics_data(self, self.check_id, ensure_unicode(name), value, tags, hostname, timestamp)
 
     def service_check(self, name, status, tags=None, hostname=None, message=None):
@@ -1147,6 +1325,7 @@ class __AgentCheckPy3(AgentCheckBase):
         aggregator.submit_service_check(self, self.check_id, ensure_unicode(name), status, tags + instance.tags(),
                                         hostname, message)
 
+    @instrumented('events', 'events')
     def event(self, event):
         self.validate_event(event)
 
@@ -1298,6 +1477,7 @@ class __AgentCheckPy2(AgentCheckBase):
             self.warning(err_msg)
             return
 
+        self._count_emitted('metrics')
         aggregator.submit_metric(self, self.check_id, mtype, ensure_string(name), value, tags, hostname)
 
     def _submit_raw_metrics_data(self, name, value, tags=None, hostname=None, device_name=None, timestamp=None):
@@ -1310,6 +1490,7 @@ class __AgentCheckPy2(AgentCheckBase):
         if hostname is None:
             hostname = b''
 
+        self._count_emitted('metrics')
         telemetry.submit_raw_metrics_data(self, self.check_id, ensure_unicode(name), value, tags, hostname, timestamp)
 
     def service_check(self, name, status, tags=None, hostname=None, message=None):
@@ -1326,6 +1507,7 @@ class __AgentCheckPy2(AgentCheckBase):
         aggregator.submit_service_check(self, self.check_id, ensure_string(name), status,
                                         tags + tags_bytes, hostname, message)
 
+    @instrumented('events', 'events')
     def event(self, event):
         self.validate_event(event)
         # Enforce types of some fields, considerably facilitates handling in go bindings downstream
@@ -5,6 +5,7 @@
 from fnmatch import fnmatchcase
 from ...errors import CheckException
 import requests
+from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
 from urllib3 import disable_warnings
 from urllib3.exceptions import InsecureRequestWarning
 from math import isnan, isinf
@@ -13,6 +14,7 @@ from prometheus_client.parser import text_fd_to_metric_families
 from six import PY3, iteritems, string_types
 
 from .. import AgentCheck
+from ...utils.run_metrics import timed, timed_iter
 
 from stackstate_checks.config import is_affirmative
 
@@ -204,6 +206,17 @@ class OpenMetricsScraperMixin(object):
         config['username'] = instance.get('username', default_instance.get('username', None))
         config['password'] = instance.get('password', default_instance.get('password', None))
 
+        # The endpoint is polled with a pooled `requests.Session` that lives as long as the check, so connections and
+        # their TLS sessions are reused between runs. `keep_alive` set to False closes the connection after each poll.
+        config['connection_pool_size'] = int(instance.get('connection_pool_size',
+                                                          default_instance.get('connection_pool_size',
+                                                                               DEFAULT_POOLSIZE)))
+        config['keep_alive'] = is_affirmative(instance.get('keep_alive', default_instance.get('keep_alive', True)))
+
+        # `_session` holds the pooled session, `_session_settings` the settings it was created with
+        config['_session'] = None
+        config['_session_settings'] = None
+
         # Custom tags that will be sent with each metric
         config['custom_tags'] = instance.get('tags', [])
 
@@ -259,7 +272,8 @@ class OpenMetricsScraperMixin(object):
         """
         Poll the data from prometheus and return the metrics as a generator.
         """
-        response = self.poll(scraper_config)
+        with timed(self, 'http'):
+            response = self.poll(scraper_config)
         try:
             # no dry run if no label joins
             if not scraper_config['label_joins']:
@@ -269,7 +283,7 @@ class OpenMetricsScraperMixin(object):
                 for metric, val in iteritems(scraper_config['label_joins']):
                     scraper_config['_watched_labels'].add(val['label_to_match'])
 
-            for metric in self.parse_metric_family(response, scraper_config):
+            for metric in timed_iter(self, 'parsing', self.parse_metric_family(response, scraper_config)):
                 yield metric
 
             # Set dry run off
@@ -470,8 +484,35 @@ class OpenMetricsScraperMixin(object):
         password = scraper_config['password']
         auth = (username, password) if username is not None and password is not None else None
 
-        return requests.get(endpoint, headers=headers, stream=True, timeout=scraper_config['prometheus_timeout'],
-                            cert=cert, verify=verify, auth=auth)
+        session = self.get_scraper_session(scraper_config, (cert, verify, auth))
+        return session.get(endpoint, headers=headers, stream=True, timeout=scraper_config['prometheus_timeout'],
+                           cert=cert, verify=verify, auth=auth)
+
+    def get_scraper_session(self, scraper_config, request_settings=None):
+        """
+        Returns the pooled requests.Session of the scraper configuration. The session is created on first use and
+        rebuilt when the pool, keep-alive or the ssl and authentication settings of the configuration change.
+        """
+        settings = (scraper_config.get('connection_pool_size', DEFAULT_POOLSIZE),
+                    scraper_config.get('keep_alive', True), request_settings)
+        session = scraper_config.get('_session')
+        if session is not None and scraper_config.get('_session_settings') == settings:
+            return session
+
+        if session is not None:
+            session.close()
+
+        pool_size, keep_alive, _ = settings
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not keep_alive:
+            session.headers['Connection'] = 'close'
+
+        scraper_config['_session'] = session
+        scraper_config['_session_settings'] = settings
+        return session
 
     def get_hostname_for_sample(self, sample, scraper_config):
         """
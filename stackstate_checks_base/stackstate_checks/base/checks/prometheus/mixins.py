@@ -8,14 +8,15 @@ import requests
 from urllib3 import disable_warnings
 from urllib3.exceptions import InsecureRequestWarning
 from collections import defaultdict
-from google.protobuf.internal.decoder import _DecodeVarint32  # pylint: disable=E0611,E0401
 from ...utils.prometheus import metrics_pb2
+from ...utils.prometheus.functions import parse_metric_family_stream
 from math import isnan, isinf
 from prometheus_client.parser import text_fd_to_metric_families
 
 from six import PY3, iteritems, string_types
 
 from .. import AgentCheck
+from ...utils.run_metrics import timed, timed_iter
 
 if PY3:
     long = int
@@ -41,6 +42,7 @@ class PrometheusScraperMixin(object):
 
     UNWANTED_LABELS = ["le", "quantile"]  # are specifics keys for prometheus itself
     REQUESTS_CHUNK_SIZE = 1024 * 10  # use 10kb as chunk size when using the Stream feature in requests.get
+    PROTOBUF_CHUNK_SIZE = 1024 * 64  # use 64kb as chunk size when streaming protobuf payloads
 
     def __init__(self, *args, **kwargs):
         super(PrometheusScraperMixin, self).__init__(*args, **kwargs)
@@ -169,7 +171,7 @@ class PrometheusScraperMixin(object):
 
         The text format uses iter_lines() generator.
 
-        The protobuf format directly parse the response.content property searching for Prometheus messages of type
+        The protobuf format streams the response content with iter_content() searching for Prometheus messages of type
         MetricFamily [0] delimited by a varint32 [1] when the content-type is a `application/vnd.google.protobuf`.
 
         [0] https://github.com/prometheus/client_model/blob/086fe7ca28bde6cec2acd5223423c1475a362858/metrics.proto#L76-%20%20L81  # noqa: E501
@@ -179,16 +181,11 @@ class PrometheusScraperMixin(object):
         :return: metrics_pb2.MetricFamily()
         """
         if 'application/vnd.google.protobuf' in response.headers['Content-Type']:
-            n = 0
-            buf = response.content
-            while n < len(buf):
-                msg_len, new_pos = _DecodeVarint32(buf, n)
-                n = new_pos
-                msg_buf = buf[n:n + msg_len]
-                n += msg_len
-
-                message = metrics_pb2.MetricFamily()
-                message.ParseFromString(msg_buf)
+            if hasattr(response, 'iter_content'):
+                chunks = response.iter_content(chunk_size=self.PROTOBUF_CHUNK_SIZE)
+            else:
+                chunks = [response.content]
+            for message in parse_metric_family_stream(chunks):
                 message.name = self.remove_metric_prefix(message.name)
 
                 # Lookup type overrides:
@@ -355,7 +352,8 @@ class PrometheusScraperMixin(object):
         """
         Poll the data from prometheus and return the metrics as a generator.
         """
-        response = self.poll(endpoint)
+        with timed(self, 'http'):
+            response = self.poll(endpoint)
         try:
             # no dry run if no label joins
             if not self.label_joins:
@@ -365,7 +363,7 @@ class PrometheusScraperMixin(object):
                 for metric, val in iteritems(self.label_joins):
                     self._watched_labels.add(val['label_to_match'])
 
-            for metric in self.parse_metric_family(response):
+            for metric in timed_iter(self, 'parsing', self.parse_metric_family(response)):
                 yield metric
 
             # Set dry run off
@@ -519,7 +517,7 @@ class PrometheusScraperMixin(object):
             disable_warnings(InsecureRequestWarning)
             verify = False
         try:
-            response = requests.get(endpoint, headers=headers, stream=False, timeout=self.prometheus_timeout, cert=cert,
+            response = requests.get(endpoint, headers=headers, stream=True, timeout=self.prometheus_timeout, cert=cert,
                                     verify=verify)
         except requests.exceptions.SSLError:
             self.log.error("Invalid SSL settings for requesting {} endpoint".format(endpoint))
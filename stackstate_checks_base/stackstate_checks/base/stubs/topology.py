@@ -48,12 +48,22 @@ class TopologyStub(object):
     def submit_component(self, check, check_id, instance_key, id, type, data):
         self._ensure_instance(check_id, instance_key)["components"].append(component(id, type, data))
 
+    def submit_components(self, check, check_id, instance_key, components):
+        snapshot = self._ensure_instance(check_id, instance_key)
+        for c in components:
+            snapshot["components"].append(component(c["id"], c["type"], c["data"]))
+
     def submit_delete(self, check, check_id, instance_key, identifier):
         self._ensure_instance(check_id, instance_key)["delete_ids"].append(delete(identifier))
 
     def submit_relation(self, check, check_id, instance_key, source_id, target_id, type, data):
         self._ensure_instance(check_id, instance_key)["relations"].append(relation(source_id, target_id, type, data))
 
+    def submit_relations(self, check, check_id, instance_key, relations):
+        snapshot = self._ensure_instance(check_id, instance_key)
+        for r in relations:
+            snapshot["relations"].append(relation(r["source_id"], r["target_id"], r["type"], r["data"]))
+
     def submit_start_snapshot(self, check, check_id, instance_key):
         self._ensure_instance(check_id, instance_key)["start_snapshot"] = True
 
@@ -0,0 +1,124 @@
+import re
+
+# Regex used to split a string on commas and/or spaces, see split_on_commas_and_spaces
+COMMAS_AND_SPACES_RE = re.compile('(?:\\s+)?,(?:\\s+)?|\\s+')
+
+IDENTIFIERS_TAG = 'stackstate-identifiers'
+IDENTIFIER_TAG = 'stackstate-identifier'
+
+# (target tag / config key, data field, value is a list), in the order they are resolved
+TARGET_MAPPINGS = [
+    (IDENTIFIER_TAG, 'identifier', False),
+    ('stackstate-layer', 'layer', False),
+    ('stackstate-environment', 'environments', True),
+    ('stackstate-domain', 'domain', False),
+]
+
+
+def split_on_commas_and_spaces(content):
+    """
+    Splits content on commas and/or spaces, dropping the empty items. The regex matches any spaces followed by a
+    comma followed by any spaces, or one or more spaces without a comma:
+        Input: a, b, c,d,e f g h, i , j ,k   ,l  ,  m
+        Result: ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm']
+    """
+    if isinstance(content, str):
+        return [item for item in COMMAS_AND_SPACES_RE.split(content) if len(item) > 0]
+    return []
+
+
+class ComponentMappingResolver(object):
+    """
+    Resolves the stackstate-* tags and instance configuration that are mapped onto the data of every component.
+
+    The instance configuration (identifier_mappings field paths and the stackstate-* config values) is parsed once
+    when the resolver is created, so mapping a component does not need to copy or re-parse the instance.
+    Value override order: config.yaml < tags
+    """
+
+    def __init__(self, instance):
+        self.instance = instance
+        instance = instance or {}
+
+        self.identifier_mappings = {}
+        for component_type, type_mapping in (instance.get('identifier_mappings') or {}).items():
+            field = type_mapping.get('field')
+            self.identifier_mappings[component_type] = (type_mapping.get('prefix'), field,
+                                                        field.split('.') if field else [])
+
+        self.config_values = {}
+        for target, _, _ in TARGET_MAPPINGS:
+            value = instance.get(target)
+            if isinstance(value, str):
+                self.config_values[target] = value
+
+    def resolve_identifier_mapping(self, type, data):
+        """
+        Returns the identifier configured in identifier_mappings for this component type, the field name of the
+        mapping when the field was not found in data, or None when there is no mapping for this type.
+        """
+        mapping = self.identifier_mappings.get(type)
+        if mapping is None:
+            return None, None
+        prefix, field, path = mapping
+        field_value = data
+        for key in path:
+            field_value = field_value.get(key) if isinstance(field_value, dict) else None
+        if not path or not field_value:
+            return None, field
+        return '%s%s' % (prefix, field_value), None
+
+    def apply(self, data):
+        """
+        Maps the stackstate-identifiers, stackstate-identifier, stackstate-layer, stackstate-environment and
+        stackstate-domain tags or instance configuration onto data, removing the mapped tags.
+        """
+        tags = data.get('tags', [])
+        identifiers = data.get('identifiers', [])
+
+        # Find the first matching tag for every target in a single pass over the tags
+        identifiers_tag = None
+        found_tags = {}
+        for tag in tags:
+            if not isinstance(tag, str):
+                continue
+            if identifiers_tag is None and IDENTIFIERS_TAG + ':' in tag:
+                identifiers_tag = tag
+                continue
+            for target, _, _ in TARGET_MAPPINGS:
+                if target not in found_tags and target + ':' in tag:
+                    found_tags[target] = tag
+                    break
+
+        removed_tags = set()
+        # We attempt to split and map out the identifiers specified in the identifiers tag
+        # ** Does not support config **
+        if identifiers_tag is not None:
+            identifiers_tag_content = identifiers_tag.split(IDENTIFIERS_TAG + ':')[1]
+            if len(identifiers_tag_content) > 0:
+                removed_tags.add(identifiers_tag)
+                identifiers = identifiers + split_on_commas_and_spaces(identifiers_tag_content)
+
+        for target, origin, return_array in TARGET_MAPPINGS:
+            find_tag = found_tags.get(target)
+            if find_tag is not None and find_tag.index(':') > 0:
+                value = find_tag.split(target + ':')[1]
+                removed_tags.add(find_tag)
+            elif target in self.config_values:
+                value = self.config_values[target]
+            else:
+                continue
+
+            if target == IDENTIFIER_TAG:
+                identifiers = identifiers + [value]
+            else:
+                data[origin] = [value] if return_array else value
+
+        for tag in removed_tags:
+            tags.remove(tag)
+
+        # Only apply identifiers if we found any
+        if len(identifiers) > 0:
+            data['identifiers'] = identifiers
+
+        return data
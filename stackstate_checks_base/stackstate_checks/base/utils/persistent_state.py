@@ -3,9 +3,14 @@
 # Licensed under a 3-clause BSD style license (see LICENSE)
 
 import os
+import copy
 import json
 import errno
+import stat
+import uuid
+import zlib
 from schematics import Model
+from six import PY3
 from .schemas import StrictStringType
 
 
@@ -33,20 +38,139 @@ class StateDescriptor:
         self.file_location = _file_location
 
 
+# the first bytes of a gzip stream, used to recognize compressed state files
+GZIP_MAGIC = b'\x1f\x8b'
+# wbits to write and read the gzip format with zlib
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def _replace_file(src, dst):
+    """
+    Atomically replaces dst by src, os.rename does not replace an existing file on Windows in Python 2
+    """
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+class CopyOnWriteDict(dict):
+    """
+    CopyOnWriteDict gives a check its state without copying it up front. The nested values of a key are only deep
+    copied when the key is read, so the state of the StateManager is never changed by the check. `modified` tells
+    whether the check changed the state, the unchanged keys are shared with the original state.
+    """
+
+    def __init__(self, state):
+        """
+        `state` the state dictionary that is protected from changes
+        """
+        super(CopyOnWriteDict, self).__init__(state)
+        self._original = state
+        self._copied = set()
+        self._modified = False
+
+    @property
+    def modified(self):
+        """
+        modified is True when a key was set or removed, or when a nested value that was read has been changed
+        """
+        if self._modified:
+            return True
+        return any(dict.__getitem__(self, key) != self._original.get(key) for key in self._copied)
+
+    def to_dict(self):
+        """
+        to_dict returns the state as a plain dictionary
+        """
+        return dict(self)
+
+    def _copy_on_read(self, key, value):
+        if key not in self._copied and isinstance(value, (dict, list)):
+            value = copy.deepcopy(value)
+            dict.__setitem__(self, key, value)
+            self._copied.add(key)
+        return value
+
+    def __getitem__(self, key):
+        return self._copy_on_read(key, dict.__getitem__(self, key))
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    if not PY3:
+        def itervalues(self):
+            return iter(self.values())
+
+        def iteritems(self):
+            return iter(self.items())
+
+    def copy(self):
+        return dict(self.items())
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def __setitem__(self, key, value):
+        self._modified = True
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._modified = True
+        dict.__delitem__(self, key)
+
+    def pop(self, *args):
+        self._modified = True
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._modified = True
+        return dict.popitem(self)
+
+    def clear(self):
+        self._modified = True
+        dict.clear(self)
+
+    def update(self, *args, **kwargs):
+        self._modified = True
+        dict.update(self, *args, **kwargs)
+
+
 class StateManager:
     """
     StateManager stores data onto disk for the given persistence instance.
     It stores the state directly onto disk the first time data is written into the state, thereafter only updating the
     in-memory state and writing to disk once `flush` is called. This reduces the io operation for frequently updated
     state.
+    The state file is replaced atomically, so a crash while writing never leaves a truncated state file behind, and a
+    state that did not change since it was last written or read is not encoded nor written again. The state is only
+    compared to the state in memory when it is set, changes made in place to the state returned by `get_state` are
+    written once that state is passed to `set_state`.
     """
 
-    def __init__(self, logger):
+    def __init__(self, logger, compress=False):
         """
         `logger` the logger that is used to log messages
+        `compress` whether the state is written gzip compressed, state files are read in either format
         """
         self.state = dict()
         self.log = logger
+        self.compress = compress
+        # instance keys of which the state in memory is not written to disk yet
+        self.dirty = set()
 
     def clear(self, instance):
         """
@@ -55,6 +179,7 @@ class StateManager:
         """
         if instance.instance_key in self.state:
             del self.state[instance.instance_key]
+        self.dirty.discard(instance.instance_key)
 
         # if the file exists, try to delete it.
         if os.path.isfile(instance.file_location):
@@ -71,11 +196,15 @@ class StateManager:
         read_state reads state from the instance.file_location and loads it as json
         """
         try:
-            with open(instance.file_location, 'r') as f:
-                state = json.loads(f.read())
-                self.state[instance.instance_key] = state
-                return state
-        except ValueError as e:
+            with open(instance.file_location, 'rb') as f:
+                data = f.read()
+            if data[:2] == GZIP_MAGIC:
+                data = zlib.decompress(data, GZIP_WBITS)
+            state = json.loads(data.decode('utf-8'))
+            self.state[instance.instance_key] = state
+            self.dirty.discard(instance.instance_key)
+            return state
+        except (ValueError, zlib.error) as e:
             self.log.error("PersistentState: State file is corrupted for instance: {} stored at: {}. {}"
                            .format(instance.instance_key, instance.file_location, e))
             raise StateCorruptedException(e)
@@ -128,6 +257,10 @@ class StateManager:
                              "schematics.Model"
                              .format(type(state)))
 
+        current_state = self.state.get(instance.instance_key)
+        # the state returned by get_state may have been changed in place, so the same object is always written
+        if state is current_state or state != current_state:
+            self.dirty.add(instance.instance_key)
         self.state[instance.instance_key] = state
 
         if flush:
@@ -135,17 +268,37 @@ class StateManager:
 
     def flush(self, instance):
         """
-        flush writes the state data for this instance to disk
+        flush writes the state data for this instance to disk, unless it is unchanged since it was last written or read
         `instance` the persistence instance for which the state is flushed to disk.
         """
         if instance.instance_key in self.state:
+            if instance.instance_key not in self.dirty and os.path.isfile(instance.file_location):
+                self.log.debug("PersistentState: State for instance: {} is unchanged, not writing it"
+                               .format(instance.instance_key))
+                return
+
             # check if folder and file exists before writing
+            tmp_file_location = None
             try:
                 if not os.path.exists(os.path.dirname(instance.file_location)):
                     os.makedirs(os.path.dirname(instance.file_location))
 
-                with open(instance.file_location, 'w+') as f:
-                    f.write(json.dumps(self.state[instance.instance_key]))
+                # write to a temporary file in the same folder and rename it, the rename replaces the file atomically
+                data = self._encode(self.state[instance.instance_key])
+                tmp_file_location = "{}.{}.tmp".format(instance.file_location, uuid.uuid4().hex)
+                # the temporary file is created like open() does, honoring the umask, and gets the mode of the file
+                # it replaces
+                fd = os.open(tmp_file_location, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0),
+                             0o666)
+                with os.fdopen(fd, 'wb') as f:
+                    if os.path.isfile(instance.file_location):
+                        os.chmod(tmp_file_location, stat.S_IMODE(os.stat(instance.file_location).st_mode))
+                    f.write(self._compress(data) if self.compress else data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                _replace_file(tmp_file_location, instance.file_location)
+                tmp_file_location = None
+                self.dirty.discard(instance.instance_key)
             except (IOError, OSError) as e:
                 if e.errno != errno.EEXIST:
                     # if we couldn't save, log the state
@@ -155,6 +308,21 @@ class StateManager:
                                    .format(instance.instance_key, instance.file_location,
                                            self.state[instance.instance_key]))
                     raise StateNotPersistedException(e)
+            finally:
+                if tmp_file_location is not None and os.path.isfile(tmp_file_location):
+                    os.remove(tmp_file_location)
+
+    @staticmethod
+    def _encode(state):
+        """
+        _encode returns the state as compact json bytes
+        """
+        return json.dumps(state, separators=(',', ':')).encode('utf-8')
+
+    @staticmethod
+    def _compress(data):
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, GZIP_WBITS)
+        return compressor.compress(data) + compressor.flush()
 
 
 class StateNotPersistedException(Exception):
@@ -2,4 +2,4 @@
 # All rights reserved
 # Licensed under Simplified BSD License (see LICENSE)
 
-from .functions import parse_metric_family  # noqa: F401
+from .functions import parse_metric_family, parse_metric_family_stream  # noqa: F401
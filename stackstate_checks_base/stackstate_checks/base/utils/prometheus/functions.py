@@ -6,6 +6,52 @@ from google.protobuf.internal.decoder import _DecodeVarint32  # pylint: disable=
 
 from . import metrics_pb2
 
+# A varint32 length prefix takes at most 5 bytes
+MAX_VARINT32_BYTES = 5
+
+
+def _memoryview_parse_supported():
+    """
+    Not every protobuf implementation accepts a memoryview in ParseFromString, in that case the messages are parsed
+    from a bytes slice of the buffer.
+    """
+    reference = metrics_pb2.MetricFamily()
+    reference.name = 'probe'
+    try:
+        message = metrics_pb2.MetricFamily()
+        message.ParseFromString(memoryview(reference.SerializeToString()))
+        return message.name == reference.name
+    except Exception:
+        return False
+
+
+MEMORYVIEW_PARSE_SUPPORTED = _memoryview_parse_supported()
+
+
+def _parse_delimited_messages(buf, final):
+    """
+    Parse the MetricFamily messages delimited by a varint32 that are complete in `buf`.
+    When `final` is false the last message may be incomplete, parsing then stops before it.
+
+    :return: the list of parsed messages, the offset up to which `buf` was consumed and the number of bytes
+             needed from that offset to complete the next message (0 when unknown)
+    """
+    view = memoryview(buf) if MEMORYVIEW_PARSE_SUPPORTED else buf
+    messages = []
+    n = 0
+    end = len(buf)
+    while n < end:
+        if not final and end - n < MAX_VARINT32_BYTES:
+            return messages, n, 0
+        msg_len, pos = _DecodeVarint32(buf, n)
+        if not final and pos + msg_len > end:
+            return messages, n, pos + msg_len - n
+        message = metrics_pb2.MetricFamily()
+        message.ParseFromString(view[pos:pos + msg_len])
+        messages.append(message)
+        n = pos + msg_len
+    return messages, n, 0
+
 
 # Deprecated, please use the PrometheusCheck class
 def parse_metric_family(buf):
@@ -16,13 +62,52 @@ def parse_metric_family(buf):
     [0] https://github.com/prometheus/client_model/blob/086fe7ca28bde6cec2acd5223423c1475a362858/metrics.proto#L76-%20%20L81  # noqa: E501
     [1] https://developers.google.com/protocol-buffers/docs/reference/java/com/google/protobuf/AbstractMessageLite#writeDelimitedTo(java.io.OutputStream)  # noqa: E501
     """
+    view = memoryview(buf) if MEMORYVIEW_PARSE_SUPPORTED else buf
     n = 0
     while n < len(buf):
         msg_len, new_pos = _DecodeVarint32(buf, n)
         n = new_pos
-        msg_buf = buf[n:n + msg_len]
+        msg_buf = view[n:n + msg_len]
         n += msg_len
 
         message = metrics_pb2.MetricFamily()
         message.ParseFromString(msg_buf)
         yield message
+
+
+def parse_metric_family_stream(chunks):
+    """
+    Parse the Prometheus MetricFamily messages delimited by a varint32 from an iterable of binary chunks, for example
+    requests.Response.iter_content(). Messages are yielded as soon as they are complete, only the incomplete trailing
+    message is kept in memory.
+    """
+    buf = b''
+    parts = []
+    parts_len = 0
+    needed = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        parts.append(chunk)
+        parts_len += len(chunk)
+        # wait until the pending message is complete before joining, so a large message is only copied once
+        if len(buf) + parts_len < max(needed, MAX_VARINT32_BYTES):
+            continue
+        if buf:
+            parts.insert(0, buf)
+        buf = parts[0] if len(parts) == 1 else b''.join(parts)
+        parts = []
+        parts_len = 0
+
+        messages, consumed, needed = _parse_delimited_messages(buf, False)
+        for message in messages:
+            yield message
+        buf = buf[consumed:] if consumed else buf
+
+    if parts:
+        if buf:
+            parts.insert(0, buf)
+        buf = b''.join(parts)
+    messages, _, _ = _parse_delimited_messages(buf, True)
+    for message in messages:
+        yield message
@@ -0,0 +1,120 @@
+# (C) StackState 2021
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+import functools
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# time.monotonic is not available in Python 2
+timer = getattr(time, 'monotonic', time.time)
+
+METRIC_PREFIX = 'sts.check'
+
+
+class RunMetrics(object):
+    """
+    RunMetrics records the wall time spent per phase of a check run, e.g. http, parsing, topology and metrics, and the
+    number of components, relations, metrics and events the check emitted. It is thread safe, checks may emit from
+    several threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start = timer()
+        self.timings = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def add_time(self, phase, seconds):
+        with self._lock:
+            self.timings[phase] += seconds
+
+    def increment(self, counter, value=1):
+        with self._lock:
+            self.counts[counter] += value
+
+    def elapsed(self):
+        return timer() - self.start
+
+    def to_metrics(self):
+        """
+        Returns the (name, value, extra tags) of the sts.check.* metrics for this run
+        """
+        with self._lock:
+            metrics = [('{}.run_time'.format(METRIC_PREFIX), self.elapsed(), [])]
+            for phase, seconds in sorted(self.timings.items()):
+                metrics.append(('{}.phase_time'.format(METRIC_PREFIX), seconds, ['phase:{}'.format(phase)]))
+            for counter in ('components', 'relations', 'metrics', 'events'):
+                metrics.append(('{}.{}'.format(METRIC_PREFIX, counter), self.counts[counter], []))
+            return metrics
+
+
+@contextmanager
+def _no_timing():
+    yield
+
+
+def timed(check, phase):
+    """
+    Context manager that adds the wall time of its block to `phase` of the run metrics of `check`, when enabled.
+    """
+    run_metrics = getattr(check, 'run_metrics', None)
+    if run_metrics is None:
+        return _no_timing()
+    return _timing(run_metrics, phase)
+
+
+@contextmanager
+def _timing(run_metrics, phase):
+    start = timer()
+    try:
+        yield
+    finally:
+        run_metrics.add_time(phase, timer() - start)
+
+
+def timed_iter(check, phase, iterable):
+    """
+    Iterates over `iterable` adding the time spent producing the items to `phase` of the run metrics of `check`, the
+    time the caller spends on each item is not included.
+    """
+    run_metrics = getattr(check, 'run_metrics', None)
+    if run_metrics is None:
+        for item in iterable:
+            yield item
+        return
+
+    iterator = iter(iterable)
+    while True:
+        start = timer()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            run_metrics.add_time(phase, timer() - start)
+        yield item
+
+
+def instrumented(phase, counter=None, count=None):
+    """
+    Decorates a check method to add its wall time to `phase` of the run metrics, when enabled. When a `counter` is
+    given it is incremented by `count(result)` of the method, or by 1 when no `count` function is given.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            run_metrics = self.run_metrics
+            if run_metrics is None:
+                return func(self, *args, **kwargs)
+            start = timer()
+            try:
+                result = func(self, *args, **kwargs)
+            finally:
+                run_metrics.add_time(phase, timer() - start)
+            if counter:
+                run_metrics.increment(counter, count(result) if count else 1)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,151 @@
+# (C) StackState 2021
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+import cProfile
+import os
+import re
+import tempfile
+import time
+
+from ..config import is_affirmative
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2
+    tracemalloc = None
+
+DEFAULT_PROFILE_DIRECTORY = os.path.join(tempfile.gettempdir(), 'stackstate_check_profiles')
+DEFAULT_PROFILE_MAX_FILES = 20
+DEFAULT_PROFILE_MAX_SIZE = 100 * 1024 * 1024
+DEFAULT_PROFILE_TOP_ALLOCATIONS = 25
+# the profiler files written, that are rotated in the profile directory
+PROFILE_EXTENSIONS = ('.prof', '.allocations.txt')
+
+
+class RunProfiler(object):
+    """
+    RunProfiler wraps the next `profile_runs` runs of a check instance in cProfile and/or tracemalloc.
+
+    The cProfile output is written in the pstats format, e.g. as input for snakeviz or flameprof, and the top
+    allocation sites of tracemalloc as text, to `profile_directory`. The oldest profile files in the directory are
+    removed when there are more than `profile_max_files` or they take more than `profile_max_size` bytes.
+    cProfile only profiles the thread that runs the check, tracemalloc traces the allocations of all threads.
+    """
+
+    def __init__(self, name, log, runs, cpu=True, memory=False, directory=DEFAULT_PROFILE_DIRECTORY,
+                 max_files=DEFAULT_PROFILE_MAX_FILES, max_size=DEFAULT_PROFILE_MAX_SIZE,
+                 top_allocations=DEFAULT_PROFILE_TOP_ALLOCATIONS):
+        self.name = re.sub(r'[^\w.-]', '_', name)
+        self.log = log
+        self.remaining_runs = runs
+        self.cpu = cpu
+        self.memory = memory and tracemalloc is not None
+        self.directory = directory
+        self.max_files = max_files
+        self.max_size = max_size
+        self.top_allocations = top_allocations
+        self._profile = None
+        self._started_tracemalloc = False
+        self._runs = 0
+
+        if memory and tracemalloc is None:
+            self.log.warning("Memory profiling is not supported on this Python version, only cpu profiles are written")
+
+    @classmethod
+    def from_options(cls, get_option, name, log):
+        """
+        Returns the RunProfiler configured with the profile_* options returned by `get_option(name, default)`, or None
+        when profiling is not enabled or the options are invalid
+        """
+        if not get_option('profile_runs'):
+            return None
+        try:
+            return cls(
+                name,
+                log,
+                runs=int(get_option('profile_runs')),
+                cpu=is_affirmative(get_option('profile_cpu', True)),
+                memory=is_affirmative(get_option('profile_memory', False)),
+                directory=get_option('profile_directory') or DEFAULT_PROFILE_DIRECTORY,
+                max_files=int(get_option('profile_max_files', DEFAULT_PROFILE_MAX_FILES)),
+                max_size=int(get_option('profile_max_size', DEFAULT_PROFILE_MAX_SIZE)),
+                top_allocations=int(get_option('profile_top_allocations', DEFAULT_PROFILE_TOP_ALLOCATIONS)),
+            )
+        except (TypeError, ValueError) as e:
+            log.warning("Invalid profile configuration, the check runs are not profiled: {}".format(e))
+            return None
+
+    def start(self):
+        """
+        Starts profiling the run, returns False when all the requested runs have been profiled
+        """
+        if self.remaining_runs <= 0:
+            return False
+        if self.cpu:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        return True
+
+    def stop(self):
+        """
+        Stops profiling the run and writes the profile files, errors are logged and do not fail the check run
+        """
+        profile, self._profile = self._profile, None
+        if profile is not None:
+            profile.disable()
+        snapshot = None
+        traced_memory = None
+        if self.memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            traced_memory = tracemalloc.get_traced_memory()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+
+        self.remaining_runs -= 1
+        self._runs += 1
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            path = os.path.join(self.directory, '{}.{}.{}'.format(self.name, time.strftime('%Y%m%d-%H%M%S'),
+                                                                  self._runs))
+            if profile is not None:
+                profile.dump_stats(path + '.prof')
+            if snapshot is not None:
+                self._write_allocations(path + '.allocations.txt', snapshot, traced_memory)
+            self.log.info("Wrote the profile of the check run to {}".format(path))
+            self._rotate()
+        except (IOError, OSError) as e:
+            self.log.warning("Could not write the profile of the check run to {}: {}".format(self.directory, e))
+
+    def _write_allocations(self, path, snapshot, traced_memory):
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+        with open(path, 'w') as f:
+            f.write('Traced memory: current {} bytes, peak {} bytes\n'.format(*traced_memory))
+            f.write('Top {} allocation sites:\n'.format(self.top_allocations))
+            for statistic in snapshot.statistics('lineno')[:self.top_allocations]:
+                f.write('{}\n'.format(statistic))
+
+    def _rotate(self):
+        """
+        Removes the oldest profile files until the directory holds at most max_files files of at most max_size bytes
+        """
+        files = []
+        for file_name in os.listdir(self.directory):
+            path = os.path.join(self.directory, file_name)
+            if file_name.endswith(PROFILE_EXTENSIONS) and os.path.isfile(path):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, path, stat.st_size))
+        files.sort()
+        total_size = sum(size for _, _, size in files)
+        while files and (len(files) > self.max_files or total_size > self.max_size):
+            _, path, size = files.pop(0)
+            os.remove(path)
+            total_size -= size
@@ -5,6 +5,8 @@ import binascii
 import os
 from stat import ST_INO, ST_SIZE
 
+from six import PY3
+
 from .common import ensure_string
 
 
@@ -37,8 +39,8 @@ class TailFile(object):
         # Compute CRC of the beginning of the file
         crc = None
         if size >= self.CRC_SIZE:
-            tmp_file = open(self._path, 'r')
-            data = ensure_string(tmp_file.read(self.CRC_SIZE))
+            with open(self._path, 'r') as tmp_file:
+                data = ensure_string(tmp_file.read(self.CRC_SIZE))
             crc = binascii.crc32(data)
 
         if already_open:
@@ -105,3 +107,151 @@ class TailFile(object):
             # log but survive
             self._log.exception(e)
             raise StopIteration(e)
+
+
+class PersistentTailFile(object):
+    """
+    Tails a file line by line. The file stays open between reads and is read in chunks of READ_SIZE bytes.
+
+    The position in the file is available through `offset` as a dict that can be saved in the check state, `restore`
+    continues at a saved offset after a restart. Rotation (another inode at the path), truncation and copytruncate
+    (the first bytes of the file changed) are detected, the new file is then read from the beginning.
+    """
+
+    CRC_SIZE = 16
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, logger, path, callback):
+        """
+        `callback` is called with every complete line, without the line ending
+        """
+        self._path = path
+        self._log = logger
+        self._callback = callback
+        self._f = None
+        self._inode = None
+        self._crc = None
+        self._position = 0
+
+    @property
+    def offset(self):
+        return {"inode": self._inode, "crc": self._crc, "position": self._position}
+
+    def seek_end(self):
+        """
+        Continues at the end of the file, only lines written from now on are read
+        """
+        size = self._open()
+        self._position = size
+
+    def restore(self, offset):
+        """
+        Continues at a saved `offset`. The file is read from the beginning when it was rotated or truncated after
+        the offset was saved.
+        """
+        size = self._open()
+        if offset and offset.get("inode") == self._inode and offset.get("position", 0) <= size and \
+                offset.get("crc") in (None, self._crc):
+            self._log.debug("Resuming file %s at %s" % (self._path, offset["position"]))
+            self._position = offset["position"]
+        else:
+            self._log.debug("File %s changed since offset %s was saved, reading it from the beginning" %
+                            (self._path, offset))
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def tail(self):
+        """
+        Calls the callback for every line that was completed since the previous call.
+        :return: the number of lines read
+        """
+        lines = 0
+        if self._f is None:
+            self._open()
+        else:
+            lines += self._check_rotation()
+        self._f.seek(self._position)
+        lines += self._read_lines()
+        return lines
+
+    def _open(self):
+        """
+        Opens the file at the path from the beginning, returns its size
+        """
+        self.close()
+        # unbuffered, the file is read in chunks of READ_SIZE by _read_lines
+        self._f = open(self._path, 'rb', 0)
+        stat = os.fstat(self._f.fileno())
+        self._inode = stat[ST_INO]
+        self._crc = self._read_crc()
+        self._position = 0
+        return stat[ST_SIZE]
+
+    def _read_crc(self):
+        self._f.seek(0)
+        data = self._f.read(self.CRC_SIZE)
+        if len(data) < self.CRC_SIZE:
+            return None
+        return binascii.crc32(data) & 0xffffffff
+
+    def _check_rotation(self):
+        """
+        Reopens or rewinds the file when it was rotated or truncated
+        :return: the number of lines read from the rotated file
+        """
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            # rotated and not created again yet, keep reading the open file
+            return 0
+
+        if stat[ST_INO] != self._inode:
+            self._log.debug("File %s rotated, reopening" % self._path)
+            # first read what was written to the rotated file
+            self._f.seek(self._position)
+            lines = self._read_lines()
+            self._open()
+            return lines
+
+        crc = self._read_crc()
+        if stat[ST_SIZE] < self._position:
+            self._log.debug("File %s truncated, reading it from the beginning" % self._path)
+            self._position = 0
+        elif self._crc is not None and crc != self._crc:
+            # truncated and too much data has already been written again (copytruncate and opened files...)
+            self._log.debug("Beginning of file %s modified, reading it from the beginning" % self._path)
+            self._position = 0
+        self._crc = crc
+        return 0
+
+    def _read_lines(self):
+        lines = 0
+        pending = b''
+        while True:
+            chunk = self._f.read(self.READ_SIZE)
+            if not chunk:
+                break
+            data = pending + chunk if pending else chunk
+            start = 0
+            end = data.find(b'\n')
+            while end != -1:
+                self._read_line(data[start:end])
+                # the position moves per line, a failing callback doesn't make the previous lines to be read again
+                self._position += end + 1 - start
+                lines += 1
+                start = end + 1
+                end = data.find(b'\n', start)
+            # an incomplete last line is read again once it's completed
+            pending = data[start:]
+        return lines
+
+    def _read_line(self, line):
+        if line[:1] == b'\0':
+            # a truncate may have created holes in the file
+            line = line.lstrip(b'\0')
+        if PY3:
+            line = line.decode('utf-8', 'replace')
+        self._callback(line)
@@ -15,6 +15,7 @@ from schematics.types import IntType, StringType, ModelType
 from six import PY3, text_type
 
 from stackstate_checks.base.stubs.topology import component
+from stackstate_checks.base.utils.component_mapping import ComponentMappingResolver
 from stackstate_checks.checks import AgentCheck, TopologyInstance, AgentIntegrationInstance, \
     HealthStream, HealthStreamUrn, Health
 
@@ -117,6 +118,62 @@ class TestMetrics:
             check.gauge(metric_name, '85k')
         aggregator.assert_metric(metric_name, count=0)
 
+    def test_run_metrics(self, aggregator, topology):
+        check = RunMetricsCheck({'collect_run_metrics': True})
+        check.run()
+        tags = ['check:test', 'integration-type:mytype', 'integration-url:someurl']
+        aggregator.assert_metric('sts.check.run_time', tags=tags, count=1)
+        aggregator.assert_metric('sts.check.components', value=2, tags=tags)
+        aggregator.assert_metric('sts.check.relations', value=1, tags=tags)
+        aggregator.assert_metric('sts.check.metrics', value=2, tags=tags)
+        aggregator.assert_metric('sts.check.events', value=1, tags=tags)
+        for phase in ['http', 'topology', 'metrics', 'events']:
+            aggregator.assert_metric('sts.check.phase_time', tags=tags + ['phase:{}'.format(phase)], count=1)
+        assert check.run_metrics is None
+
+    def test_run_metrics_count_submitted_metrics(self, aggregator, topology):
+        check = InvalidMetricRunMetricsCheck({'collect_run_metrics': True})
+        check.run()
+        aggregator.assert_metric('sts.check.metrics', value=1)
+
+    def test_run_metrics_invalid_instance(self, aggregator):
+        check = AgentCheck('test', {}, [['not', 'a', 'dict']])
+        result = check.run()
+        assert 'traceback' in result
+        assert check.run_metrics is None
+
+    def test_run_metrics_disabled(self, aggregator, topology):
+        check = RunMetricsCheck({})
+        check.run()
+        aggregator.assert_metric('sts.check.run_time', count=0)
+        aggregator.assert_metric('my.gauge', count=1)
+
+    def test_run_profiler(self, aggregator, topology, tmpdir):
+        check = RunMetricsCheck({'profile_runs': 2, 'profile_memory': True, 'profile_directory': str(tmpdir)})
+        for _ in range(3):
+            check.run()
+        profiles = sorted(f.basename for f in tmpdir.listdir())
+        assert len([p for p in profiles if p.endswith('.prof')]) == 2
+        assert len([p for p in profiles if p.endswith('.allocations.txt')]) == (2 if PY3 else 0)
+        assert all(p.startswith('test.') for p in profiles)
+        aggregator.assert_metric('my.gauge', count=3)
+
+    def test_run_profiler_rotation(self, aggregator, topology, tmpdir):
+        check = RunMetricsCheck({'profile_runs': 3, 'profile_max_files': 1, 'profile_directory': str(tmpdir)})
+        for _ in range(3):
+            check.run()
+        profiles = tmpdir.listdir()
+        assert len(profiles) == 1
+        assert profiles[0].basename.endswith('.3.prof')
+
+    def test_run_profiler_disabled(self, aggregator, topology):
+        for instance in [{}, {'profile_runs': 'many'}]:
+            check = RunMetricsCheck(instance)
+            check.run()
+            assert check.run_profiler is None
+            aggregator.assert_metric('my.gauge', count=1)
+            aggregator.reset()
+
 
 class TestEvents:
     def test_valid_event(self, aggregator):
@@ -459,6 +516,44 @@ class TopologyBrokenStatefulCheck(TopologyStatefulCheck):
         raise Exception("some error in my check")
 
 
+class TopologyBrokenInPlaceStatefulCheck(TopologyStatefulCheck):
+    def check(self, instance):
+        instance['state']['dict']['a'] = 'changed'
+        instance['state']['list'].append('d')
+
+        raise Exception("some error in my check")
+
+
+class TopologyReadOnlyStatefulCheck(TopologyStatefulCheck):
+    def check(self, instance):
+        assert instance['state']['dict'] == {'a': 'b'}
+
+
+class RunMetricsCheck(TopologyCheck):
+    def __init__(self, instance):
+        super(RunMetricsCheck, self).__init__(TopologyInstance("mytype", "someurl"), "test", {}, [instance])
+
+    def check(self, instance):
+        with self.timed('http'):
+            pass
+        self.components([{"id": "a", "type": "t", "data": {}}])
+        self.component("b", "t", {})
+        self.relation("a", "b", "uses", {})
+        self.gauge("my.gauge", 1)
+        self.count("my.count", 1)
+        self.event({"timestamp": 123456789, "event_type": "test", "msg_title": "title", "msg_text": "text"})
+
+
+class InvalidMetricRunMetricsCheck(RunMetricsCheck):
+    def check(self, instance):
+        self.gauge("my.gauge", 1)
+        # the stub aggregator raises on invalid values, the agent drops them with a warning
+        try:
+            self.gauge("my.gauge", "85k")
+        except ValueError:
+            pass
+
+
 class IdentifierMappingTestAgentCheck(TopologyCheck):
     def __init__(self):
         instances = [
@@ -576,82 +671,32 @@ class TestTagsAndConfigMapping:
                ["urn:test:0:123", "urn:test:1:123", "urn:test:2:123"]
 
     def test_mapping_config_and_tags(self):
-        # We are create config variables with and without instance config
-        check_include_config = TagsAndConfigMappingAgentCheck(True)
-        check_exclude_config = TagsAndConfigMappingAgentCheck(False)
-
         """
-            We are testing the following:
-                Config + No Data == Config Result is not in a Array
-                Config + No Data, True == Config Result is in a Array
-                Config + Data == Data Result is not in a Array (Must not be config)
-                Config + Data, True == Data Result is in a Array (Must not be config)
-                No Config + No Data + Default Value == Result must be the default value and not a Array
-                No Config + No Data + Default Value, True == Result must be the default value in a Array
+            We are testing the following for the layer, environment and domain:
+                Config + No Data == Config Result, in an Array for the environments
+                Config + Data == Data Result (Must not be config), the mapped tag is removed
+                No Config + No Data == Nothing is mapped
             Tags must overwrite configs
         """
-        def generic_mapping_test(target, origin, default_value=None):
-            data = {
-                'tags': ['stackstate-layer:tag-stackstate-layer',
-                         'stackstate-environment:tag-stackstate-environment',
-                         'stackstate-domain:tag-stackstate-domain',
-                         'stackstate-identifier:tag-stackstate-identifier',
-                         'stackstate-identifiers:tag-stackstate-identifiers']
-            }
+        resolver_include_config = ComponentMappingResolver(TagsAndConfigMappingAgentCheck(True).instance)
+        resolver_exclude_config = ComponentMappingResolver(TagsAndConfigMappingAgentCheck(False).instance)
 
-            # Create a copy of the data object
-            data_without_target = copy.deepcopy(data)
-
-            # Remove the current target from the tags array as the result should not contain that tag
-            data_without_target.get("tags").remove(target + ":tag-" + target)
-
-            # Include instance config in the tests
-            assert check_include_config._map_config_and_tags({}, target, origin) == \
-                   {origin: 'instance-' + target}
-            assert check_include_config._map_config_and_tags({}, target, origin, True) == \
-                   {origin: ['instance-' + target]}
-            assert check_include_config._map_config_and_tags(copy.deepcopy(data), target, origin) == \
-                   {origin: 'tag-' + target, 'tags': data_without_target['tags']}
-            assert check_include_config._map_config_and_tags(copy.deepcopy(data), target, origin, True) == \
-                   {origin: ['tag-' + target], 'tags': data_without_target['tags']}
-
-            # Exclude the instance config in the tests
-            assert check_exclude_config._map_config_and_tags({}, target, origin) == {}
-            assert check_exclude_config._map_config_and_tags({}, target, origin, True) == {}
-            assert check_exclude_config._map_config_and_tags(copy.deepcopy(data), target, origin) == \
-                   {origin: 'tag-' + target, 'tags': data_without_target['tags']}
-            assert check_exclude_config._map_config_and_tags(copy.deepcopy(data), target, origin, True) == \
-                   {origin: ['tag-' + target], 'tags': data_without_target['tags']}
-
-            # Default Config
-            assert check_exclude_config._map_config_and_tags({}, target, origin, False, False, default_value) == \
-                   {origin: default_value}
-            assert check_exclude_config._map_config_and_tags({}, target, origin, True, False, default_value) == \
-                   {origin: [default_value]}
-
-            # Return direct value & Return direct value arrays test
-            assert check_exclude_config._map_config_and_tags(copy.deepcopy(data), target, origin, False, True) == \
-                   'tag-' + target
-            assert check_include_config._map_config_and_tags(copy.deepcopy(data), target, origin, False, True) == \
-                   'tag-' + target
-            assert check_exclude_config._map_config_and_tags({}, target, origin, False, True) == \
-                   {}
-            assert check_include_config._map_config_and_tags({}, target, origin, False, True) == \
-                   'instance-' + target
-            assert check_exclude_config._map_config_and_tags(copy.deepcopy(data), target, origin, True, True) == \
-                   ['tag-' + target]
-            assert check_include_config._map_config_and_tags(copy.deepcopy(data), target, origin, True, True) == \
-                   ['tag-' + target]
-            assert check_exclude_config._map_config_and_tags({}, target, origin, True, True) == \
-                   []
-            assert check_include_config._map_config_and_tags({}, target, origin, True, True) == \
-                   ['instance-' + target]
-
-        # We are testing the environment, layer and domain for all the use cases
-        generic_mapping_test("stackstate-environment", "environments", "default-environment")
-        generic_mapping_test("stackstate-layer", "layer", "default-layer")
-        generic_mapping_test("stackstate-domain", "domain", "default-domain")
-        generic_mapping_test("stackstate-identifier", "identifier", "default-identifier")
+        def generic_mapping_test(target, origin, return_array):
+            def value(content):
+                return [content] if return_array else content
+
+            data = {'tags': [target + ':tag-' + target, 'other:tag']}
+
+            assert resolver_include_config.apply({})[origin] == value('instance-' + target)
+            assert resolver_exclude_config.apply({}).get(origin) is None
+            for resolver in [resolver_include_config, resolver_exclude_config]:
+                result = resolver.apply(copy.deepcopy(data))
+                assert result[origin] == value('tag-' + target)
+                assert result['tags'] == ['other:tag']
+
+        generic_mapping_test("stackstate-environment", "environments", True)
+        generic_mapping_test("stackstate-layer", "layer", False)
+        generic_mapping_test("stackstate-domain", "domain", False)
 
     def test_instance_only_config(self, topology):
         component = self.generic_tags_and_config_snapshot(topology, True, False)
@@ -693,6 +738,19 @@ class TestTagsAndConfigMapping:
                                                     'urn:process:/mapped-identifier:3:1234567890',
                                                     'urn:process:/mapped-identifier:001:1234567890']
 
+    def test_mapping_resolver_compiled_once(self, topology):
+        check = TagsAndConfigMappingAgentCheck(True)
+        with mock.patch('stackstate_checks.base.checks.base.ComponentMappingResolver',
+                        wraps=ComponentMappingResolver) as resolver:
+            check.component("my-id", "host", {'url': '1234567890'})
+            # component types without identifier mapping are mapped as well
+            check.component("my-other-id", "service", {'tags': ['stackstate-layer:tag-stackstate-layer']})
+            assert resolver.call_count == 1
+        components = topology.get_snapshot(check.check_id)['components']
+        assert components[0]["data"]["identifiers"] == ['urn:computer:/1234567890', 'instance-stackstate-identifier']
+        assert components[1]["data"]["layer"] == "tag-stackstate-layer"
+        assert components[1]["data"]["domain"] == "instance-stackstate-domain"
+
 
 class TestBaseSanitize:
     def test_ensure_homogeneous_list(self):
@@ -976,6 +1034,18 @@ class TestTopology:
         # assert auto snapshotting occurred
         topology.assert_snapshot(check.check_id, check.key, start_snapshot=True, stop_snapshot=False)
 
+    def test_no_state_change_on_exception_in_place_stateful_check(self, topology, state):
+        check = TopologyBrokenInPlaceStatefulCheck()
+        check.state_manager.set_state(check._get_state_descriptor(), copy.deepcopy(TEST_STATE))
+        state.assert_state_check(check, expected_pre_run_state=TEST_STATE, expected_post_run_state=TEST_STATE)
+
+    def test_unchanged_state_is_not_set(self, topology, state):
+        check = TopologyReadOnlyStatefulCheck()
+        check.state_manager.set_state(check._get_state_descriptor(), copy.deepcopy(TEST_STATE))
+        with mock.patch.object(check.state_manager, 'set_state') as set_state:
+            state.assert_state_check(check, expected_pre_run_state=TEST_STATE, expected_post_run_state=TEST_STATE)
+            assert set_state.call_count == 0
+
     def test_stateful_schema_check(self, topology, state):
         check = TopologyStatefulSchemaCheck()
         # assert the state check function as expected
@@ -1012,6 +1082,26 @@ expected string, int, dictionary, list or None value"""
             assert str(e.value) == """Got unexpected <type 'set'> for argument data.key, \
 expected string, int, dictionary, list or None value"""
 
+    def test_illegal_nested_data_value(self):
+        check = TopologyCheck()
+        with pytest.raises(ValueError) as e:
+            assert check.component("my-id", "my-type", {"key": {"list": ["", "a"], "objects": [{"a": 1}, {"b": (1,)}]}})
+        assert str(e.value) == "Got unexpected {} for argument data.key.objects[1].b, " \
+                               "expected string, int, dictionary, list or None value".format(type((1,)))
+
+    def test_type_error_precedes_illegal_data_value(self):
+        check = TopologyCheck()
+        assert check.component("my-id", "my-type", {"a": {1, 2}, "b": {"c": ["a", 1]}}) is None
+
+    def test_deeply_nested_data(self, topology):
+        check = TopologyCheck()
+        data = nested = {}
+        for i in range(sys.getrecursionlimit() + 100):
+            nested["child"] = {"level": i, "names": [u"a", "", "b"]}
+            nested = nested["child"]
+        created_component = check.component("my-id", "my-type", data)
+        assert created_component["data"]["child"]["child"]["names"] == ["a", "b"]
+
     def test_illegal_instance_key_none(self):
         check = TopologyCheck()
         check.key = None
@@ -1251,6 +1341,72 @@ expected TopologyInstance, AgentIntegrationInstance or DefaultIntegrationInstanc
         deleted_component = check.delete("my-id")
         topology.assert_snapshot(check.check_id, check.key, delete_ids=[deleted_component])
 
+    def test_components_batch(self, topology):
+        check = TopologyCheck()
+        with mock.patch.object(topology, 'submit_component') as submit_component:
+            created_components = check.components([
+                {"id": "my-id-1", "type": "my-type", "data": {"key": "value", "emptykey": None}},
+                {"id": "my-id-2", "type": "my-type", "data": {"key": {1: "non string key"}}},
+                {"id": "my-id-3", "type": "my-type", "data": None},
+            ])
+            submit_component.assert_not_called()
+        assert [c["id"] for c in created_components] == ["my-id-1", "my-id-3"]
+        assert created_components[0]["data"] == {"key": "value",
+                                                 "tags": ["integration-type:mytype", "integration-url:someurl"]}
+        topology.assert_snapshot(check.check_id, check.key, components=created_components)
+
+    def test_relations_batch(self, topology):
+        check = TopologyCheck()
+        created_relations = check.relations([
+            {"source_id": "source-id", "target_id": "target-id-1", "type": "uses", "data": {"key": "value"}},
+            {"source_id": "source-id", "target_id": "target-id-2", "type": "uses", "data": {}},
+        ])
+        assert created_relations == [
+            {"source_id": "source-id", "target_id": "target-id-1", "type": "uses", "data": {"key": "value"}},
+            {"source_id": "source-id", "target_id": "target-id-2", "type": "uses", "data": {}},
+        ]
+        topology.assert_snapshot(check.check_id, check.key, relations=created_relations)
+
+    def test_batch_without_batch_binding(self, topology):
+        """
+        The topology binding of the agent has no submit_components / submit_relations, the elements of the batch are
+        then submitted one by one.
+        """
+        check = TopologyCheck()
+        with mock.patch('stackstate_checks.base.checks.base.topology', spec=['submit_component', 'submit_relation']) \
+                as binding:
+            created_components = check.components([
+                {"id": "my-id-1", "type": "my-type", "data": {}},
+                {"id": "my-id-2", "type": "my-type", "data": {"key": {1: "non string key"}}},
+                {"id": "my-id-3", "type": "my-type", "data": {"key": "value"}},
+            ])
+            created_relations = check.relations([
+                {"source_id": "my-id-1", "target_id": "my-id-3", "type": "uses", "data": {}},
+                {"source_id": "my-id-3", "target_id": "my-id-1", "type": "uses", "data": {}},
+            ])
+        instance_key = check._get_instance_key_dict()
+        assert binding.submit_component.call_args_list == [
+            mock.call(check, check.check_id, instance_key, c["id"], c["type"], c["data"]) for c in created_components
+        ]
+        assert [c["id"] for c in created_components] == ["my-id-1", "my-id-3"]
+        assert binding.submit_relation.call_args_list == [
+            mock.call(check, check.check_id, instance_key, r["source_id"], r["target_id"], r["type"], r["data"])
+            for r in created_relations
+        ]
+        assert len(created_relations) == 2
+
+    def test_instance_schema_validated_once_per_run(self, topology):
+        check = TopologyStatefulSchemaCheck()
+        with mock.patch.object(check, '_get_instance_schema', wraps=check._get_instance_schema) as validate:
+            for i in range(10):
+                check.component("my-id-{}".format(i), "my-type", {})
+            check.relation("my-id-1", "my-id-2", "uses", {})
+            assert validate.call_count == 1
+            # a replaced instance is validated again
+            check.instance = {'a': 'c'}
+            check.component("my-id", "my-type", {})
+            assert validate.call_count == 2
+
 
 class TestHealthStreamUrn:
     def test_health_stream_urn_escaping(self):
@@ -97,7 +97,7 @@ def mock_get():
     with open(f_name, 'r') as f:
         text_data = f.read()
     with mock.patch(
-        'requests.get',
+        'requests.Session.get',
         return_value=mock.MagicMock(
             status_code=200,
             iter_lines=lambda **kwargs: text_data.split("\n"),
@@ -148,7 +148,7 @@ def test_poll_text_plain(mocked_prometheus_check, mocked_prometheus_scraper_conf
     mock_response = mock.MagicMock(
         status_code=200, iter_lines=lambda **kwargs: text_data.split("\n"), headers={'Content-Type': text_content_type}
     )
-    with mock.patch('requests.get', return_value=mock_response, __name__="get"):
+    with mock.patch('requests.Session.get', return_value=mock_response, __name__="get"):
         response = check.poll(mocked_prometheus_scraper_config)
         messages = list(check.parse_metric_family(response, mocked_prometheus_scraper_config))
         messages.sort(key=lambda x: x.name)
@@ -156,6 +156,30 @@ def test_poll_text_plain(mocked_prometheus_check, mocked_prometheus_scraper_conf
         assert messages[-1].name == 'skydns_skydns_dns_response_size_bytes'
 
 
+def test_poll_reuses_session(mocked_prometheus_check, mocked_prometheus_scraper_config, text_data):
+    """Tests that the pooled session is reused between polls and rebuilt when the configuration changes"""
+    check = mocked_prometheus_check
+    mock_response = mock.MagicMock(
+        status_code=200, iter_lines=lambda **kwargs: text_data.split("\n"), headers={'Content-Type': text_content_type}
+    )
+    with mock.patch('requests.Session.get', return_value=mock_response, __name__="get") as get:
+        check.poll(mocked_prometheus_scraper_config)
+        session = mocked_prometheus_scraper_config['_session']
+        check.poll(mocked_prometheus_scraper_config)
+        assert mocked_prometheus_scraper_config['_session'] is session
+        assert get.call_count == 2
+
+        mocked_prometheus_scraper_config['connection_pool_size'] = 2
+        mocked_prometheus_scraper_config['keep_alive'] = False
+        with mock.patch.object(session, 'close') as close:
+            check.poll(mocked_prometheus_scraper_config)
+            close.assert_called_once()
+        new_session = mocked_prometheus_scraper_config['_session']
+        assert new_session is not session
+        assert new_session.headers['Connection'] == 'close'
+        assert new_session.get_adapter('https://localhost')._pool_maxsize == 2
+
+
 def test_submit_gauge_with_labels(aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config):
     """ submitting metrics that contain labels should result in tags on the gauge call """
     ref_gauge = GaugeMetricFamily(
@@ -1311,7 +1335,7 @@ def test_label_joins_gc(aggregator, mocked_prometheus_check, mocked_prometheus_s
     mock_response = mock.MagicMock(
         status_code=200, iter_lines=lambda **kwargs: text_data.split("\n"), headers={'Content-Type': text_content_type}
     )
-    with mock.patch('requests.get', return_value=mock_response, __name__="get"):
+    with mock.patch('requests.Session.get', return_value=mock_response, __name__="get"):
         check.process(mocked_prometheus_scraper_config)
         assert 'dd-agent-1337' in mocked_prometheus_scraper_config['_label_mapping']['pod']
         assert 'dd-agent-62bgh' not in mocked_prometheus_scraper_config['_label_mapping']['pod']
@@ -1477,7 +1501,7 @@ def test_label_join_state_change(aggregator, mocked_prometheus_check, mocked_pro
     mock_response = mock.MagicMock(
         status_code=200, iter_lines=lambda **kwargs: text_data.split("\n"), headers={'Content-Type': text_content_type}
     )
-    with mock.patch('requests.get', return_value=mock_response, __name__="get"):
+    with mock.patch('requests.Session.get', return_value=mock_response, __name__="get"):
         check.process(mocked_prometheus_scraper_config)
         assert 15 == len(mocked_prometheus_scraper_config['_label_mapping']['pod'])
         assert mocked_prometheus_scraper_config['_label_mapping']['pod']['dd-agent-62bgh']['phase'] == 'Test'
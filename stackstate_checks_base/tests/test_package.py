@@ -0,0 +1,33 @@
+# (C) StackState 2021
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+import subprocess
+import sys
+
+import pytest
+
+import stackstate_checks.base
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="module level __getattr__ requires Python 3.7")
+def test_subsystems_are_imported_on_first_access():
+    code = (
+        "import sys\n"
+        "import stackstate_checks.base\n"
+        "assert 'stackstate_checks.base.checks' not in sys.modules\n"
+        "from stackstate_checks.base import is_affirmative\n"
+        "assert 'stackstate_checks.base.checks.openmetrics' not in sys.modules\n"
+        "assert 'stackstate_checks.base.checks.kube_leader' not in sys.modules\n"
+        "from stackstate_checks.base import OpenMetricsBaseCheck\n"
+        "assert 'stackstate_checks.base.checks.openmetrics' in sys.modules\n"
+    )
+    subprocess.check_call([sys.executable, '-c', code])
+
+
+def test_public_attributes():
+    for name in stackstate_checks.base.__all__:
+        assert hasattr(stackstate_checks.base, name)
+        assert name in dir(stackstate_checks.base)
+
+    with pytest.raises(AttributeError):
+        stackstate_checks.base.DoesNotExist
@@ -11,7 +11,7 @@ from six import iteritems, iterkeys
 from six.moves import range
 
 from stackstate_checks.checks.prometheus import PrometheusCheck, UnknownFormatError
-from stackstate_checks.utils.prometheus import parse_metric_family, metrics_pb2
+from stackstate_checks.utils.prometheus import parse_metric_family, parse_metric_family_stream, metrics_pb2
 
 
 protobuf_content_type = 'application/vnd.google.protobuf; proto=io.prometheus.client.MetricFamily; encoding=delimited'
@@ -115,6 +115,15 @@ def test_parse_metric_family():
         assert messages[-1].name == 'process_virtual_memory_bytes'
 
 
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 1024, 51855, 100000])
+def test_parse_metric_family_stream(bin_data, chunk_size):
+    chunks = (bin_data[i:i + chunk_size] for i in range(0, len(bin_data), chunk_size))
+    messages = list(parse_metric_family_stream(chunks))
+    assert messages == list(parse_metric_family(bin_data))
+    assert len(messages) == 61
+    assert messages[-1].name == 'process_virtual_memory_bytes'
+
+
 def test_check(mocked_prometheus_check):
     """ Should not be implemented as it is the mother class """
     with pytest.raises(NotImplementedError):
@@ -331,12 +340,19 @@ def test_process_metric_filtered(mocked_prometheus_check):
 def test_poll_protobuf(mocked_prometheus_check, bin_data):
     """ Tests poll using the protobuf format """
     check = mocked_prometheus_check
-    mock_response = mock.MagicMock(status_code=200, content=bin_data, headers={'Content-Type': protobuf_content_type})
-    with mock.patch('requests.get', return_value=mock_response, __name__="get"):
+
+    def iter_content(chunk_size, **_):
+        for i in range(0, len(bin_data), chunk_size):
+            yield bin_data[i:i + chunk_size]
+
+    mock_response = mock.MagicMock(status_code=200, iter_content=iter_content,
+                                   headers={'Content-Type': protobuf_content_type})
+    with mock.patch('requests.get', return_value=mock_response, __name__="get") as get:
         response = check.poll("http://fake.endpoint:10055/metrics")
         messages = list(check.parse_metric_family(response))
         assert len(messages) == 61
         assert messages[-1].name == 'process_virtual_memory_bytes'
+        assert get.call_args[1]['stream'] is True
 
 
 def test_poll_text_plain(mocked_prometheus_check, text_data):
@@ -2,8 +2,10 @@
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
 import json
+import logging
 from decimal import ROUND_HALF_DOWN, ROUND_HALF_UP
 
+import mock
 import pytest
 import os
 import platform
@@ -11,8 +13,9 @@ import platform
 from stackstate_checks.base.utils.common import load_json_from_file
 from stackstate_checks.utils.common import pattern_filter, round_value, read_file
 from stackstate_checks.utils.limiter import Limiter
+from stackstate_checks.base.utils.tailfile import PersistentTailFile
 from stackstate_checks.utils.persistent_state import StateManager, StateDescriptor, StateNotPersistedException, \
-    StateCorruptedException, StateReadException
+    StateCorruptedException, StateReadException, CopyOnWriteDict
 from six import PY3
 from schematics import Model
 from schematics.types import IntType
@@ -216,6 +219,198 @@ class TestPersistentState:
         # assert the state remains unchanged, state should have offset as 10
         state.assert_state(instance, s, TestStorageSchema)
 
+    def test_unchanged_state_is_not_rewritten(self, tmpdir):
+        manager = StateManager(logging.getLogger(__name__))
+        instance = StateDescriptor("unchanged.state", str(tmpdir))
+        s = {'offset': 10}
+        manager.set_state(instance, s)
+        # the state is replaced atomically, no temporary files are left behind
+        assert os.listdir(str(tmpdir)) == ['unchanged.state.state']
+
+        os.remove(instance.file_location)
+        manager.set_state(instance, s)
+        assert os.path.isfile(instance.file_location)
+
+        # an equal state is neither encoded nor written, neither is a state that is read from disk
+        with mock.patch.object(manager, '_encode') as encode:
+            manager.set_state(instance, {'offset': 10})
+            manager.flush(instance)
+            reading_manager = StateManager(logging.getLogger(__name__))
+            reading_manager.get_state(instance)
+            reading_manager.flush(instance)
+            assert encode.call_count == 0
+
+        # a state changed in place is written once it is set
+        state = manager.get_state(instance)
+        state['offset'] = 20
+        manager.set_state(instance, state)
+        assert StateManager(logging.getLogger(__name__)).get_state(instance) == {'offset': 20}
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="file modes are not supported on Windows")
+    def test_state_file_mode(self, tmpdir):
+        manager = StateManager(logging.getLogger(__name__))
+        instance = StateDescriptor("file.mode.state", str(tmpdir))
+        umask = os.umask(0o022)
+        try:
+            # a new state file is created honoring the umask
+            manager.set_state(instance, {'offset': 10})
+            assert os.stat(instance.file_location).st_mode & 0o777 == 0o644
+
+            # a replaced state file keeps its mode
+            os.chmod(instance.file_location, 0o640)
+            manager.set_state(instance, {'offset': 20})
+            assert os.stat(instance.file_location).st_mode & 0o777 == 0o640
+        finally:
+            os.umask(umask)
+
+    def test_compressed_state(self, tmpdir):
+        instance = StateDescriptor("compressed.state", str(tmpdir))
+        s = {'seen': ['id-%s' % i for i in range(1000)]}
+        StateManager(logging.getLogger(__name__)).set_state(instance, s)
+        uncompressed_size = os.path.getsize(instance.file_location)
+
+        # an uncompressed state file is read by a manager that compresses, and rewritten compressed once it changes
+        manager = StateManager(logging.getLogger(__name__), compress=True)
+        assert manager.get_state(instance) == s
+        s['seen'].append('id-1000')
+        manager.set_state(instance, s)
+        with open(instance.file_location, 'rb') as f:
+            assert f.read(2) == b'\x1f\x8b'
+        assert os.path.getsize(instance.file_location) < uncompressed_size
+
+        assert StateManager(logging.getLogger(__name__)).get_state(instance) == s
+
+    def test_exception_corrupted_compressed_state(self, tmpdir):
+        instance = StateDescriptor("corrupted.compressed.state", str(tmpdir))
+        with open(instance.file_location, 'wb') as f:
+            f.write(b'\x1f\x8bnot gzip')
+
+        with pytest.raises(StateCorruptedException):
+            StateManager(logging.getLogger(__name__)).get_state(instance)
+
+
+class TestCopyOnWriteDict:
+    def test_read_only_access(self):
+        original = {'offset': 10, 'seen': ['a', 'b'], 'nested': {'a': 'b'}}
+        state = CopyOnWriteDict(original)
+        assert state['seen'] == ['a', 'b']
+        assert dict(state.items()) == original
+        assert state.get('missing', {}) == {}
+        assert state.modified is False
+
+    def test_nested_changes_are_copied(self):
+        original = {'offset': 10, 'seen': ['a', 'b'], 'nested': {'a': 'b'}}
+        state = CopyOnWriteDict(original)
+        state['seen'].append('c')
+        state.get('nested')['a'] = 'c'
+        assert state.modified is True
+        assert original == {'offset': 10, 'seen': ['a', 'b'], 'nested': {'a': 'b'}}
+        assert state.to_dict() == {'offset': 10, 'seen': ['a', 'b', 'c'], 'nested': {'a': 'c'}}
+        assert type(state.to_dict()) is dict
+
+    def test_set_and_delete(self):
+        original = {'offset': 10, 'seen': ['a', 'b']}
+        state = CopyOnWriteDict(original)
+        state['offset'] = 20
+        del state['seen']
+        assert state.modified is True
+        assert state == {'offset': 20}
+        assert original == {'offset': 10, 'seen': ['a', 'b']}
+
+        state = CopyOnWriteDict(original)
+        state.setdefault('offset', 30)
+        assert state.modified is False
+        state.setdefault('new', 30)
+        assert state.modified is True
+
+
+class TestPersistentTailFile:
+    LOG = logging.getLogger(__name__)
+
+    @staticmethod
+    def _append(path, data):
+        with open(path, 'ab') as f:
+            f.write(data)
+
+    def _tailer(self, path, lines):
+        return PersistentTailFile(self.LOG, path, lines.append)
+
+    def test_tail_complete_lines(self, tmpdir):
+        path = str(tmpdir.join('test.log'))
+        self._append(path, b'before the tailer started\n')
+        lines = []
+        tailer = self._tailer(path, lines)
+        tailer.seek_end()
+
+        self._append(path, b'first line\nsecond line\nincomplete')
+        assert tailer.tail() == 2
+        self._append(path, b' line\n\0\0after a hole\n')
+        assert tailer.tail() == 2
+        assert lines == ['first line', 'second line', 'incomplete line', 'after a hole']
+        assert tailer.offset['position'] == os.path.getsize(path)
+        tailer.close()
+
+    def test_resume_at_saved_offset(self, tmpdir):
+        path = str(tmpdir.join('test.log'))
+        lines = []
+        tailer = self._tailer(path, lines)
+        self._append(path, b'line written before the first run\n')
+        tailer.tail()
+        offset = json.loads(json.dumps(tailer.offset))
+        tailer.close()
+
+        # written while the agent was down
+        self._append(path, b'line written while stopped\n')
+        tailer = self._tailer(path, lines)
+        tailer.restore(offset)
+        tailer.tail()
+        assert lines == ['line written before the first run', 'line written while stopped']
+        tailer.close()
+
+    def test_restore_rotated_file(self, tmpdir):
+        path = str(tmpdir.join('test.log'))
+        lines = []
+        tailer = self._tailer(path, lines)
+        self._append(path, b'line of the rotated file\n')
+        tailer.tail()
+        offset = tailer.offset
+        tailer.close()
+
+        os.rename(path, path + '.1')
+        self._append(path, b'line of the new file\n')
+        tailer = self._tailer(path, lines)
+        tailer.restore(offset)
+        tailer.tail()
+        assert lines == ['line of the rotated file', 'line of the new file']
+        tailer.close()
+
+    def test_rotation_and_truncation(self, tmpdir):
+        path = str(tmpdir.join('test.log'))
+        lines = []
+        tailer = self._tailer(path, lines)
+        self._append(path, b'first line of the first file\n')
+        tailer.seek_end()
+        self._append(path, b'second line of the first file\n')
+
+        # the remainder of the rotated file is read before the new file
+        os.rename(path, path + '.1')
+        self._append(path, b'first line of the second file\n')
+        assert tailer.tail() == 2
+        assert lines == ['second line of the first file', 'first line of the second file']
+
+        # copytruncate
+        with open(path, 'wb') as f:
+            f.write(b'truncated to a new line\n')
+        assert tailer.tail() == 1
+        assert lines[-1] == 'truncated to a new line'
+
+        # copytruncate with more data written than was read before
+        with open(path, 'wb') as f:
+            f.write(b'rewritten after another truncate\nand more\n')
+        assert tailer.tail() == 2
+        assert lines[-2:] == ['rewritten after another truncate', 'and more']
+        tailer.close()
+
 
 class TestCommon:
     SAMPLE_FILE_CONTET = '{\n    "hello": "world",\n    "pong": true\n}\n'
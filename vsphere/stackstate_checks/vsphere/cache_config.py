@@ -8,13 +8,14 @@ from collections import defaultdict
 
 class CacheConfig:
     """
-    Wraps configuration and status for the Morlist and Metadata caches.
+    Wraps configuration and status for the Morlist, Metadata and Tags caches.
     CacheConfig is threadsafe and can be used from different workers in the
     threading pool.
     """
 
     Morlist = 0
     Metadata = 1
+    Tags = 2
 
     def __init__(self):
         self._lock = threading.RLock()
@@ -24,7 +25,7 @@ class CacheConfig:
         """
         Basic sanity check to avoid KeyErrors
         """
-        if type_ not in (CacheConfig.Morlist, CacheConfig.Metadata):
+        if type_ not in (CacheConfig.Morlist, CacheConfig.Metadata, CacheConfig.Tags):
             raise TypeError("Wrong cache type passed")
 
     def clear(self):
@@ -35,6 +36,7 @@ class CacheConfig:
             self._config = {
                 CacheConfig.Morlist: {'last': defaultdict(float), 'intl': {}},
                 CacheConfig.Metadata: {'last': defaultdict(float), 'intl': {}},
+                CacheConfig.Tags: {'last': defaultdict(float), 'intl': {}},
             }
 
     def set_last(self, type_, key, ts):
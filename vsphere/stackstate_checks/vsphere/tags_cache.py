@@ -0,0 +1,46 @@
+# (C) StackState 2021
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+
+import threading
+
+
+class TagsCache:
+    """
+    Implements a thread safe storage for the vSphere tag and category definitions of a vCenter instance.
+    The cache maps: tag ID --> tag name, category ID and category ID --> category name
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        """
+        Remove all the tag and category definitions from the cache.
+        """
+        with self._lock:
+            self._tags = {}
+            self._categories = {}
+
+    def get_tag(self, tag_id):
+        """
+        Return the (name, category ID) pair of the tag, or None when the tag is not in the cache.
+        """
+        with self._lock:
+            return self._tags.get(tag_id)
+
+    def set_tag(self, tag_id, name, category_id):
+        with self._lock:
+            self._tags[tag_id] = (name, category_id)
+
+    def get_category(self, category_id):
+        """
+        Return the name of the category, or None when the category is not in the cache.
+        """
+        with self._lock:
+            return self._categories.get(category_id)
+
+    def set_category(self, category_id, name):
+        with self._lock:
+            self._categories[category_id] = name
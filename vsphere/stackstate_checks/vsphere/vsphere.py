@@ -20,6 +20,7 @@ from six import itervalues
 from six.moves import range
 from vmware.vapi.vsphere.client import create_vsphere_client
 from com.vmware.vapi.std_client import DynamicID
+from com.vmware.vapi.std.errors_client import Unauthenticated
 from schematics import Model
 from schematics.exceptions import DataError
 from schematics.types import StringType, BooleanType
@@ -39,6 +40,7 @@ from .errors import BadConfigError, ConnectionError
 from .metadata_cache import MetadataCache, MetadataNotFoundError
 from .mor_cache import MorCache, MorNotFoundError
 from .objects_queue import ObjectsQueue
+from .tags_cache import TagsCache
 from .topology_util import vsphere_component_types, vsphere_relation_types, vsphere_layers, add_label_pair
 
 # Default vCenter sampling interval
@@ -53,6 +55,10 @@ DEFAULT_MAX_HIST_METRICS = 64
 REFRESH_MORLIST_INTERVAL = 3 * 60
 # The interval in seconds between two refresh of metrics metadata (id<->name)
 REFRESH_METRICS_METADATA_INTERVAL = 10 * 60
+# The interval in seconds between two refresh of the tag and category definitions (id<->name)
+REFRESH_TAGS_INTERVAL = 10 * 60
+# The amount of objects batched at the same time in the list_attached_tags_on_objects method
+BATCH_TAGS_SIZE = 500
 # The amount of objects batched at the same time in the QueryPerf method to query available metrics
 BATCH_MORLIST_SIZE = 50
 # Maximum number of objects to collect at once by the propertyCollector. The size of the response returned by the query
@@ -66,6 +72,16 @@ RESOURCE_TYPE_METRICS = RESOURCE_TYPE_METRICS_REALTIME + RESOURCE_TYPE_METRICS_H
 
 RESOURCE_TYPE_NO_METRIC = (vim.ComputeResource, vim.Folder)
 
+# Object types of the topology components with tags, ClusterComputeResource must precede its ComputeResource base
+RESOURCE_TYPE_TAGS = (
+    (vim.VirtualMachine, "VirtualMachine"),
+    (vim.HostSystem, "HostSystem"),
+    (vim.Datastore, "Datastore"),
+    (vim.Datacenter, "Datacenter"),
+    (vim.ClusterComputeResource, "ClusterComputeResource"),
+    (vim.ComputeResource, "ComputeResource"),
+)
+
 SHORT_ROLLUP = {
     "average": "avg",
     "summation": "sum",
@@ -127,6 +143,8 @@ class VSphereCheck(AgentCheck):
         self.refresh_metrics_metadata_interval = init_config.get(
             'refresh_metrics_metadata_interval', REFRESH_METRICS_METADATA_INTERVAL
         )
+        self.refresh_tags_interval = init_config.get('refresh_tags_interval', REFRESH_TAGS_INTERVAL)
+        self.batch_tags_size = max(init_config.get("batch_tags_size", BATCH_TAGS_SIZE), 1)
 
         # Connections open to vCenter instances
         self.server_instances = {}
@@ -147,6 +165,7 @@ class VSphereCheck(AgentCheck):
             # caches
             self.cache_config.set_interval(CacheConfig.Morlist, i_key, self.refresh_morlist_interval)
             self.cache_config.set_interval(CacheConfig.Metadata, i_key, self.refresh_metrics_metadata_interval)
+            self.cache_config.set_interval(CacheConfig.Tags, i_key, self.refresh_tags_interval)
             # events
             self.event_config[i_key] = instance.get('event_config')
 
@@ -161,6 +180,18 @@ class VSphereCheck(AgentCheck):
 
         # Metrics metadata, for each instance keeps the mapping: perfCounterKey -> {name, group, description}
         self.metadata_cache = MetadataCache()
+
+        # Authenticated vSphere REST clients, for each instance keeps the pair: (session, client)
+        self.vsphere_clients = {}
+        self.session = None
+        self.client = None
+
+        # Tag and category definitions, for each instance keeps a TagsCache
+        self.tags_caches = {}
+        self.tags_cache = TagsCache()
+        # Tag IDs attached to the topology objects: (object type, object ID) -> list of tag IDs
+        self.attached_tags = {}
+
         self.latest_event_query = {}
         self.exception_printed = 0
 
@@ -1018,18 +1049,54 @@ class VSphereCheck(AgentCheck):
 
         return StackPackInstance(self.INSTANCE_TYPE, instance["host"], with_snapshots=False)
 
+    @staticmethod
+    def _get_tag_object_type(obj):
+        for resource_type, object_type in RESOURCE_TYPE_TAGS:
+            if isinstance(obj, resource_type):
+                return object_type
+        return None
+
+    def _collect_attached_tags(self, all_objects, regexes=None, include_only_marked=False):
+        """
+        Fetch the tag IDs attached to all the topology objects, in batches of `batch_tags_size` objects
+        """
+        object_ids = []
+        for obj, properties in all_objects.items():
+            object_type = self._get_tag_object_type(obj)
+            if object_type and not self._is_excluded(obj, properties, regexes, include_only_marked):
+                object_ids.append(DynamicID(type=object_type, id=obj._moId))
+
+        self.attached_tags = {}
+        for i in range(0, len(object_ids), self.batch_tags_size):
+            batch = object_ids[i:i + self.batch_tags_size]
+            for object_tags in self.client.tagging.TagAssociation.list_attached_tags_on_objects(batch):
+                self.attached_tags[(object_tags.object_id.type, object_tags.object_id.id)] = object_tags.tag_ids
+
+    def _get_tag(self, tag_id):
+        """
+        Return the (tag name, category name) of the tag, the definitions are fetched once and kept in the tags cache
+        """
+        tag = self.tags_cache.get_tag(tag_id)
+        if tag is None:
+            tag_model = self.client.tagging.Tag.get(tag_id)
+            tag = (tag_model.name, tag_model.category_id)
+            self.tags_cache.set_tag(tag_id, *tag)
+        tag_name, category_id = tag
+        category_name = self.tags_cache.get_category(category_id)
+        if category_name is None:
+            category_name = self.client.tagging.Category.get(category_id).name
+            self.tags_cache.set_category(category_id, category_name)
+        return tag_name, category_name
+
     def extract_tags(self, object_type, object_id):
         sts_identifiers = []
         labels = []
-        dynamic_id = DynamicID(type=object_type, id=object_id)
-        tag_ids = self.client.tagging.TagAssociation.list_attached_tags(dynamic_id)
-        for tag_id in tag_ids:
-            tag_model = self.client.tagging.Tag.get(tag_id)
-            category = self.client.tagging.Category.get(tag_model.category_id)
-            if category.name.lower() == "stackstate-identifier":
-                sts_identifiers.append(tag_model.name.lower())
+        for tag_id in self.attached_tags.get((object_type, object_id), []):
+            tag_name, category_name = self._get_tag(tag_id)
+            if category_name.lower() == "stackstate-identifier":
+                sts_identifiers.append(tag_name.lower())
             else:
-                add_label_pair(labels, category.name.lower(), tag_model.name.lower())
+                add_label_pair(labels, category_name.lower(), tag_name.lower())
         return sts_identifiers, labels
 
     def get_topology_items(self, server_instance, domain="Unspecified", regexes=None, include_only_marked=False):
@@ -1040,6 +1107,7 @@ class VSphereCheck(AgentCheck):
         obj_list = {"vms": [], "datastores": [], "datacenters": [], "hosts": [], "clustercomputeresource": [],
                     "computeresource": []}
         all_objects = self._collect_mors_and_attributes(server_instance)
+        self._collect_attached_tags(all_objects, regexes, include_only_marked)
         for obj, properties in all_objects.items():
             topology_tags = {}
             if not self._is_excluded(obj, properties, regexes, include_only_marked):
@@ -1215,13 +1283,34 @@ class VSphereCheck(AgentCheck):
             password=instance.get('password'),
             session=self.session)
 
+    def _get_vsphere_client(self, instance, reconnect=False):
+        """
+        Use the authenticated vSphere REST client of this instance, a new session is only opened on the first run
+        or when `reconnect` is set because the previous session expired.
+        """
+        i_key = self._instance_key(instance)
+        if reconnect or i_key not in self.vsphere_clients:
+            session, _ = self.vsphere_clients.pop(i_key, (None, None))
+            if session:
+                session.close()
+            self.vsphere_client_connect(instance)
+            self.vsphere_clients[i_key] = (self.session, self.client)
+        self.session, self.client = self.vsphere_clients[i_key]
+
+        if i_key not in self.tags_caches:
+            self.tags_caches[i_key] = TagsCache()
+        self.tags_cache = self.tags_caches[i_key]
+        if self._should_cache(instance, CacheConfig.Tags):
+            self.tags_cache.clear()
+            self.cache_config.set_last(CacheConfig.Tags, i_key, time.time())
+
     def collect_topology(self, instance):
 
         def build_id(vsphere_url, object_type, object_name):
             return "urn:vsphere:/{0}/{1}/{2}".format(vsphere_url, object_type, object_name)
 
         server_instance = self._get_server_instance(instance)
-        self.vsphere_client_connect(instance)
+        self._get_vsphere_client(instance)
         domain = instance.get("domain", instance.get("host"))
 
         regexes = {
@@ -1229,11 +1318,13 @@ class VSphereCheck(AgentCheck):
             'vm_include': instance.get('vm_include_only_regex')
         }
 
-        topology_items = self.get_topology_items(server_instance, domain, regexes)
+        try:
+            topology_items = self.get_topology_items(server_instance, domain, regexes)
+        except Unauthenticated:
+            self.log.info("vSphere REST session expired, logging in again")
+            self._get_vsphere_client(instance, reconnect=True)
+            topology_items = self.get_topology_items(server_instance, domain, regexes)
 
-        # close the session after the processing of all Tags from the new Rest Client
-        if self.session:
-            self.session.close()
         vsphere_url = instance.get("host")
 
         self.start_snapshot()
@@ -8,7 +8,7 @@ from stackstate_checks.vsphere.cache_config import CacheConfig
 
 def test___init__():
     c = CacheConfig()
-    for t in (CacheConfig.Morlist, CacheConfig.Metadata):
+    for t in (CacheConfig.Morlist, CacheConfig.Metadata, CacheConfig.Tags):
         for label in ('last', 'intl'):
             assert len(c._config[t][label]) == 0
     assert c.get_last
@@ -20,6 +20,7 @@ def test__check_type():
         c._check_type(-99)
     c._check_type(CacheConfig.Morlist)
     c._check_type(CacheConfig.Metadata)
+    c._check_type(CacheConfig.Tags)
 
 
 def test_clear():
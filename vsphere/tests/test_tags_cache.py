@@ -0,0 +1,31 @@
+# (C) StackState 2021
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+import pytest
+
+from stackstate_checks.vsphere.tags_cache import TagsCache
+
+
+@pytest.fixture
+def cache():
+    return TagsCache()
+
+
+def test_tags(cache):
+    assert cache.get_tag("123") is None
+    cache.set_tag("123", "foo", "345")
+    assert cache.get_tag("123") == ("foo", "345")
+
+
+def test_categories(cache):
+    assert cache.get_category("345") is None
+    cache.set_category("345", "stackstate-identifier")
+    assert cache.get_category("345") == "stackstate-identifier"
+
+
+def test_clear(cache):
+    cache.set_tag("123", "foo", "345")
+    cache.set_category("345", "stackstate-identifier")
+    cache.clear()
+    assert cache.get_tag("123") is None
+    assert cache.get_category("345") is None
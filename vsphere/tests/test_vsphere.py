@@ -9,6 +9,7 @@ from datetime import datetime
 import mock
 import pytest
 from mock import MagicMock
+from com.vmware.vapi.std.errors_client import Unauthenticated
 from pyVmomi import vim
 from schematics.exceptions import DataError
 
@@ -24,7 +25,7 @@ from stackstate_checks.vsphere.vsphere import (
 )
 
 from .utils import MockedMOR, assertMOR, disable_thread_pool, get_mocked_server, mock_alarm_event, vsphere_client, \
-    VsphereTag, VsphereCategory
+    VsphereTag, VsphereCategory, attached_tags
 
 
 SERVICE_CHECK_TAGS = ["vcenter_server:vsphere_mock", "vcenter_host:test", "foo:bar", "integration-type:vsphere",
@@ -749,8 +750,8 @@ def test_get_topology_items_vms_hosts(vsphere, instance):
     # get the client
     client = vsphere_client()
 
-    # list_attached_tags method returns empty list of tags
-    client.tagging.TagAssociation.list_attached_tags = MagicMock(return_value=[])
+    # list_attached_tags_on_objects method returns empty list of tags for every object
+    client.tagging.TagAssociation.list_attached_tags_on_objects = attached_tags([])
 
     # assign the vsphere client object to the vsphere check client object
     vsphere.client = client
@@ -810,8 +811,8 @@ def test_get_topology_items_ds_dc(vsphere, instance):
     # get the client
     client = vsphere_client()
 
-    # list_attached_tags method returns list of tags ids of type string
-    client.tagging.TagAssociation.list_attached_tags = MagicMock(return_value=['123'])
+    # list_attached_tags_on_objects method returns list of tags ids of type string for every object
+    client.tagging.TagAssociation.list_attached_tags_on_objects = attached_tags(['123'])
     # get method of Tag returns a TagModel object which is returned
     client.tagging.Tag.get = MagicMock(return_value=tags)
     # get method of Category returns a CategoryModel object which is returned
@@ -873,8 +874,8 @@ def test_get_topology_items_regex_vms(vsphere, instance):
     # get the client
     client = vsphere_client()
 
-    # list_attached_tags method returns empty list of tags
-    client.tagging.TagAssociation.list_attached_tags = MagicMock(return_value=[])
+    # list_attached_tags_on_objects method returns empty list of tags for every object
+    client.tagging.TagAssociation.list_attached_tags_on_objects = attached_tags([])
 
     # assign the vsphere client object to the vsphere check client object
     vsphere.client = client
@@ -910,8 +911,8 @@ def test_check_vsphere_topology_with_vm_host(instance, topology):
     # get the client
     client = vsphere_client()
 
-    # list_attached_tags method returns empty list of tags
-    client.tagging.TagAssociation.list_attached_tags = MagicMock(return_value=[])
+    # list_attached_tags_on_objects method returns empty list of tags for every object
+    client.tagging.TagAssociation.list_attached_tags_on_objects = attached_tags([])
 
     # assign the vsphere client object to the vsphere check client object
     vsphere_check.client = client
@@ -992,8 +993,8 @@ def test_check_vsphere_full_topology(instance, topology):
     category = VsphereCategory('345', 'stackstate-identifier')
     tags = VsphereTag('123', 'vishal-test', '345')
 
-    # list_attached_tags method returns list of tags ids of type string
-    client.tagging.TagAssociation.list_attached_tags = MagicMock(return_value=['123'])
+    # list_attached_tags_on_objects method returns list of tags ids of type string for every object
+    client.tagging.TagAssociation.list_attached_tags_on_objects = attached_tags(['123'])
     # get method of Tag returns a TagModel object which is returned
     client.tagging.Tag.get = MagicMock(return_value=tags)
     # get method of Category returns a CategoryModel object which is returned
@@ -1146,6 +1147,73 @@ def test_check_vsphere_full_topology(instance, topology):
                     }
                 ],
             )
+            # the tags of all objects are fetched at once and the tag definitions only once
+            client.tagging.TagAssociation.list_attached_tags_on_objects.assert_called_once()
+            client.tagging.Tag.get.assert_called_once_with('123')
+            client.tagging.Category.get.assert_called_once_with('345')
+
+            # the next run reuses the REST session and the cached tag definitions
+            vsphere_check.check(instance)
+            vsphere_check.vsphere_client_connect.assert_called_once()
+            assert client.tagging.TagAssociation.list_attached_tags_on_objects.call_count == 2
+            client.tagging.Tag.get.assert_called_once_with('123')
+
+
+def test_collect_attached_tags_batches(instance):
+    """
+    Test the attached tags are fetched in batches of batch_tags_size objects
+    """
+    vsphere_check = VSphereCheck('vsphere', {'batch_tags_size': 2}, [instance])
+    vsphere_check.client = vsphere_client()
+    list_attached_tags = vsphere_check.client.tagging.TagAssociation.list_attached_tags_on_objects = \
+        attached_tags(['123'])
+    mocked_vms = {MockedMOR(spec="VirtualMachine", _moId="vm-%d" % i): {"name": "vm-%d" % i} for i in range(5)}
+
+    vsphere_check._collect_attached_tags(mocked_vms)
+
+    assert [len(call[0][0]) for call in list_attached_tags.call_args_list] == [2, 2, 1]
+    assert vsphere_check.attached_tags == {("VirtualMachine", "vm-%d" % i): ['123'] for i in range(5)}
+
+
+def test_collect_topology_reconnects_expired_session(instance, topology):
+    """
+    Test the REST session is opened again and the topology collected when the reused session expired
+    """
+    vsphere_check = VSphereCheck('vsphere', {}, [instance])
+    expired_session = MagicMock()
+    expired_client = vsphere_client()
+    expired_client.tagging.TagAssociation.list_attached_tags_on_objects = MagicMock(side_effect=Unauthenticated())
+    client = vsphere_client()
+    client.tagging.TagAssociation.list_attached_tags_on_objects = attached_tags([])
+    sessions = [(expired_session, expired_client), (MagicMock(), client)]
+
+    def vsphere_client_connect(instance):
+        vsphere_check.session, vsphere_check.client = sessions.pop(0)
+
+    vsphere_check.vsphere_client_connect = MagicMock(side_effect=vsphere_client_connect)
+    mocked_vm = MockedMOR(spec="VirtualMachine", _moId="vm-1")
+    mocked_mors_attrs = {
+        mocked_vm: {
+            "name": "mocked_vm",
+            "parent": None,
+            "runtime.powerState": vim.VirtualMachinePowerState.poweredOn,
+            "config.guestId": "other3xLinux64Guest",
+            "config.hardware.numCPU": "2"
+        }
+    }
+
+    with mock.patch('stackstate_checks.vsphere.vsphere.vmodl'):
+        with mock.patch('stackstate_checks.vsphere.vsphere.connect.SmartConnect') as SmartConnect:
+            SmartConnect.return_value = get_mocked_server()
+            vsphere_check._collect_mors_and_attributes = mock.MagicMock(return_value=mocked_mors_attrs)
+            vsphere_check.collect_topology(instance)
+
+            assert vsphere_check.vsphere_client_connect.call_count == 2
+            expired_session.close.assert_called_once_with()
+            assert vsphere_check.client is client
+            client.tagging.TagAssociation.list_attached_tags_on_objects.assert_called_once()
+            snapshot = topology.get_snapshot(vsphere_check.check_id)
+            assert [component['data']['name'] for component in snapshot['components']] == ['mocked_vm']
 
 
 def test_get_topology_items_vms_no_unicode(instance, topology):
@@ -1158,8 +1226,8 @@ def test_get_topology_items_vms_no_unicode(instance, topology):
     # get the client
     client = vsphere_client()
 
-    # list_attached_tags method returns empty list of tags
-    client.tagging.TagAssociation.list_attached_tags = MagicMock(return_value=[])
+    # list_attached_tags_on_objects method returns empty list of tags for every object
+    client.tagging.TagAssociation.list_attached_tags_on_objects = attached_tags([])
 
     # assign the vsphere client object to the vsphere check client object
     vsphere_check.client = client
@@ -14,7 +14,7 @@ from vmware.vapi.lib.connect import get_requests_connector
 from vmware.vapi.stdlib.client.factories import StubConfigurationFactory
 
 from vmware.vapi.vsphere.client import StubFactory
-from com.vmware.cis.tagging_client import TagModel, CategoryModel
+from com.vmware.cis.tagging_client import TagModel, CategoryModel, TagAssociation
 from six import iteritems
 
 HERE = os.path.abspath(os.path.dirname(__file__))
@@ -182,6 +182,16 @@ def vsphere_client():
     return client
 
 
+def attached_tags(tag_ids):
+    """
+    Helper, mock list_attached_tags_on_objects attaching the given tag IDs to every object.
+    """
+    def list_attached_tags_on_objects(object_ids):
+        return [TagAssociation.ObjectToTags(object_id=object_id, tag_ids=tag_ids) for object_id in object_ids]
+
+    return MagicMock(side_effect=list_attached_tags_on_objects)
+
+
 class VsphereTag(TagModel):
     """
     Helper, generate a mocked TagModel from the given attributes.
@@ -17,6 +17,8 @@ import requests
 import time
 import json
 
+from requests.adapters import HTTPAdapter
+
 from stackstate_checks.utils.identifiers import Identifiers
 
 
@@ -102,6 +104,8 @@ class ZabbixCheck(AgentCheck):
         self.url = None
         self.user = None
         self.password = None
+        self.session = None
+        self.auth_tokens = {}  # key: (url, user), value: auth token of the last successful login
 
     def get_instance_key(self, instance):
         if 'url' not in instance:
@@ -130,7 +134,7 @@ class ZabbixCheck(AgentCheck):
         try:
             self.start_snapshot()
             self.check_connection(url)
-            auth = self.login(url, instance['user'], instance['password'])
+            auth = self.get_auth(url, instance['user'], instance['password'])
 
             hosts = {}  # key: host_id, value: ZabbixHost
 
@@ -301,15 +305,20 @@ class ZabbixCheck(AgentCheck):
             "output": ["severity", "objectid", "acknowledged"]
         }
         response = self.method_request(url, "problem.get", auth=auth, params=params)
-        for item in response.get('result', []):
+        items = response.get('result', [])
+
+        # for Zabbix versions <4.0 we need to get the trigger.priority and if priority doesn't exist then
+        # either trigger is disabled or doesn't exist
+        # Object id is in case of object=0 a trigger.
+        trigger_ids = list(set(item.get("objectid") for item in items if item.get("objectid")))
+        priorities = self.get_trigger_priorities(url, auth, trigger_ids) if trigger_ids else {}
+
+        for item in items:
             event_id = item.get("eventid", None)
             acknowledged = item.get("acknowledged", None)
-            # Object id is in case of object=0 a trigger.
             trigger_id = item.get("objectid", None)
 
-            # for Zabbix versions <4.0 we need to get the trigger.priority and if priority doesn't exist then
-            # either trigger is disabled or doesn't exist
-            priority = self.get_trigger_priority(url, auth, trigger_id)
+            priority = priorities.get(trigger_id)
             severity = item.get("severity", priority)
 
             zabbix_problem = ZabbixProblem(event_id, acknowledged, trigger_id, severity)
@@ -322,19 +331,22 @@ class ZabbixCheck(AgentCheck):
                 # send the problem only in case trigger is enabled and will get the priority always in enabled cases.
                 yield zabbix_problem
 
-    def get_trigger_priority(self, url, auth, trigger_id):
+    def get_trigger_priorities(self, url, auth, trigger_ids):
+        """
+        Get the priorities of the given triggers in a single request
+        :return: dict of trigger_id -> priority, disabled or missing triggers are not included
+        """
         # `monitored` flag make sure we only get enabled triggers
         params = {
-            "output": ["priority"],
-            "triggerids": [trigger_id],
+            "output": ["triggerid", "priority"],
+            "triggerids": trigger_ids,
             "monitored": True
         }
         response = self.method_request(url, "trigger.get", auth=auth, params=params)
-        trigger = response.get('result')
-        # since result is a list so check if it has trigger object then get priority
-        if len(trigger) > 0:
-            return trigger[0].get("priority")
-        return None
+        return dict((trigger.get("triggerid"), trigger.get("priority")) for trigger in response.get('result', []))
+
+    def get_trigger_priority(self, url, auth, trigger_id):
+        return self.get_trigger_priorities(url, auth, [trigger_id]).get(trigger_id)
 
     def check_connection(self, url):
         """
@@ -354,6 +366,22 @@ class ZabbixCheck(AgentCheck):
                                        "collector.log log file." % url)
             raise e
 
+    def get_auth(self, url, user, password):
+        """
+        Reuse the auth token of the previous run as long as Zabbix still accepts it, otherwise log in again
+        :return: session string to use in subsequent requests
+        """
+        auth = self.auth_tokens.get((url, user))
+        if auth:
+            self.log.debug("Checking authentication.")
+            response = self.method_request(url, "user.checkAuthentication", params={"sessionid": auth})
+            if 'error' not in response:
+                return auth
+            self.log.debug("Auth token expired: %s" % response.get('error'))
+        auth = self.login(url, user, password)
+        self.auth_tokens[(url, user)] = auth
+        return auth
+
     def login(self, url, user, password):
         """
         Log in into Zabbix with provided credentials
@@ -387,7 +415,7 @@ class ZabbixCheck(AgentCheck):
 
         self.log.debug("Request to URL: %s" % url)
         self.log.debug("Request payload: %s" % payload)
-        response = requests.get(url, json=payload, verify=self.ssl_verify)
+        response = self.get_session().get(url, json=payload, verify=self.ssl_verify)
         response.raise_for_status()
         self.log.debug("Request response: %s" % response.text)
         try:
@@ -397,3 +425,14 @@ class ZabbixCheck(AgentCheck):
             raise CheckException('Encoding error: "%s" in response from url %s' % (e, response.url))
         except Exception as e:
             raise Exception('Error "%s" in response from url %s' % (str(e), response.url))
+
+    def get_session(self):
+        """
+        All requests to Zabbix go over one session that keeps the connections alive
+        """
+        if self.session is None:
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+        return self.session
@@ -512,7 +512,7 @@ class TestZabbix(unittest.TestCase):
         Mocking all the Zabbix functions that talk HTTP via requests.get, excluding the function `check_connection`
         Function check_connection is the first function that talks HTTP.
         """
-        with mock.patch('requests.get') as mock_get:
+        with mock.patch('requests.Session.get') as mock_get:
             with mock.patch('yaml.safe_load'):
                 self.check.login = lambda url, user, password: "dummyauthtoken"
                 self.check.retrieve_hosts = lambda x, y: []
@@ -605,6 +605,8 @@ class TestZabbix(unittest.TestCase):
             elif name == "trigger.get":
                 response = self._zabbix_trigger()
                 return response
+            elif name == "user.checkAuthentication":
+                return {"jsonrpc": "2.0", "result": {"sessionid": auth}, "id": 1}
             elif name == "event.get":
                 self.event_response = self._zabbix_event()
                 if not self.second_run:
@@ -652,7 +654,71 @@ class TestZabbix(unittest.TestCase):
                 self.fail("Event does not have tag '%s', got: %s." % (tag, tags))
         self.assertEqual(len(tags), 5)
 
-    @mock.patch('requests.get')
+    def test_zabbix_problems_trigger_priorities_in_one_request(self):
+        trigger_requests = []
+
+        def _mocked_method_request(url, name, auth=None, params={}, request_id=1):
+            if name == "apiinfo.version":
+                return self._apiinfo_response()
+            elif name == "host.get":
+                return self._zabbix_host_response()
+            elif name == "problem.get":
+                response = self._zabbix_problem()
+                for event_id, trigger_id in [("100", "111"), ("101", "111"), ("102", "222")]:
+                    problem = dict(response['result'][0])
+                    problem.update({"eventid": event_id, "objectid": trigger_id})
+                    response['result'].append(problem)
+                return response
+            elif name == "trigger.get":
+                trigger_requests.append(params)
+                response = self._zabbix_trigger()
+                response['result'].append({"triggerid": "111", "priority": "4"})
+                return response
+            else:
+                self.fail("TEST FAILED on making invalid request")
+
+        self.check.method_request = _mocked_method_request
+        problems = list(self.check.retrieve_problems("http://10.0.0.1/zabbix/api_jsonrpc.php", "dummyauthtoken"))
+
+        self.assertEqual(len(trigger_requests), 1)
+        self.assertEqual(sorted(trigger_requests[0]["triggerids"]), ["111", "13491", "222"])
+        # the trigger of event 102 is disabled
+        self.assertEqual([problem.event_id for problem in problems], ["14", "100", "101"])
+
+    def test_zabbix_reuse_auth_token(self):
+        logins = []
+        self.auth_valid = True
+
+        def _mocked_method_request(url, name, auth=None, params={}, request_id=1):
+            if name == "user.checkAuthentication":
+                self.assertEqual(params, {"sessionid": "authtoken%s" % len(logins)})
+                if self.auth_valid:
+                    return {"jsonrpc": "2.0", "result": {"sessionid": params["sessionid"]}, "id": 1}
+                return {"jsonrpc": "2.0", "error": {"code": -32602, "message": "Invalid params.",
+                                                    "data": "Session terminated, re-login, please."}, "id": 1}
+            else:
+                self.fail("TEST FAILED on making invalid request")
+
+        def _mocked_login(url, user, password):
+            logins.append(user)
+            return "authtoken%s" % len(logins)
+
+        self.check.method_request = _mocked_method_request
+        self.check.login = _mocked_login
+        url = "http://10.0.0.1/zabbix/api_jsonrpc.php"
+
+        self.assertEqual(self.check.get_auth(url, "admin", "zabbix"), "authtoken1")
+        self.assertEqual(self.check.get_auth(url, "admin", "zabbix"), "authtoken1")
+        self.assertEqual(len(logins), 1)
+        self.auth_valid = False
+        self.assertEqual(self.check.get_auth(url, "admin", "zabbix"), "authtoken2")
+        self.assertEqual(len(logins), 2)
+        # another user on the same Zabbix server does not reuse the token of admin
+        self.auth_valid = True
+        self.assertEqual(self.check.get_auth(url, "guest", "guest"), "authtoken3")
+        self.assertEqual(logins, ["admin", "admin", "guest"])
+
+    @mock.patch('requests.Session.get')
     def test_method_request(self, mocked_get):
         event_resp = {
             "jsonrpc": "2.0",